@@ -0,0 +1,115 @@
+"""Query plans and timings of the `crud.py` reads, without and with the
+`user_inputs` indexes.
+
+Run with `python -m benchmarks.bench_indexes --rows 200000`, optionally
+against PostgreSQL with `--url postgresql://...` (the table is dropped
+and re-created there, and only dropped with `--drop-existing` if it holds
+rows).
+"""
+import argparse
+import os
+import tempfile
+from typing import Callable, Dict
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Query, Session
+
+from chatbot_api.models import CustomerInputs
+from chatbot_api.schemas import SupportedLanguages
+
+from .common import check_droppable, seed_user_inputs, time_call
+
+PAGE_SIZE = 100
+
+
+def _query_patterns(db: Session) -> Dict[str, Callable[[], Query]]:
+    # Same filters and ordering as the `crud.py` read functions.
+    ordered = db.query(CustomerInputs) \
+                .filter(CustomerInputs.consent.is_(True)) \
+                .order_by(CustomerInputs.id.desc())
+    return {
+        "all": lambda: ordered.limit(PAGE_SIZE),
+        "by_customer_id": lambda: ordered
+            .filter(CustomerInputs.customer_id == 7)
+            .limit(PAGE_SIZE),
+        "by_language": lambda: ordered
+            .filter(CustomerInputs.language == SupportedLanguages.german)
+            .limit(PAGE_SIZE),
+        "by_customer_id_and_language": lambda: ordered
+            .filter(CustomerInputs.customer_id == 7)
+            .filter(CustomerInputs.language == SupportedLanguages.german)
+            .limit(PAGE_SIZE),
+        "by_dialogue_id": lambda: db.query(CustomerInputs).filter(
+            CustomerInputs.dialogue_id == 4242,
+        ),
+    }
+
+
+def _explain(engine: Engine, query: Query) -> str:
+    statement = str(
+        query.statement.compile(
+            engine,
+            compile_kwargs={"literal_binds": True},
+        )
+    )
+    if engine.dialect.name == "postgresql":
+        prefix = "EXPLAIN (ANALYZE, BUFFERS)"
+    else:
+        prefix = "EXPLAIN QUERY PLAN"
+
+    with engine.connect() as connection:
+        rows = connection.execute(text(f"{prefix} {statement}")).fetchall()
+    return "\n".join(f"    {row[-1]}" for row in rows)
+
+
+def _run(engine: Engine, label: str) -> None:
+    print(f"=== {label}")
+    with Session(engine) as db:
+        for name, build_query in _query_patterns(db).items():
+            timings = time_call(lambda: build_query().all())
+            print(f"{name}: {timings['median_ms']:.2f} ms (median)")
+            print(_explain(engine, build_query()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--url", default=None)
+    parser.add_argument(
+        "--drop-existing",
+        action="store_true",
+        help="drop the user_inputs table of --url even if it holds rows",
+    )
+    args = parser.parse_args()
+    if args.url is not None and not args.drop_existing:
+        check_droppable(parser, args.url)
+
+    url = args.url
+    if url is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench_indexes.db")
+        url = f"sqlite:///{path}"
+
+    engine = create_engine(url)
+    table = CustomerInputs.__table__
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    for index in table.indexes:
+        index.drop(engine)
+
+    seed_user_inputs(engine, args.rows)
+    _run(engine, f"{args.rows} rows, without indexes")
+
+    for index in table.indexes:
+        index.create(engine)
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE user_inputs"))
+    else:
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+    _run(engine, f"{args.rows} rows, with indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Rows/sec and peak memory of the `GET /data` serialization paths.
+
+Compares the former path (ORM objects, `as_dict`, `CustomerInputResponse`
+validation and FastAPI's JSON encoding) with the column-tuple path encoded
+with `orjson`. Run with `python -m benchmarks.bench_serialization`.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Callable, Dict
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from chatbot_api.crud import read_customer_input_rows, read_customer_inputs
+from chatbot_api.models import CustomerInputs
+from chatbot_api.schemas import CustomerInputResponse
+from chatbot_api.serialization import customer_input_response_json
+
+from .common import peak_memory_mb, seed_user_inputs
+
+
+def orm_path(db: Session) -> bytes:
+    results = [res.as_dict() for res in read_customer_inputs(db)]
+    response = CustomerInputResponse.parse_obj(
+        {"results_number": len(results), "results": results}
+    )
+    return json.dumps(jsonable_encoder(response)).encode()
+
+
+def rows_path(db: Session) -> bytes:
+    return customer_input_response_json(read_customer_input_rows(db))
+
+
+def measure(db: Session, path: Callable[[Session], bytes]) -> Dict:
+    db.expunge_all()
+    start = time.perf_counter()
+    body = path(db)
+    elapsed = time.perf_counter() - start
+
+    db.expunge_all()
+    peak = peak_memory_mb(lambda: path(db))
+
+    rows = json.loads(body)["results_number"]
+    return {
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed,
+        "peak_memory_mb": peak,
+        "body_bytes": len(body),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_serialization.db")
+    engine = create_engine(f"sqlite:///{path}")
+    CustomerInputs.__table__.create(engine)
+    seed_user_inputs(engine, args.rows, consent_ratio=1.0)
+
+    with Session(engine) as db:
+        for name, path_fn in [("orm", orm_path), ("rows", rows_path)]:
+            result = measure(db, path_fn)
+            print(
+                f"{name}: {result['rows_per_second']:,.0f} rows/s, "
+                f"peak {result['peak_memory_mb']:.1f} MiB, "
+                f"{result['seconds'] * 1000:.0f} ms for {result['rows']} rows"
+            )
+
+
+if __name__ == "__main__":
+    main()
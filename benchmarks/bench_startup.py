@@ -0,0 +1,63 @@
+"""Import time and cold start of the app.
+
+Each import is measured in a fresh interpreter, as a worker process pays
+it at every (re)start. The schema setup done at startup is measured on a
+temporary SQLite database, both empty (first deploy, every migration
+applied) and up to date (any later restart, a single revision lookup).
+Run with `python -m benchmarks.bench_startup`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from chatbot_api.database import upgrade_schema
+
+IMPORT_CODE = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import chatbot_api.main\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def import_seconds(repeat: int) -> list:
+    return [
+        float(
+            subprocess.run(
+                [sys.executable, "-c", IMPORT_CODE],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+        )
+        for _ in range(repeat)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    seconds = import_seconds(args.repeat)
+    print(
+        f"import chatbot_api.main: median {statistics.median(seconds) * 1000:.0f} ms, "
+        f"max {max(seconds) * 1000:.0f} ms over {args.repeat} runs"
+    )
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_startup.db")
+    engine = create_engine(f"sqlite:///{path}")
+    for label in ["empty database", "up-to-date database"]:
+        start = time.perf_counter()
+        upgrade_schema(engine)
+        print(f"schema setup, {label}: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
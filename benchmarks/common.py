@@ -0,0 +1,98 @@
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, func, insert, inspect, select
+from sqlalchemy.engine import Engine
+
+from chatbot_api.models import CustomerInputs
+from chatbot_api.schemas import SupportedLanguages
+
+LANGUAGES = [language.value for language in SupportedLanguages]
+WORDS = "foo bar baz qux quux corge grault garply waldo fred plugh".split()
+
+
+def synthetic_records(
+        rows: int,
+        customers: int = 1000,
+        consent_ratio: float = 0.8,
+        seed: int = 42,
+) -> List[Dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "customer_id": rng.randrange(customers),
+            # A dialogue belongs to a single customer and holds ~10 inputs.
+            "dialogue_id": index // 10,
+            "language": rng.choice(LANGUAGES),
+            "text": " ".join(rng.choices(WORDS, k=rng.randint(3, 20))),
+            "consent": rng.random() < consent_ratio,
+        }
+        for index in range(rows)
+    ]
+
+
+def seed_user_inputs(
+        engine: Engine,
+        rows: int,
+        chunk_size: int = 10000,
+        **kwargs,
+) -> None:
+    records = synthetic_records(rows, **kwargs)
+    with engine.begin() as connection:
+        for start in range(0, rows, chunk_size):
+            connection.execute(
+                insert(CustomerInputs.__table__),
+                records[start:start + chunk_size],
+            )
+
+
+def stored_rows(url: str) -> int:
+    engine = create_engine(url)
+    try:
+        if not inspect(engine).has_table(CustomerInputs.__tablename__):
+            return 0
+        with engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(CustomerInputs.__table__)
+            ).scalar()
+    finally:
+        engine.dispose()
+
+
+def check_droppable(parser: argparse.ArgumentParser, url: str) -> None:
+    # The benchmarks drop and re-create `user_inputs`.
+    stored = stored_rows(url)
+    if stored:
+        parser.error(
+            f"user_inputs of --url holds {stored} rows, which the benchmark "
+            f"drops: pass --drop-existing to do so anyway"
+        )
+
+
+def time_call(fn: Callable, repeat: int = 5) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "min_ms": timings[0] * 1000,
+    }
+
+
+def peak_memory_mb(fn: Callable) -> float:
+    # tracemalloc slows allocations down: never time a traced call.
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20
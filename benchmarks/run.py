@@ -0,0 +1,270 @@
+"""Micro-benchmark suite of the CRUD and serialization hot paths.
+
+Seeds `user_inputs` with 10k/100k/1M synthetic rows and measures the
+latency, throughput and peak memory of each operation. Results are saved
+as JSON and can be compared with a previous run to flag regressions:
+
+    python -m benchmarks.run --sizes 10000 100000 --output results.json
+    python -m benchmarks.run --baseline results.json --output new.json
+
+With `--url`, the `user_inputs` table of that database is dropped and
+created again for each size: a table holding rows is only dropped with
+`--drop-existing`.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from chatbot_api.crud import (
+    create_user_input,
+    create_user_inputs,
+    read_customer_input_rows,
+    read_customer_inputs,
+    read_customer_inputs_by_customer_id,
+    read_customer_inputs_by_customer_id_and_language,
+    read_customer_inputs_by_language,
+)
+from chatbot_api.models import CustomerInputs
+from chatbot_api.schemas import (
+    CompleteCustomerInput,
+    CustomerInputResponse,
+    SupportedLanguages,
+)
+from chatbot_api.serialization import customer_input_response_json
+
+from .common import (
+    check_droppable,
+    peak_memory_mb,
+    seed_user_inputs,
+    synthetic_records,
+    time_call,
+)
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+PAGE_SIZE = 1000
+BATCH_SIZE = 1000
+
+# An operation returns the number of rows it handled per call.
+Operation = Callable[[Session], int]
+
+
+def _new_inputs(count: int) -> List[CompleteCustomerInput]:
+    return [
+        CompleteCustomerInput(**record)
+        for record in synthetic_records(count, seed=7)
+    ]
+
+
+def _operations() -> Dict[str, Tuple[Operation, bool]]:
+    # name -> (operation, whether it scans the whole table)
+    single_input = _new_inputs(1)[0]
+    batch = _new_inputs(BATCH_SIZE)
+    german = SupportedLanguages.german
+
+    def create_one(db: Session) -> int:
+        create_user_input(db, single_input)
+        return 1
+
+    def create_batch(db: Session) -> int:
+        return create_user_inputs(db, batch)
+
+    def as_dict_all(db: Session) -> int:
+        results = [res.as_dict() for res in read_customer_inputs(db)]
+        return len(results)
+
+    def pydantic_response_all(db: Session) -> int:
+        results = [res.as_dict() for res in read_customer_inputs(db)]
+        response = CustomerInputResponse.parse_obj(
+            {"results_number": len(results), "results": results}
+        )
+        json.dumps(jsonable_encoder(response))
+        return len(results)
+
+    def orjson_response_all(db: Session) -> int:
+        rows = read_customer_input_rows(db)
+        customer_input_response_json(rows)
+        return len(rows)
+
+    return {
+        "read_customer_inputs_page": (
+            lambda db: len(read_customer_inputs(db, limit=PAGE_SIZE)),
+            False,
+        ),
+        "read_customer_inputs_by_customer_id": (
+            lambda db: len(read_customer_inputs_by_customer_id(db, 7)),
+            False,
+        ),
+        "read_customer_inputs_by_language_page": (
+            lambda db: len(
+                read_customer_inputs_by_language(db, german, limit=PAGE_SIZE)
+            ),
+            False,
+        ),
+        "read_customer_inputs_by_customer_id_and_language": (
+            lambda db: len(
+                read_customer_inputs_by_customer_id_and_language(db, 7, german)
+            ),
+            False,
+        ),
+        "read_customer_inputs_all": (
+            lambda db: len(read_customer_inputs(db)),
+            True,
+        ),
+        "read_customer_input_rows_all": (
+            lambda db: len(read_customer_input_rows(db)),
+            True,
+        ),
+        "as_dict_all": (as_dict_all, True),
+        "pydantic_response_all": (pydantic_response_all, True),
+        "orjson_response_all": (orjson_response_all, True),
+        # Writes go last so that they do not grow the table under the reads.
+        "create_user_input": (create_one, False),
+        "create_user_inputs_batch": (create_batch, False),
+    }
+
+
+def _engine(url: Optional[str], rows: int) -> Engine:
+    if url is None:
+        path = os.path.join(tempfile.mkdtemp(), f"bench_{rows}.db")
+        url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    CustomerInputs.__table__.drop(engine, checkfirst=True)
+    CustomerInputs.__table__.create(engine)
+    return engine
+
+
+def run_size(
+        rows: int,
+        url: Optional[str],
+        repeat: int,
+        full_scan_max_rows: int,
+) -> Dict[str, Dict]:
+    engine = _engine(url, rows)
+    seed_user_inputs(engine, rows)
+
+    results = {}
+    with Session(engine) as db:
+        for name, (operation, full_scan) in _operations().items():
+            if full_scan and rows > full_scan_max_rows:
+                continue
+
+            handled = []
+
+            def call():
+                db.expunge_all()
+                handled.append(operation(db))
+
+            latency = time_call(call, repeat=repeat)
+            per_call = handled[-1]
+            results[name] = {
+                **latency,
+                "rows_per_call": per_call,
+                "ops_per_second": 1000 / latency["median_ms"],
+                "rows_per_second": per_call * 1000 / latency["median_ms"],
+                "peak_memory_mb": peak_memory_mb(call),
+            }
+            print(
+                f"[{rows} rows] {name}: {latency['median_ms']:.2f} ms "
+                f"(p95 {latency['p95_ms']:.2f} ms), "
+                f"{results[name]['rows_per_second']:,.0f} rows/s, "
+                f"peak {results[name]['peak_memory_mb']:.1f} MiB",
+                file=sys.stderr,
+            )
+    engine.dispose()
+    return results
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for size, operations in current["results"].items():
+        for name, result in operations.items():
+            previous = baseline["results"].get(size, {}).get(name)
+            if previous is None:
+                continue
+            for metric in ["median_ms", "peak_memory_mb"]:
+                if previous[metric] <= 0:
+                    continue
+                change = result[metric] / previous[metric] - 1
+                if change > threshold:
+                    regressions.append(
+                        f"[{size} rows] {name} {metric}: "
+                        f"{previous[metric]:.2f} -> {result[metric]:.2f} "
+                        f"(+{change:.0%})"
+                    )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument(
+        "--drop-existing",
+        action="store_true",
+        help="drop the user_inputs table of --url even if it holds rows",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--full-scan-max-rows",
+        type=int,
+        default=100000,
+        help="skip the whole-table operations above this size",
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slow-down flagged as a regression",
+    )
+    args = parser.parse_args()
+
+    if args.url is not None and not args.drop_existing:
+        check_droppable(parser, args.url)
+
+    current = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "url": "sqlite" if args.url is None else args.url.split("://")[0],
+        },
+        "results": {
+            str(rows): run_size(
+                rows,
+                args.url,
+                args.repeat,
+                args.full_scan_max_rows,
+            )
+            for rows in args.sizes
+        },
+    }
+
+    with open(args.output, "w") as output:
+        json.dump(current, output, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(json.load(baseline_file), current, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
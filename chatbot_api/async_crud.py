@@ -0,0 +1,229 @@
+"""Async versions of the `crud.py` functions.
+
+They run the very same ORM code through `AsyncSession.run_sync`, on top of
+an async driver, so both modes share their queries and behave the same.
+"""
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud
+from .metrics import timed_query
+from .models import CustomerInputs
+from .schemas import CompleteCustomerInput, SupportedLanguages
+
+
+async def create_user_input(
+        db: AsyncSession,
+        customer_input: CompleteCustomerInput,
+) -> CustomerInputs:
+    return await db.run_sync(crud.create_user_input, customer_input)
+
+
+async def create_user_input_once(
+        db: AsyncSession,
+        customer_input: CompleteCustomerInput,
+        dedup_key: str,
+) -> bool:
+    return await db.run_sync(crud.create_user_input_once, customer_input, dedup_key)
+
+
+async def create_user_inputs(
+        db: AsyncSession,
+        customer_inputs: List[CompleteCustomerInput],
+        consent: bool = False,
+        dedup_keys: Optional[List[str]] = None,
+) -> int:
+    return await db.run_sync(
+        crud.create_user_inputs,
+        customer_inputs,
+        consent=consent,
+        dedup_keys=dedup_keys,
+    )
+
+
+async def delete_user_input_by_dialogue_id(
+        db: AsyncSession,
+        dialogue_id: int,
+) -> int:
+    return await db.run_sync(
+        crud.delete_user_input_by_dialogue_id,
+        dialogue_id,
+    )
+
+
+async def grant_consent_by_dialogue_id(
+        db: AsyncSession,
+        dialogue_id: int,
+        staged_inputs: Sequence[CompleteCustomerInput] = (),
+        staged_dedup_keys: Optional[List[str]] = None,
+) -> int:
+    return await db.run_sync(
+        crud.grant_consent_by_dialogue_id,
+        dialogue_id,
+        staged_inputs,
+        staged_dedup_keys,
+    )
+
+
+async def read_customer_inputs(
+        db: AsyncSession,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+) -> List[CustomerInputs]:
+    return await db.run_sync(
+        crud.read_customer_inputs,
+        limit=limit,
+        after_id=after_id,
+    )
+
+
+async def read_customer_inputs_by_customer_id(
+        db: AsyncSession,
+        customer_id: int,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+) -> List[CustomerInputs]:
+    return await db.run_sync(
+        crud.read_customer_inputs_by_customer_id,
+        customer_id,
+        limit=limit,
+        after_id=after_id,
+    )
+
+
+async def read_customer_inputs_by_dialogue_id(
+        db: AsyncSession,
+        dialogue_id: int,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+) -> List[CustomerInputs]:
+    return await db.run_sync(
+        crud.read_customer_inputs_by_dialogue_id,
+        dialogue_id,
+        limit=limit,
+        after_id=after_id,
+    )
+
+
+async def read_customer_inputs_by_language(
+        db: AsyncSession,
+        language: SupportedLanguages,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+) -> List[CustomerInputs]:
+    return await db.run_sync(
+        crud.read_customer_inputs_by_language,
+        language,
+        limit=limit,
+        after_id=after_id,
+    )
+
+
+async def read_customer_inputs_by_customer_id_and_language(
+        db: AsyncSession,
+        customer_id: int,
+        language: SupportedLanguages,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+) -> List[CustomerInputs]:
+    return await db.run_sync(
+        crud.read_customer_inputs_by_customer_id_and_language,
+        customer_id,
+        language,
+        limit=limit,
+        after_id=after_id,
+    )
+
+
+async def read_customer_input_rows(
+        db: AsyncSession,
+        customer_id: Optional[int] = None,
+        language: Optional[SupportedLanguages] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+) -> List[Row]:
+    return await db.run_sync(
+        crud.read_customer_input_rows,
+        customer_id=customer_id,
+        language=language,
+        limit=limit,
+        after_id=after_id,
+        since=since,
+        until=until,
+    )
+
+
+async def search_customer_input_rows(
+        db: AsyncSession,
+        query: str,
+        language: Optional[SupportedLanguages] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+) -> List[Row]:
+    return await db.run_sync(
+        crud.search_customer_input_rows,
+        query,
+        language=language,
+        limit=limit,
+        offset=offset,
+    )
+
+
+async def read_dialogue_changes(
+        db: AsyncSession,
+        since_id: int = 0,
+        limit: Optional[int] = None,
+        created_before: Optional[datetime] = None,
+) -> List[Row]:
+    return await db.run_sync(
+        crud.read_dialogue_changes,
+        since_id=since_id,
+        limit=limit,
+        created_before=created_before,
+    )
+
+
+async def read_customer_input_rows_by_dialogue_ids(
+        db: AsyncSession,
+        dialogue_ids: List[int],
+) -> List[Row]:
+    return await db.run_sync(
+        crud.read_customer_input_rows_by_dialogue_ids,
+        dialogue_ids,
+    )
+
+
+async def read_input_stats(
+        db: AsyncSession,
+        customer_id: Optional[int] = None,
+) -> Tuple[List[Row], List[Row]]:
+    return await db.run_sync(crud.read_input_stats, customer_id=customer_id)
+
+
+@timed_query
+async def stream_customer_inputs(
+        db: AsyncSession,
+        customer_id: Optional[int] = None,
+        language: Optional[SupportedLanguages] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = 1000,
+) -> AsyncIterator[Row]:
+    statement = crud.select_customer_input_rows(
+        customer_id=customer_id,
+        language=language,
+        limit=limit,
+        after_id=after_id,
+        since=since,
+        until=until,
+    ).execution_options(max_row_buffer=batch_size)
+    result = await db.stream(statement)
+    async for row in result.yield_per(batch_size):
+        yield row
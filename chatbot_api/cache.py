@@ -0,0 +1,211 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from .config import settings
+from .schemas import SupportedLanguages
+
+Scope = Tuple[Optional[int], Optional[SupportedLanguages]]
+
+
+@dataclass
+class _Entry:
+    generation: Tuple[int, int]
+    expires_at: float
+    value: bytes
+    extra: Any
+
+
+@dataclass
+class _Flight:
+    done: threading.Event = field(default_factory=threading.Event)
+    # Set by the leader before `done`, unless it failed with `error`.
+    value: Tuple[bytes, Any] = (b"", None)
+    error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    """LRU cache of serialized `GET /data` responses.
+
+    Entries are keyed by the request filters and stamped with the generation
+    of their `(customer_id, language)` scope: writes bump the generations of
+    the scopes they touch, which invalidates the matching entries without
+    scanning the cache. Concurrent misses on the same key are coalesced, so
+    that a single one of them queries the database.
+    """
+
+    def __init__(
+            self,
+            max_entries: int,
+            max_bytes: int,
+            ttl_seconds: float,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._size = 0
+        self._epoch = 0
+        self._generations: Dict[Scope, int] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._async_flights: Dict[Hashable, "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def invalidate(
+            self,
+            customer_id: int,
+            language: SupportedLanguages,
+    ) -> None:
+        # A write is visible to the unfiltered, per-customer, per-language
+        # and per-customer-and-language reads.
+        with self._lock:
+            for scope in [
+                (None, None),
+                (customer_id, None),
+                (None, language),
+                (customer_id, language),
+            ]:
+                self._generations[scope] = self._generations.get(scope, 0) + 1
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            self._epoch += 1
+
+    def get_or_compute(
+            self,
+            key: Hashable,
+            scope: Scope,
+            compute: Callable[[], Tuple[bytes, Any]],
+    ) -> Tuple[bytes, Any]:
+        with self._lock:
+            generation = self._generation(scope)
+            entry = self._lookup(key, generation)
+            if entry is not None:
+                return entry.value, entry.extra
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None:
+                    self._store(key, scope, generation, *flight.value)
+            flight.done.set()
+        return flight.value
+
+    async def get_or_compute_async(
+            self,
+            key: Hashable,
+            scope: Scope,
+            compute: Callable[[], Awaitable[Tuple[bytes, Any]]],
+    ) -> Tuple[bytes, Any]:
+        # The event loop serializes the coroutines, so the lock is only held
+        # against the threads of the sync routes.
+        with self._lock:
+            generation = self._generation(scope)
+            entry = self._lookup(key, generation)
+            if entry is not None:
+                return entry.value, entry.extra
+            future = self._async_flights.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_flights[key] = future
+        try:
+            value = await compute()
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved when nobody else was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            with self._lock:
+                self._store(key, scope, generation, *value)
+            return value
+        finally:
+            del self._async_flights[key]
+
+    def _generation(self, scope: Scope) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(scope, 0)
+
+    def _lookup(
+            self,
+            key: Hashable,
+            generation: Tuple[int, int],
+    ) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if (
+            entry is None
+            or entry.generation != generation
+            or entry.expires_at <= self._clock()
+        ):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def _store(
+            self,
+            key: Hashable,
+            scope: Scope,
+            generation: Tuple[int, int],
+            value: bytes,
+            extra: Any,
+    ) -> None:
+        # A write during the computation makes the value stale already.
+        if generation != self._generation(scope) or len(value) > self.max_bytes:
+            return
+        old_entry = self._entries.pop(key, None)
+        if old_entry is not None:
+            self._size -= len(old_entry.value)
+        self._entries[key] = _Entry(
+            generation=generation,
+            expires_at=self._clock() + self.ttl_seconds,
+            value=value,
+            extra=extra,
+        )
+        self._size += len(value)
+        while (
+            len(self._entries) > self.max_entries
+            or self._size > self.max_bytes
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.value)
+
+
+@lru_cache()
+def get_response_cache() -> Optional[ResponseCache]:
+    if settings.RESPONSE_CACHE_MAX_ENTRIES <= 0:
+        return None
+    return ResponseCache(
+        max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+        ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    )
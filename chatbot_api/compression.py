@@ -0,0 +1,275 @@
+"""Compression of the data responses, and decompression of gzip requests.
+
+Responses of the configured path prefixes are compressed when the client
+accepts it and the body is at least `min_size` bytes; streamed bodies are
+compressed chunk by chunk, each flushed so that the client can decode the
+rows received so far. Brotli, used when the client accepts it, requires
+the optional `brotli` package, and gzip is used otherwise.
+
+Bodies of at least `offload_size` bytes are (de)compressed in the
+threadpool rather than on the event loop, which would stall the other
+requests meanwhile.
+
+Request bodies sent with `Content-Encoding: gzip` are decompressed before
+they reach the routes, up to `max_request_size` bytes.
+"""
+import time
+import zlib
+from typing import Optional, Sequence
+
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import COMPRESSED_BYTES, COMPRESSION_CPU_SECONDS, UNCOMPRESSED_BYTES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Parquet pages are compressed already.
+COMPRESSIBLE_MEDIA_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "application/vnd.apache.arrow.stream",
+)
+
+
+def _quality(parameters: str) -> float:
+    name, _, value = parameters.partition("=")
+    if name.strip().lower() != "q":
+        return 1.0
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """Encoding of the response among the ones accepted by an
+    `Accept-Encoding` header, Brotli first, or None."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.partition(";")
+        if _quality(parameters) > 0:
+            accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits 31: a gzip container rather than a raw zlib stream.
+            self._gzip = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def _measured(self, data: bytes, compressed: bytes, cpu_seconds: float) -> bytes:
+        UNCOMPRESSED_BYTES.labels("response", self.encoding).inc(len(data))
+        COMPRESSED_BYTES.labels("response", self.encoding).inc(len(compressed))
+        COMPRESSION_CPU_SECONDS.labels("response", self.encoding).inc(cpu_seconds)
+        return compressed
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        # CPU time of this thread: wall time would also count the threads
+        # holding the GIL meanwhile.
+        start = time.thread_time()
+        if self.encoding == "br":
+            compressed = self._brotli.process(data)
+            compressed += self._brotli.finish() if last else self._brotli.flush()
+        else:
+            compressed = self._gzip.compress(data)
+            compressed += self._gzip.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+        return self._measured(data, compressed, time.thread_time() - start)
+
+
+class _RequestTooLarge(Exception):
+    pass
+
+
+def decompress_gzip(body: bytes, max_size: int) -> bytes:
+    start = time.thread_time()
+    decompressor = zlib.decompressobj(31)
+    # Bounded, so that a small body cannot expand into gigabytes.
+    data = decompressor.decompress(body, max_size + 1)
+    if len(data) > max_size:
+        raise _RequestTooLarge
+    if not decompressor.eof:
+        raise zlib.error("truncated gzip body")
+    UNCOMPRESSED_BYTES.labels("request", "gzip").inc(len(data))
+    COMPRESSED_BYTES.labels("request", "gzip").inc(len(body))
+    COMPRESSION_CPU_SECONDS.labels("request", "gzip").inc(time.thread_time() - start)
+    return data
+
+
+class CompressionMiddleware:
+    """A plain ASGI middleware, like `PrometheusMiddleware`: unlike
+    Starlette's `GZipMiddleware`, it also speaks Brotli, only compresses the
+    given paths and media types, and reports its CPU time and savings."""
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            paths: Sequence[str],
+            min_size: int = 1024,
+            gzip_level: int = 6,
+            brotli_quality: int = 4,
+            max_request_size: int = 64 * 1024 * 1024,
+            offload_size: int = 256 * 1024,
+    ) -> None:
+        self.app = app
+        self.paths = tuple(paths)
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.max_request_size = max_request_size
+        self.offload_size = offload_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "identity").lower()
+        if content_encoding == "gzip":
+            decompressed_receive = await self._decompressed_receive(scope, receive, send)
+            if decompressed_receive is None:
+                return
+            receive = decompressed_receive
+        elif content_encoding != "identity":
+            response = JSONResponse(
+                {"error": f"Unsupported Content-Encoding {content_encoding}!"},
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+            await response(scope, receive, send)
+            return
+
+        encoding = None
+        if scope["path"].startswith(self.paths):
+            encoding = accepted_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+        else:
+            await self.app(scope, receive, self._compressing_send(encoding, send))
+
+    async def _decompressed_receive(
+            self,
+            scope: Scope,
+            receive: Receive,
+            send: Send,
+    ) -> Optional[Receive]:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        body = b"".join(chunks)
+        try:
+            if len(body) >= self.offload_size:
+                body = await run_in_threadpool(decompress_gzip, body, self.max_request_size)
+            else:
+                body = decompress_gzip(body, self.max_request_size)
+        except _RequestTooLarge:
+            response = JSONResponse(
+                {
+                    "error": (
+                        f"A decompressed body holds at most "
+                        f"{self.max_request_size} bytes!"
+                    ),
+                },
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+            await response(scope, receive, send)
+            return None
+        except zlib.error:
+            response = JSONResponse(
+                {"error": "Invalid gzip body!"},
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
+            await response(scope, receive, send)
+            return None
+
+        # The routes see a plain body.
+        headers = MutableHeaders(scope=scope)
+        del headers["content-encoding"]
+        headers["content-length"] = str(len(body))
+        sent = False
+
+        async def decompressed_receive() -> Message:
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return decompressed_receive
+
+    def _compressing_send(self, encoding: str, send: Send) -> Send:
+        start_message: Optional[Message] = None
+        compressor: Optional[Compressor] = None
+
+        async def compressing_send(message: Message) -> None:
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                # Held until the first body chunk tells whether to compress.
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                compressor = self._compressor(start_message, encoding, body, more_body)
+            if compressor is not None:
+                if len(body) >= self.offload_size:
+                    compressed = await run_in_threadpool(
+                        compressor.compress,
+                        body,
+                        not more_body,
+                    )
+                else:
+                    compressed = compressor.compress(body, last=not more_body)
+                message = {**message, "body": compressed}
+            if start_message is not None:
+                if compressor is not None and not more_body:
+                    headers = MutableHeaders(scope=start_message)
+                    headers["Content-Length"] = str(len(message["body"]))
+                await send(start_message)
+                start_message = None
+            await send(message)
+
+        return compressing_send
+
+    def _compressor(
+            self,
+            start_message: Message,
+            encoding: str,
+            body: bytes,
+            more_body: bool,
+    ) -> Optional[Compressor]:
+        headers = MutableHeaders(scope=start_message)
+        media_type = headers.get("content-type", "").split(";")[0].strip()
+        if media_type not in COMPRESSIBLE_MEDIA_TYPES or "content-encoding" in headers:
+            return None
+        headers.add_vary_header("Accept-Encoding")
+        # Streamed bodies are compressed whatever their size.
+        if not more_body and len(body) < self.min_size:
+            return None
+        headers["Content-Encoding"] = encoding
+        if more_body:
+            del headers["content-length"]
+        return Compressor(encoding, self.gzip_level, self.brotli_quality)
@@ -1,12 +1,284 @@
-from typing import List
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
 
-from sqlalchemy import desc
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    String,
+    Table,
+    case,
+    cast,
+    delete,
+    desc,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    text,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Query, Session, aliased
+from sqlalchemy.sql import ColumnElement, FromClause, Insert, Select
 
-from .models import CustomerInputs
-from .schemas import CompleteCustomerInput, SupportedLanguages
+from .metrics import timed_query
+from .models import (
+    CustomerInputs,
+    DialogueChanges,
+    InputLengthHistogram,
+    InputStats,
+)
+from .schemas import (
+    ChangeOperation,
+    CompleteCustomerInput,
+    StatsDimension,
+    SupportedLanguages,
+)
+from .search import apply_search
 
+# Lower bounds of the buckets of the text length histogram.
+LENGTH_BUCKETS = (0, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
 
+# `(customer_id, language, created_at, text length)` of an input.
+CountedInput = Tuple[int, SupportedLanguages, datetime, int]
+
+
+def _record_changes(
+        db: Session,
+        dialogue_ids: Iterable[int],
+        operation: ChangeOperation,
+) -> None:
+    # Part of the caller's transaction, so that the change feed never
+    # misses nor invents a change, and its last statement: the feed only
+    # serves settled changes, so the time between `created_at` and the
+    # commit must stay short.
+    statement = insert(DialogueChanges.__table__)
+    if db.get_bind().dialect.name == "postgresql":
+        # The time of the insert: `now()` is the start of the transaction.
+        statement = statement.values(created_at=func.clock_timestamp())
+    db.execute(
+        statement,
+        [
+            {"dialogue_id": dialogue_id, "operation": operation}
+            for dialogue_id in dialogue_ids
+        ],
+    )
+
+
+def _utc_day(created_at: datetime) -> str:
+    # SQLite hands back naive UTC timestamps.
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date().isoformat()
+
+
+def _dialect_insert(db: Session, table: Table) -> Insert:
+    # An insert supporting `ON CONFLICT` clauses.
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"ON CONFLICT is not supported on {dialect_name}")
+
+
+def _upsert_counters(
+        db: Session,
+        table: Table,
+        index_elements: List[str],
+        rows: List[Dict],
+) -> None:
+    statement = _dialect_insert(db, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={
+            column: table.c[column] + statement.excluded[column]
+            for column in rows[0]
+            if column not in index_elements
+        },
+    )
+    db.execute(statement, rows)
+
+
+def _update_stats(
+        db: Session,
+        inputs: Iterable[CountedInput],
+        sign: int = 1,
+) -> int:
+    # Part of the caller's transaction, like `_record_changes`: the
+    # counters move along with the consented inputs.
+    counters: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+    histogram: Dict[int, int] = defaultdict(int)
+    counted = 0
+    for customer_id, language, created_at, length in inputs:
+        for key in [
+            (StatsDimension.total.value, ""),
+            (StatsDimension.language.value, language.value),
+            (StatsDimension.customer.value, str(customer_id)),
+            (StatsDimension.day.value, _utc_day(created_at)),
+        ]:
+            counters[key][0] += sign
+            counters[key][1] += sign * length
+        histogram[LENGTH_BUCKETS[bisect_right(LENGTH_BUCKETS, length) - 1]] += sign
+        counted += 1
+    if not counted:
+        return 0
+
+    # Rows are upserted in key order, so that concurrent transactions lock
+    # them in the same order and cannot deadlock.
+    _upsert_counters(
+        db,
+        InputStats.__table__,
+        ["dimension", "key"],
+        [
+            {
+                "dimension": dimension,
+                "key": key,
+                "inputs": counters[dimension, key][0],
+                "characters": counters[dimension, key][1],
+            }
+            for dimension, key in sorted(counters)
+        ],
+    )
+    _upsert_counters(
+        db,
+        InputLengthHistogram.__table__,
+        ["bucket"],
+        [
+            {"bucket": bucket, "inputs": histogram[bucket]}
+            for bucket in sorted(histogram)
+        ],
+    )
+    return counted
+
+
+def _language_key(language: ColumnElement) -> ColumnElement:
+    # Constants rather than bound parameters, so that the statement stays
+    # valid when grouped over, whatever the driver's parameter style.
+    return case(
+        {
+            literal_column(f"'{member.name}'"): literal_column(f"'{member.value}'")
+            for member in SupportedLanguages
+        },
+        value=language,
+    )
+
+
+def _day_key(db: Session, created_at: ColumnElement) -> ColumnElement:
+    if db.get_bind().dialect.name == "sqlite":
+        return func.date(created_at)
+    return func.to_char(
+        func.timezone(literal_column("'UTC'"), created_at),
+        literal_column("'YYYY-MM-DD'"),
+    )
+
+
+def _length_bucket(length: ColumnElement) -> ColumnElement:
+    return case(
+        *[
+            (length >= bucket, literal_column(str(bucket)))
+            for bucket in reversed(LENGTH_BUCKETS[1:])
+        ],
+        else_=literal_column("0"),
+    )
+
+
+def _counter_upsert(
+        db: Session,
+        table: Table,
+        index_elements: List[str],
+        counters: Select,
+) -> Insert:
+    statement = _dialect_insert(db, table).from_select(
+        [column.name for column in counters.selected_columns],
+        counters,
+    )
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={
+            column.name: table.c[column.name] + statement.excluded[column.name]
+            for column in counters.selected_columns
+            if column.name not in index_elements
+        },
+    )
+
+
+def _stats_upserts(
+        db: Session,
+        inputs: FromClause,
+        sign: int = 1,
+) -> Tuple[Insert, Insert]:
+    # Same counters as `_update_stats`, grouped in SQL over the
+    # `(customer_id, language, created_at, length)` rows of `inputs`, so
+    # that the rows never travel to Python.
+    def signed(value: ColumnElement) -> ColumnElement:
+        return value if sign > 0 else -value
+
+    counters = []
+    for dimension, key in [
+        (StatsDimension.total, literal_column("''")),
+        (StatsDimension.language, _language_key(inputs.c.language)),
+        (StatsDimension.customer, cast(inputs.c.customer_id, String)),
+        (StatsDimension.day, _day_key(db, inputs.c.created_at)),
+    ]:
+        # Grouped by a column of a subquery rather than by the expression,
+        # which would be rendered twice.
+        keyed = select(key.label("key"), inputs.c.length).subquery()
+        counters.append(
+            select(
+                literal_column(f"'{dimension.value}'").label("dimension"),
+                keyed.c.key,
+                signed(func.count()).label("inputs"),
+                signed(func.sum(keyed.c.length)).label("characters"),
+            )
+            .group_by(keyed.c.key)
+        )
+    bucketed = select(_length_bucket(inputs.c.length).label("bucket")).subquery()
+    # Rows are upserted in key order, so that concurrent transactions lock
+    # them in the same order and cannot deadlock.
+    return (
+        _counter_upsert(
+            db,
+            InputStats.__table__,
+            ["dimension", "key"],
+            union_all(*counters).order_by(
+                literal_column("dimension"),
+                literal_column("key"),
+            ),
+        ),
+        _counter_upsert(
+            db,
+            InputLengthHistogram.__table__,
+            ["bucket"],
+            select(bucketed.c.bucket, signed(func.count()).label("inputs"))
+            .group_by(bucketed.c.bucket)
+            .order_by(bucketed.c.bucket),
+        ),
+    )
+
+
+def _input_lengths(*criteria) -> Select:
+    return select(
+        CustomerInputs.customer_id,
+        CustomerInputs.language,
+        CustomerInputs.created_at,
+        func.length(CustomerInputs.text).label("length"),
+    ).filter(*criteria)
+
+
+@timed_query
 def create_user_input(
         db: Session,
         customer_input: CompleteCustomerInput,
@@ -17,63 +289,533 @@ def create_user_input(
     return new_customer_input
 
 
+@timed_query
+def create_user_input_once(
+        db: Session,
+        customer_input: CompleteCustomerInput,
+        dedup_key: str,
+) -> bool:
+    # A retried input costs a single probe of the dedup key index, and is
+    # ignored instead of failing.
+    inserted = db.execute(
+        _dialect_insert(db, CustomerInputs.__table__)
+        .values(**customer_input.dict(), dedup_key=dedup_key)
+        .on_conflict_do_nothing()
+    ).rowcount
+    db.commit()
+    return inserted == 1
+
+
+def _unseen_inputs(
+        db: Session,
+        customer_inputs: List[CompleteCustomerInput],
+        dedup_keys: List[str],
+) -> Tuple[List[CompleteCustomerInput], List[str]]:
+    # Inputs whose key is neither stored nor repeated earlier in the batch.
+    seen = set(
+        db.execute(
+            select(CustomerInputs.dedup_key)
+            .filter(CustomerInputs.dedup_key.in_(set(dedup_keys)))
+        ).scalars()
+    )
+    unseen_inputs = []
+    unseen_keys = []
+    for customer_input, dedup_key in zip(customer_inputs, dedup_keys):
+        if dedup_key not in seen:
+            seen.add(dedup_key)
+            unseen_inputs.append(customer_input)
+            unseen_keys.append(dedup_key)
+    return unseen_inputs, unseen_keys
+
+
+def _insert_user_inputs(
+        db: Session,
+        customer_inputs: List[CompleteCustomerInput],
+        consent: bool = False,
+        dedup_keys: Optional[List[str]] = None,
+) -> None:
+    # Part of the caller's transaction, which records the changes.
+    rows = [
+        {**customer_input.dict(), "consent": consent}
+        for customer_input in customer_inputs
+    ]
+    if consent:
+        # The database clock, as for `created_at`, so that the per-day
+        # counters match the days of the rows. Stored explicitly: on SQLite,
+        # each statement reads the clock again.
+        now = db.execute(select(func.now())).scalar()
+        for row in rows:
+            row["created_at"] = now
+    statement = insert(CustomerInputs.__table__)
+    if dedup_keys is not None:
+        for row, dedup_key in zip(rows, dedup_keys):
+            row["dedup_key"] = dedup_key
+        # Only a concurrent retry of the same batch can still conflict: its
+        # inputs are ignored, but counted as inserted by both.
+        statement = _dialect_insert(db, CustomerInputs.__table__) \
+            .on_conflict_do_nothing()
+    # A Core executemany in a single transaction: psycopg2 turns it into
+    # multi-row `INSERT ... VALUES` pages instead of one round trip per row.
+    db.execute(statement, rows)
+    if consent:
+        _update_stats(
+            db,
+            (
+                (
+                    customer_input.customer_id,
+                    customer_input.language,
+                    now,
+                    len(customer_input.text),
+                )
+                for customer_input in customer_inputs
+            ),
+        )
+
+
+@timed_query
+def create_user_inputs(
+        db: Session,
+        customer_inputs: List[CompleteCustomerInput],
+        consent: bool = False,
+        dedup_keys: Optional[List[str]] = None,
+) -> int:
+    if dedup_keys is not None and customer_inputs:
+        customer_inputs, dedup_keys = _unseen_inputs(db, customer_inputs, dedup_keys)
+    if not customer_inputs:
+        return 0
+    _insert_user_inputs(db, customer_inputs, consent=consent, dedup_keys=dedup_keys)
+    if consent:
+        _record_changes(
+            db,
+            sorted({customer_input.dialogue_id for customer_input in customer_inputs}),
+            ChangeOperation.upsert,
+        )
+    db.commit()
+    return len(customer_inputs)
+
+
+@timed_query
 def delete_user_input_by_dialogue_id(
         db: Session,
         dialogue_id: int,
-) -> None:
-    db.query(CustomerInputs) \
-       .filter(CustomerInputs.dialogue_id == dialogue_id) \
-       .delete()
+) -> int:
+    in_dialogue = CustomerInputs.dialogue_id == dialogue_id
+    if db.get_bind().dialect.name == "postgresql":
+        # A single statement: the counters are taken off from the rows the
+        # delete returns, as they were when it locked them.
+        deleted = delete(CustomerInputs.__table__) \
+            .where(in_dialogue) \
+            .returning(*_input_lengths().selected_columns, CustomerInputs.consent) \
+            .cte("deleted")
+        consented = select(deleted).filter(deleted.c.consent.is_(True)).subquery()
+        stats, histogram = _stats_upserts(db, consented, sign=-1)
+        count = db.execute(
+            select(func.count())
+            .select_from(deleted)
+            .add_cte(stats.cte("stats"))
+            .add_cte(histogram.cte("histogram"))
+        ).scalar()
+    else:
+        # SQLite runs one writer at a time: nothing changes between the
+        # statements of the transaction.
+        stats, histogram = _stats_upserts(
+            db,
+            _input_lengths(in_dialogue, CustomerInputs.consent.is_(True)).subquery(),
+            sign=-1,
+        )
+        if db.execute(stats).rowcount:
+            db.execute(histogram)
+        count = db.execute(
+            delete(CustomerInputs)
+            .where(in_dialogue)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    if count:
+        _record_changes(db, [dialogue_id], ChangeOperation.delete)
+    db.commit()
+    return count
+
+
+@timed_query
+def grant_consent_by_dialogue_id(
+        db: Session,
+        dialogue_id: int,
+        staged_inputs: Sequence[CompleteCustomerInput] = (),
+        staged_dedup_keys: Optional[List[str]] = None,
+) -> int:
+    """Grant the consent of the stored inputs of a dialogue, and store its
+    `staged_inputs` as consented in the same transaction, but for the ones
+    whose dedup key is stored already. Returns the number of inputs that
+    were stored already."""
+    in_dialogue = CustomerInputs.dialogue_id == dialogue_id
+    pending = CustomerInputs.consent.is_(False)
+    if db.get_bind().dialect.name == "postgresql":
+        # A single statement: only the pending inputs the update locked are
+        # counted, so that concurrent grants never count an input twice.
+        granted = update(CustomerInputs.__table__) \
+            .where(in_dialogue, pending) \
+            .values(consent=True) \
+            .returning(*_input_lengths().selected_columns) \
+            .cte("granted")
+        stats, histogram = _stats_upserts(db, granted)
+        count, granted_count = db.execute(
+            select(
+                select(func.count())
+                .select_from(CustomerInputs.__table__)
+                .where(in_dialogue)
+                .scalar_subquery(),
+                select(func.count()).select_from(granted).scalar_subquery(),
+            )
+            .add_cte(stats.cte("stats"))
+            .add_cte(histogram.cte("histogram"))
+        ).one()
+    else:
+        # SQLite runs one writer at a time: nothing changes between the
+        # statements of the transaction.
+        stats, histogram = _stats_upserts(
+            db,
+            _input_lengths(in_dialogue, pending).subquery(),
+        )
+        granted_count = db.execute(stats).rowcount
+        if granted_count:
+            db.execute(histogram)
+        count = db.execute(
+            update(CustomerInputs)
+            .where(in_dialogue)
+            .values(consent=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    staged_inputs = list(staged_inputs)
+    if staged_dedup_keys is not None and staged_inputs:
+        staged_inputs, staged_dedup_keys = _unseen_inputs(
+            db,
+            staged_inputs,
+            staged_dedup_keys,
+        )
+    if staged_inputs:
+        _insert_user_inputs(
+            db,
+            staged_inputs,
+            consent=True,
+            dedup_keys=staged_dedup_keys,
+        )
+    if granted_count or staged_inputs:
+        _record_changes(db, [dialogue_id], ChangeOperation.upsert)
+    db.commit()
+    return count
+
+
+@timed_query
+def delete_stale_pending_user_inputs(
+        db: Session,
+        created_before: datetime,
+        chunk_size: int,
+) -> int:
+    # Inputs of dialogues that never got a consent answer and received
+    # nothing since `created_before`. One bounded chunk per transaction, so
+    # that locks and WAL volume stay small. The outer DELETE checks the
+    # consent again: a row granted after the subquery's snapshot is kept.
+    recent = aliased(CustomerInputs)
+    stale_ids = select(CustomerInputs.id) \
+        .filter(CustomerInputs.consent.is_(False)) \
+        .filter(CustomerInputs.created_at < created_before) \
+        .filter(
+            ~select(recent.id)
+            .filter(recent.dialogue_id == CustomerInputs.dialogue_id)
+            .filter(recent.created_at >= created_before)
+            .exists()
+        ) \
+        .order_by(CustomerInputs.id) \
+        .limit(chunk_size)
+    deleted = db.execute(
+        delete(CustomerInputs)
+        .where(CustomerInputs.id.in_(stale_ids.scalar_subquery()))
+        .where(CustomerInputs.consent.is_(False))
+        .execution_options(synchronize_session=False)
+    ).rowcount
     db.commit()
-    return None
+    return deleted
+
+
+QueryT = TypeVar("QueryT", Query, Select)
+
+# Served by the read paths as plain column rows.
+CUSTOMER_INPUT_COLUMNS = (
+    CustomerInputs.id,
+    CustomerInputs.customer_id,
+    CustomerInputs.dialogue_id,
+    CustomerInputs.language,
+    CustomerInputs.text,
+)
 
 
-def read_customer_inputs(db: Session) -> List[CustomerInputs]:
-    results = db.query(CustomerInputs).order_by(desc(CustomerInputs.id)).all()
+def _paginate(
+        query: QueryT,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+) -> QueryT:
+    # Keyset pagination: results are ordered by `id DESC`, so the next
+    # page holds the rows with an id strictly lower than the last one seen.
+    if after_id is not None:
+        query = query.filter(CustomerInputs.id < after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+@timed_query
+def read_customer_inputs(
+        db: Session,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+) -> List[CustomerInputs]:
+    query = db.query(CustomerInputs) \
+              .filter(CustomerInputs.consent.is_(True)) \
+              .order_by(desc(CustomerInputs.id))
+    results = _paginate(query, limit, after_id).all()
     return results
 
 
+@timed_query
 def read_customer_inputs_by_customer_id(
         db: Session,
         customer_id: int,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
 ) -> List[CustomerInputs]:
-    results = db.query(CustomerInputs) \
-                .filter(CustomerInputs.customer_id == customer_id) \
-                .order_by(desc(CustomerInputs.id)) \
-                .all()
+    query = db.query(CustomerInputs) \
+              .filter(CustomerInputs.consent.is_(True)) \
+              .filter(CustomerInputs.customer_id == customer_id) \
+              .order_by(desc(CustomerInputs.id))
+    results = _paginate(query, limit, after_id).all()
     return results
 
 
+@timed_query
 def read_customer_inputs_by_dialogue_id(
         db: Session,
         dialogue_id: int,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
 ) -> List[CustomerInputs]:
-    results = db.query(CustomerInputs) \
-                .filter(CustomerInputs.dialogue_id == dialogue_id) \
-                .order_by(desc(CustomerInputs.id)) \
-                .all()
+    query = db.query(CustomerInputs) \
+              .filter(CustomerInputs.dialogue_id == dialogue_id) \
+              .order_by(desc(CustomerInputs.id))
+    results = _paginate(query, limit, after_id).all()
     return results
 
 
+@timed_query
 def read_customer_inputs_by_language(
         db: Session,
         language: SupportedLanguages,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
 ) -> List[CustomerInputs]:
-    results = db.query(CustomerInputs) \
-                .filter(CustomerInputs.language == language) \
-                .order_by(desc(CustomerInputs.id)) \
-                .all()
+    query = db.query(CustomerInputs) \
+              .filter(CustomerInputs.consent.is_(True)) \
+              .filter(CustomerInputs.language == language) \
+              .order_by(desc(CustomerInputs.id))
+    results = _paginate(query, limit, after_id).all()
     return results
 
 
+@timed_query
 def read_customer_inputs_by_customer_id_and_language(
         db: Session,
         customer_id: int,
         language: SupportedLanguages,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
 ) -> List[CustomerInputs]:
-    results = db.query(CustomerInputs) \
-                .filter(CustomerInputs.customer_id == customer_id) \
-                .filter(CustomerInputs.language == language) \
-                .order_by(desc(CustomerInputs.id)) \
-                .all()
+    query = db.query(CustomerInputs) \
+              .filter(CustomerInputs.consent.is_(True)) \
+              .filter(CustomerInputs.customer_id == customer_id) \
+              .filter(CustomerInputs.language == language) \
+              .order_by(desc(CustomerInputs.id))
+    results = _paginate(query, limit, after_id).all()
     return results
+
+
+def select_customer_input_rows(
+        customer_id: Optional[int] = None,
+        language: Optional[SupportedLanguages] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+) -> Select:
+    # Plain column rows: no ORM objects nor identity map bookkeeping.
+    statement = select(*CUSTOMER_INPUT_COLUMNS) \
+        .filter(CustomerInputs.consent.is_(True))
+    if customer_id is not None:
+        statement = statement.filter(CustomerInputs.customer_id == customer_id)
+    if language is not None:
+        statement = statement.filter(CustomerInputs.language == language)
+    # A half-open range, so that consecutive windows do not overlap. On a
+    # partitioned table, only the partitions of the range are scanned.
+    if since is not None:
+        statement = statement.filter(CustomerInputs.created_at >= since)
+    if until is not None:
+        statement = statement.filter(CustomerInputs.created_at < until)
+    statement = statement.order_by(desc(CustomerInputs.id))
+    return _paginate(statement, limit, after_id)
+
+
+@timed_query
+def read_customer_input_rows(
+        db: Session,
+        customer_id: Optional[int] = None,
+        language: Optional[SupportedLanguages] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+) -> List[Row]:
+    statement = select_customer_input_rows(
+        customer_id=customer_id,
+        language=language,
+        limit=limit,
+        after_id=after_id,
+        since=since,
+        until=until,
+    )
+    return db.execute(statement).all()
+
+
+@timed_query
+def search_customer_input_rows(
+        db: Session,
+        query: str,
+        language: Optional[SupportedLanguages] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+) -> List[Row]:
+    statement = apply_search(
+        select(*CUSTOMER_INPUT_COLUMNS).filter(CustomerInputs.consent.is_(True)),
+        db.get_bind().dialect.name,
+        query,
+        language,
+    )
+    return db.execute(statement.limit(limit).offset(offset)).all()
+
+
+@timed_query
+def read_dialogue_changes(
+        db: Session,
+        since_id: int = 0,
+        limit: Optional[int] = None,
+        created_before: Optional[datetime] = None,
+) -> List[Row]:
+    statement = select(
+        DialogueChanges.id,
+        DialogueChanges.dialogue_id,
+        DialogueChanges.operation,
+    ).filter(DialogueChanges.id > since_id)
+    # Ids are handed out before commit, so a change may become visible
+    # after a later one: only serve the changes old enough to be settled.
+    if created_before is not None:
+        statement = statement.filter(DialogueChanges.created_at < created_before)
+    statement = statement.order_by(DialogueChanges.id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return db.execute(statement).all()
+
+
+@timed_query
+def read_customer_input_rows_by_dialogue_ids(
+        db: Session,
+        dialogue_ids: List[int],
+) -> List[Row]:
+    if not dialogue_ids:
+        return []
+    statement = select(*CUSTOMER_INPUT_COLUMNS) \
+        .filter(CustomerInputs.consent.is_(True)) \
+        .filter(CustomerInputs.dialogue_id.in_(dialogue_ids)) \
+        .order_by(CustomerInputs.id)
+    return db.execute(statement).all()
+
+
+@timed_query
+def read_input_stats(
+        db: Session,
+        customer_id: Optional[int] = None,
+) -> Tuple[List[Row], List[Row]]:
+    # A handful of counter rows, whatever the number of inputs.
+    dimensions = InputStats.dimension.in_(
+        [
+            StatsDimension.total.value,
+            StatsDimension.language.value,
+            StatsDimension.day.value,
+        ]
+    )
+    if customer_id is not None:
+        dimensions = or_(
+            dimensions,
+            (InputStats.dimension == StatsDimension.customer.value)
+            & (InputStats.key == str(customer_id)),
+        )
+    counters = db.execute(
+        select(
+            InputStats.dimension,
+            InputStats.key,
+            InputStats.inputs,
+            InputStats.characters,
+        ).filter(dimensions)
+    ).all()
+    histogram = db.execute(
+        select(InputLengthHistogram.bucket, InputLengthHistogram.inputs)
+        .order_by(InputLengthHistogram.bucket)
+    ).all()
+    return counters, histogram
+
+
+@timed_query
+def rebuild_input_stats(db: Session) -> int:
+    """Recount the stats tables from the consented inputs, to fix a drift."""
+    if db.get_bind().dialect.name == "postgresql":
+        # Consent calls wait for the rebuild, instead of updating counters
+        # that are being recounted.
+        db.execute(
+            text(
+                f"LOCK TABLE {InputStats.__tablename__}, "
+                f"{InputLengthHistogram.__tablename__} IN EXCLUSIVE MODE"
+            )
+        )
+    db.execute(delete(InputStats))
+    db.execute(delete(InputLengthHistogram))
+    for statement in _stats_upserts(
+            db,
+            _input_lengths(CustomerInputs.consent.is_(True)).subquery(),
+    ):
+        db.execute(statement)
+    counted = db.execute(
+        select(InputStats.inputs)
+        .filter(InputStats.dimension == StatsDimension.total.value)
+    ).scalar()
+    db.commit()
+    return counted or 0
+
+
+@timed_query
+def stream_customer_inputs(
+        db: Session,
+        customer_id: Optional[int] = None,
+        language: Optional[SupportedLanguages] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = 1000,
+) -> Iterator[Row]:
+    # Rows are fetched `batch_size` at a time from a server-side cursor,
+    # so memory stays flat regardless of the size of the table.
+    statement = select_customer_input_rows(
+        customer_id=customer_id,
+        language=language,
+        limit=limit,
+        after_id=after_id,
+        since=since,
+        until=until,
+    ).execution_options(stream_results=True, max_row_buffer=batch_size)
+    yield from db.execute(statement).yield_per(batch_size)
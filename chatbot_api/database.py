@@ -1,8 +1,28 @@
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import Depends, Header
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 
 from .config import settings
+from .metrics import READ_SESSIONS
+
+logger = logging.getLogger(__name__)
 
 SQLALCHEMY_DATABASE_URL = (
     f"postgresql://{settings.POSTGRES_USER}"
@@ -12,18 +32,336 @@ SQLALCHEMY_DATABASE_URL = (
     f"/{settings.POSTGRES_DB}"
 )
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
+
+def _async_url(url: str) -> str:
+    return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+ASYNC_SQLALCHEMY_DATABASE_URL = _async_url(SQLALCHEMY_DATABASE_URL)
+
+
+class MonitoredQueuePool(QueuePool):
+    """`QueuePool` keeping track of how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            wait_time = time.perf_counter() - start
+            with self._stats_lock:
+                self.wait_count += 1
+                self.wait_time_total += wait_time
+                self.wait_time_max = max(self.wait_time_max, wait_time)
+
+
+class MonitoredAsyncQueuePool(MonitoredQueuePool, AsyncAdaptedQueuePool):
+    """The same, for the async engine: `AsyncAdaptedQueuePool` only swaps
+    the queue for one that awaits instead of blocking."""
+
+
+def _pool_options() -> Dict:
+    return {
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+    }
+
+
+def _connect_args(is_async: bool = False) -> Dict:
+    if settings.DATABASE_STATEMENT_TIMEOUT_MS is None:
+        return {}
+    timeout = str(settings.DATABASE_STATEMENT_TIMEOUT_MS)
+    if is_async:
+        return {"server_settings": {"statement_timeout": timeout}}
+    return {"options": f"-c statement_timeout={timeout}"}
+
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+# Only bound in async mode, so that asyncpg is not required otherwise.
+AsyncSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+    class_=AsyncSession,
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+
+
+def get_engine() -> Engine:
+    """The engine of the app, built on first use and binding the session
+    factory, so that importing the app neither builds it nor connects."""
+    global _engine
+    if _engine is None:
+        pool_options = {"poolclass": MonitoredQueuePool, **_pool_options()}
+        if settings.DATABASE_ASYNC:
+            # The routes use the async engine's pool: this one only serves
+            # the startup migrations and the retention purge, one
+            # connection at a time, which `serve.py` budgets for.
+            pool_options = {"poolclass": NullPool}
+        _engine = create_engine(
+            SQLALCHEMY_DATABASE_URL,
+            connect_args=_connect_args(),
+            **pool_options,
+        )
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def get_async_engine() -> AsyncEngine:
+    """The engine of the async routes, built on first use like `get_engine`."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            ASYNC_SQLALCHEMY_DATABASE_URL,
+            poolclass=MonitoredAsyncQueuePool,
+            connect_args=_connect_args(is_async=True),
+            **_pool_options(),
+        )
+        AsyncSessionLocal.configure(bind=_async_engine)
+    return _async_engine
+
 
 Base = declarative_base()
 
 
 def get_db():
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine())
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+_replica_engine: Optional[Engine] = None
+_async_replica_engine: Optional[AsyncEngine] = None
+# Monotonic time until which reads go to the primary, after the replica
+# could not be reached.
+_replica_unavailable_until = 0.0
+
+
+def create_pooled_engine(url: str) -> Engine:
+    """An engine of another database, e.g. a replica or a shard, with the
+    pool settings of the app's one."""
+    return create_engine(
+        url,
+        poolclass=MonitoredQueuePool,
+        connect_args=_connect_args(),
+        **_pool_options(),
+    )
+
+
+def get_replica_engine() -> Optional[Engine]:
+    global _replica_engine
+    if _replica_engine is None and settings.DATABASE_REPLICA_URL is not None:
+        _replica_engine = create_pooled_engine(settings.DATABASE_REPLICA_URL)
+    return _replica_engine
+
+
+def get_async_replica_engine() -> Optional[AsyncEngine]:
+    global _async_replica_engine
+    if _async_replica_engine is None and settings.DATABASE_REPLICA_URL is not None:
+        _async_replica_engine = create_async_engine(
+            _async_url(settings.DATABASE_REPLICA_URL),
+            connect_args=_connect_args(is_async=True),
+            **_pool_options(),
+        )
+    return _async_replica_engine
+
+
+def _use_replica(replica, read_your_writes: bool) -> bool:
+    return (
+        replica is not None
+        and not read_your_writes
+        and time.monotonic() >= _replica_unavailable_until
+    )
+
+
+def _replica_unavailable(exc: Exception) -> None:
+    global _replica_unavailable_until
+    _replica_unavailable_until = (
+        time.monotonic() + settings.DATABASE_REPLICA_RETRY_SECONDS
+    )
+    logger.warning("Read replica unreachable, reading from the primary: %s", exc)
+
+
+def _replica_session(replica: Engine) -> Optional[Session]:
+    db = SessionLocal(bind=replica)
+    try:
+        # Connect now rather than on the first query, so that the request
+        # can still be served by the primary.
+        db.connection()
+    except (OperationalError, OSError) as exc:
+        db.close()
+        _replica_unavailable(exc)
+        return None
+    return db
+
+
+async def _async_replica_session(replica: AsyncEngine) -> Optional[AsyncSession]:
+    db = AsyncSession(bind=replica, expire_on_commit=False)
+    try:
+        await db.connection()
+    except (OperationalError, OSError) as exc:
+        await db.close()
+        _replica_unavailable(exc)
+        return None
+    return db
+
+
+def get_read_db(
+        primary: Session = Depends(get_db),
+        replica: Optional[Engine] = Depends(get_replica_engine),
+        x_read_your_writes: bool = Header(False),
+):
+    """Session of the read-only routes: on the read replica, if any and
+    reachable, or on the primary."""
+    db = None
+    source = "primary"
+    if _use_replica(replica, x_read_your_writes):
+        db = _replica_session(replica)
+        source = "primary_fallback" if db is None else "replica"
+    READ_SESSIONS.labels(source).inc()
+    if db is None:
+        yield primary
+        return
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(
+        primary: AsyncSession = Depends(get_async_db),
+        replica: Optional[AsyncEngine] = Depends(get_async_replica_engine),
+        x_read_your_writes: bool = Header(False),
+):
+    db = None
+    source = "primary"
+    if _use_replica(replica, x_read_your_writes):
+        db = await _async_replica_session(replica)
+        source = "primary_fallback" if db is None else "replica"
+    READ_SESSIONS.labels(source).inc()
+    if db is None:
+        yield primary
+        return
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+MIGRATIONS = Path(__file__).parent / "migrations"
+# Key of the PostgreSQL advisory lock held while migrating.
+MIGRATION_LOCK_ID = 0x63686174
+
+
+def wait_for_database(engine: Engine, timeout: float, interval: float = 1.0) -> None:
+    """Block until the database accepts connections, for at most `timeout`
+    seconds, e.g. while its container is still starting."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with engine.connect():
+                return
+        except OperationalError as exc:
+            if time.monotonic() >= deadline:
+                raise
+            logger.warning("Database not ready, retrying: %s", exc)
+            time.sleep(interval)
+
+
+def upgrade_schema(engine: Engine) -> Optional[str]:
+    """Apply the pending Alembic migrations, if any, and return the revision
+    upgraded from (None for an empty database)."""
+    # Only imported when starting up, not by every import of the app.
+    from alembic import command
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS))
+    head = ScriptDirectory.from_config(config).get_current_head()
+
+    with engine.connect() as connection:
+        # Workers starting together migrate one after the other, and the
+        # later ones find nothing left to do.
+        is_postgresql = connection.dialect.name == "postgresql"
+        if is_postgresql:
+            connection.execute(select(func.pg_advisory_lock(MIGRATION_LOCK_ID)))
+        try:
+            current = MigrationContext.configure(connection).get_current_revision()
+            if current != head:
+                logger.info("Migrating the database from %s to %s", current, head)
+                config.attributes["connection"] = connection
+                command.upgrade(config, "head")
+        finally:
+            if is_postgresql:
+                connection.execute(select(func.pg_advisory_unlock(MIGRATION_LOCK_ID)))
+    return current
+
+
+def prewarm_pool(engine: Engine, connections: int) -> int:
+    """Open `connections` connections at once and hand them back to the
+    pool, so that the first requests do not pay for connecting."""
+    opened: List[Connection] = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+    except OperationalError as exc:
+        logger.warning("Could not pre-warm the connection pool: %s", exc)
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+async def prewarm_async_pool(engine: AsyncEngine, connections: int) -> int:
+    """Same as `prewarm_pool`, for the async engine."""
+    opened: List[AsyncConnection] = []
+    try:
+        for _ in range(connections):
+            opened.append(await engine.connect())
+    except (OperationalError, OSError) as exc:
+        logger.warning("Could not pre-warm the connection pool: %s", exc)
+    finally:
+        for connection in opened:
+            await connection.close()
+    return len(opened)
+
+
+def pool_status(pool: MonitoredQueuePool) -> Dict:
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "wait_count": pool.wait_count,
+        "wait_time_total_ms": pool.wait_time_total * 1000,
+        "wait_time_max_ms": pool.wait_time_max * 1000,
+        "timeouts": pool.timeouts,
+    }
@@ -0,0 +1,170 @@
+"""Streaming bulk export of `user_inputs` rows as CSV, Arrow or Parquet.
+
+Rows come from a server-side cursor and are encoded `batch_size` at a time,
+each batch into a CSV chunk, an Arrow record batch or a Parquet row group,
+so that the server memory is bounded by one batch whatever the export size.
+Arrow and Parquet require the optional `pyarrow` package.
+"""
+import csv
+import io
+from abc import ABC, abstractmethod
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List
+
+from sqlalchemy.engine import Row
+from starlette.concurrency import run_in_threadpool
+
+from .schemas import ExportFormat
+
+COLUMNS = ["id", "customer_id", "dialogue_id", "language", "text"]
+
+MEDIA_TYPES = {
+    ExportFormat.csv: "text/csv",
+    ExportFormat.arrow: "application/vnd.apache.arrow.stream",
+    ExportFormat.parquet: "application/vnd.apache.parquet",
+}
+
+
+def _columns(rows: List[Row]) -> List[list]:
+    ids, customer_ids, dialogue_ids, languages, texts = zip(*rows)
+    return [
+        list(ids),
+        list(customer_ids),
+        list(dialogue_ids),
+        [language.value for language in languages],
+        list(texts),
+    ]
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file handing out what has been written since last drained."""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+class Encoder(ABC):
+    def begin(self) -> bytes:
+        return b""
+
+    @abstractmethod
+    def encode(self, rows: List[Row]) -> bytes:
+        ...
+
+    def end(self) -> bytes:
+        return b""
+
+
+class CsvEncoder(Encoder):
+    def __init__(self):
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text)
+
+    def _drain(self) -> bytes:
+        data = self._text.getvalue().encode()
+        self._text.seek(0)
+        self._text.truncate()
+        return data
+
+    def begin(self) -> bytes:
+        self._writer.writerow(COLUMNS)
+        return self._drain()
+
+    def encode(self, rows: List[Row]) -> bytes:
+        self._writer.writerows(
+            (row.id, row.customer_id, row.dialogue_id, row.language.value, row.text)
+            for row in rows
+        )
+        return self._drain()
+
+
+class ArrowEncoder(Encoder):
+    def __init__(self, parquet: bool = False):
+        import pyarrow
+
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema(
+            [
+                ("id", pyarrow.int64()),
+                ("customer_id", pyarrow.int64()),
+                ("dialogue_id", pyarrow.int64()),
+                ("language", pyarrow.string()),
+                ("text", pyarrow.string()),
+            ]
+        )
+        self._sink = _Sink()
+        if parquet:
+            import pyarrow.parquet
+
+            self._writer = pyarrow.parquet.ParquetWriter(self._sink, self._schema)
+        else:
+            self._writer = pyarrow.ipc.new_stream(self._sink, self._schema)
+
+    def begin(self) -> bytes:
+        return self._sink.drain()
+
+    def encode(self, rows: List[Row]) -> bytes:
+        batch = self._pyarrow.record_batch(_columns(rows), schema=self._schema)
+        self._writer.write_batch(batch)
+        return self._sink.drain()
+
+    def end(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def get_encoder(export_format: ExportFormat) -> Encoder:
+    if export_format == ExportFormat.csv:
+        return CsvEncoder()
+    return ArrowEncoder(parquet=export_format == ExportFormat.parquet)
+
+
+def export_chunks(
+        rows: Iterable[Row],
+        encoder: Encoder,
+        batch_size: int,
+) -> Iterator[bytes]:
+    yield encoder.begin()
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        yield encoder.encode(batch)
+    yield encoder.end()
+
+
+async def async_export_chunks(
+        rows: AsyncIterable[Row],
+        encoder: Encoder,
+        batch_size: int,
+) -> AsyncIterator[bytes]:
+    # Encoding a batch takes long enough to stall the event loop.
+    yield encoder.begin()
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield await run_in_threadpool(encoder.encode, batch)
+            batch = []
+    if batch:
+        yield await run_in_threadpool(encoder.encode, batch)
+    yield await run_in_threadpool(encoder.end)
@@ -1,34 +1,91 @@
-from typing import Optional, Union
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterator, List, Optional, Tuple, Union
 
-from fastapi import Depends, FastAPI, Response, status
+from fastapi import APIRouter, Depends, FastAPI, Header, Query, Response, status
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from pydantic import ValidationError
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy_utils import database_exists
+from starlette.concurrency import run_in_threadpool
 
+from . import async_crud, sharding
 from .crud import (
+    LENGTH_BUCKETS,
     create_user_input,
+    create_user_input_once,
+    create_user_inputs,
     delete_user_input_by_dialogue_id,
-    read_customer_inputs,
-    read_customer_inputs_by_customer_id,
-    read_customer_inputs_by_language,
-    read_customer_inputs_by_customer_id_and_language,
+    grant_consent_by_dialogue_id,
+    read_customer_input_rows,
+    read_customer_input_rows_by_dialogue_ids,
+    read_dialogue_changes,
+    read_input_stats,
+    search_customer_input_rows,
+    stream_customer_inputs,
 )
-from .database import Base, engine, get_db
-from .models import CustomerInputs
+from .cache import ResponseCache, get_response_cache
+from .compression import CompressionMiddleware
+from .config import settings
+from .database import (
+    get_async_db,
+    get_async_engine,
+    get_async_read_db,
+    get_db,
+    get_engine,
+    get_read_db,
+    pool_status,
+    prewarm_async_pool,
+    prewarm_pool,
+    upgrade_schema,
+    wait_for_database,
+)
+from .export import (
+    MEDIA_TYPES,
+    Encoder,
+    async_export_chunks,
+    export_chunks,
+    get_encoder,
+)
+from .metrics import (
+    CONSENTS,
+    DUPLICATE_INPUTS,
+    INGESTED_INPUTS,
+    REJECTED_INPUTS,
+    PrometheusMiddleware,
+    render_metrics,
+)
+from .profiling import QueryProfiler, QueryProfilerMiddleware
+from .retention import run_purge_periodically
 from .schemas import (
+    BatchItemError,
+    ChangeFeedResponse,
+    ChangeOperation,
     CompleteCustomerInput,
     CustomerConsent,
     CustomerConsentResponse,
     CustomerInput,
+    CustomerInputBatch,
+    CustomerInputBatchResponse,
     CustomerInputResponse,
     Error,
+    ExportFormat,
+    InputStatsResponse,
+    PoolStatus,
     SupportedLanguages,
 )
-
-# TODO: Use Redis as cache in the future instead of storing
-# in DB from the start.
-
-if database_exists(engine.url):
-    Base.metadata.create_all(bind=engine)
+from .serialization import (
+    async_ndjson_lines,
+    change_feed_json,
+    customer_input_response_json,
+    input_stats_json,
+    ndjson_lines,
+)
+from .sharding import ShardedDatabase, get_shards
+from .staging import StagingStore, get_staging
 
 description = """
 API used by data scientists to further improve an existing chatbot.
@@ -39,7 +96,6 @@ and consent via HTTP.
 
 app = FastAPI(
     title="Data API",
-    dependencies=[Depends(get_db)],
     description=description,
     license_info={
         "name": "Apache 2.0",
@@ -47,50 +103,425 @@ app = FastAPI(
     },
 )
 
+if settings.DATABASE_PROFILING or settings.DATABASE_SLOW_QUERY_MS is not None:
+    QueryProfiler(slow_query_ms=settings.DATABASE_SLOW_QUERY_MS).install()
+if settings.DATABASE_PROFILING:
+    app.add_middleware(QueryProfilerMiddleware)
+if settings.RESPONSE_COMPRESSION:
+    app.add_middleware(
+        CompressionMiddleware,
+        paths=settings.RESPONSE_COMPRESSION_PATHS,
+        min_size=settings.RESPONSE_COMPRESSION_MIN_BYTES,
+        gzip_level=settings.RESPONSE_COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY,
+        max_request_size=settings.REQUEST_DECOMPRESSED_MAX_BYTES,
+        offload_size=settings.COMPRESSION_OFFLOAD_BYTES,
+    )
+# Outermost, so that request durations include compression.
+if settings.METRICS_ENABLED:
+    app.add_middleware(PrometheusMiddleware)
+
 
-@app.post("/data/{customer_id}/{dialogue_id}", status_code=status.HTTP_200_OK)
-def get_customer_input(
+@app.on_event("startup")
+def set_up_database() -> None:
+    # At startup rather than import: the database may not be up yet, and
+    # a missing schema fails the startup instead of the first requests.
+    shards = get_shards()
+    engines = [get_engine()] if shards is None else shards.engines
+    if settings.DATABASE_MIGRATE_ON_STARTUP:
+        for engine in engines:
+            wait_for_database(engine, settings.DATABASE_STARTUP_TIMEOUT_SECONDS)
+            upgrade_schema(engine)
+
+
+@app.on_event("startup")
+async def prewarm_connection_pool() -> None:
+    # The pool of the engine serving the routes.
+    if not settings.DATABASE_POOL_PREWARM:
+        return
+    shards = get_shards()
+    if shards is not None:
+        for engine in shards.engines:
+            await run_in_threadpool(prewarm_pool, engine, settings.DATABASE_POOL_SIZE)
+    elif settings.DATABASE_ASYNC:
+        await prewarm_async_pool(get_async_engine(), settings.DATABASE_POOL_SIZE)
+    else:
+        await run_in_threadpool(prewarm_pool, get_engine(), settings.DATABASE_POOL_SIZE)
+
+
+@app.on_event("startup")
+async def start_retention_purge() -> None:
+    if settings.RETENTION_PENDING_TTL_SECONDS is not None:
+        app.state.retention_purge = asyncio.create_task(run_purge_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_retention_purge() -> None:
+    retention_purge = getattr(app.state, "retention_purge", None)
+    if retention_purge is not None:
+        retention_purge.cancel()
+
+
+@app.get("/health/pool", status_code=status.HTTP_200_OK)
+def serve_pool_status() -> PoolStatus:
+    if settings.DATABASE_ASYNC:
+        return PoolStatus(**pool_status(get_async_engine().sync_engine.pool))
+    return PoolStatus(**pool_status(get_engine().pool))
+
+
+@app.get("/metrics", include_in_schema=False)
+def serve_metrics() -> Response:
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+# The ingestion, consent and data routes exist in a sync flavour, run in
+# the threadpool on top of psycopg2, and in an async flavour, run on the
+# event loop on top of asyncpg. `DATABASE_ASYNC` selects which one is served.
+router = APIRouter(dependencies=[Depends(get_db)])
+async_router = APIRouter(dependencies=[Depends(get_async_db)])
+# With `DATABASE_SHARD_URLS`, the ingestion, consent and `GET /data` routes
+# are served from the shards instead, without staging nor response cache.
+sharded_router = APIRouter()
+
+
+def _complete_customer_input(
         customer_id: int,
         dialogue_id: int,
         customer_input: CustomerInput,
-        db: Session = Depends(get_db),
 ) -> CompleteCustomerInput:
-    full_customer_input = CompleteCustomerInput(
+    return CompleteCustomerInput(
         **customer_input.dict(),
         customer_id=customer_id,
         dialogue_id=dialogue_id,
     )
 
-    create_user_input(db, full_customer_input)
+
+def _batch_too_large_error(response: Response) -> Error:
+    response.status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    return Error(
+        error=(
+            f"A batch holds at most "
+            f"{settings.INGESTION_BATCH_SIZE_MAX} inputs!"
+        )
+    )
+
+
+def _validate_batch(
+        batch: CustomerInputBatch,
+) -> Tuple[List[CompleteCustomerInput], List[BatchItemError]]:
+    customer_inputs = []
+    errors = []
+    for index, item in enumerate(batch.inputs):
+        try:
+            customer_inputs.append(CompleteCustomerInput.parse_obj(item))
+        except ValidationError as exc:
+            errors.append(
+                BatchItemError(
+                    index=index,
+                    errors=[dict(error) for error in exc.errors()],
+                )
+            )
+    return customer_inputs, errors
+
+
+def _content_hash(customer_input: CompleteCustomerInput) -> str:
+    content = "\x1f".join(
+        [
+            str(customer_input.customer_id),
+            str(customer_input.dialogue_id),
+            customer_input.text,
+        ]
+    )
+    return f"sha256:{hashlib.sha256(content.encode()).hexdigest()}"
+
+
+def _dedup_key(
+        customer_input: CompleteCustomerInput,
+        idempotency_key: Optional[str],
+) -> Optional[str]:
+    if idempotency_key is not None:
+        return f"key:{idempotency_key}"
+    if settings.INGESTION_DEDUP_CONTENT_HASH:
+        return _content_hash(customer_input)
+    return None
+
+
+def _batch_dedup_keys(
+        customer_inputs: List[CompleteCustomerInput],
+        errors: List[BatchItemError],
+        idempotency_key: Optional[str],
+) -> Optional[List[str]]:
+    if idempotency_key is None and not settings.INGESTION_DEDUP_CONTENT_HASH:
+        return None
+    # A batch key stands for one key per item, by position in the batch.
+    rejected = {error.index for error in errors}
+    indexes = [
+        index
+        for index in range(len(customer_inputs) + len(errors))
+        if index not in rejected
+    ]
+    return [
+        _content_hash(customer_input)
+        if idempotency_key is None
+        else f"key:{idempotency_key}:{index}"
+        for index, customer_input in zip(indexes, customer_inputs)
+    ]
+
+
+def _staged_idempotency_key_error(response: Response) -> Error:
+    # Staged inputs do not keep their key: it could not be checked when
+    # they are stored.
+    response.status_code = status.HTTP_400_BAD_REQUEST
+    return Error(error="Idempotency-Key is not supported while inputs are staged!")
+
+
+def _staged_dedup_keys(
+        staged_inputs: List[CompleteCustomerInput],
+) -> Optional[List[str]]:
+    # Content hashes, unlike idempotency keys, are computed again when the
+    # staged inputs are stored.
+    if not settings.INGESTION_DEDUP_CONTENT_HASH or not staged_inputs:
+        return None
+    return [_content_hash(customer_input) for customer_input in staged_inputs]
+
+
+def _count_ingested(
+        staging: Optional[StagingStore],
+        inserted: int,
+        rejected: int = 0,
+        duplicates: int = 0,
+) -> None:
+    destination = "database" if staging is None else "staging"
+    INGESTED_INPUTS.labels(destination).inc(inserted)
+    if rejected:
+        REJECTED_INPUTS.inc(rejected)
+    if duplicates:
+        DUPLICATE_INPUTS.inc(duplicates)
+
+
+def _dialogue_not_found_error(response: Response, dialogue_id: int) -> Error:
+    CONSENTS.labels("not_found").inc()
+    response.status_code = status.HTTP_404_NOT_FOUND
+    return Error(
+        error=(
+            f"Dialogue id {dialogue_id} does not "
+            f"exist int the current session!"
+        )
+    )
+
+
+def _serialize_customer_inputs(
+        rows: List[Row],
+        limit: Optional[int],
+) -> Tuple[bytes, Optional[int]]:
+    # A full page means there may be more rows: hand out the keyset cursor.
+    next_after_id = None
+    if limit is not None and len(rows) == limit:
+        next_after_id = rows[-1].id
+    return customer_input_response_json(rows), next_after_id
+
+
+def _customer_input_response(
+        body: bytes,
+        next_after_id: Optional[int],
+) -> Response:
+    response = Response(content=body, media_type="application/json")
+    if next_after_id is not None:
+        response.headers["X-Next-After-Id"] = str(next_after_id)
+    return response
+
+
+def _export_encoder(
+        export_format: ExportFormat,
+        response: Response,
+) -> Union[Encoder, Error]:
+    try:
+        return get_encoder(export_format)
+    except ImportError:
+        response.status_code = status.HTTP_501_NOT_IMPLEMENTED
+        return Error(error=f"The {export_format.value} export requires pyarrow!")
+
+
+def _export_response(
+        chunks: Union[Iterator[bytes], AsyncIterator[bytes]],
+        export_format: ExportFormat,
+) -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": (
+                f"attachment; filename=user_inputs.{export_format.value}"
+            ),
+        },
+    )
+
+
+def _search_response(rows: List[Row], limit: int, offset: int) -> Response:
+    response = Response(
+        content=customer_input_response_json(rows),
+        media_type="application/json",
+    )
+    if len(rows) == limit:
+        response.headers["X-Next-Offset"] = str(offset + limit)
+    return response
+
+
+def _stats_response(
+        counters: List[Row],
+        histogram: List[Row],
+        customer_id: Optional[int],
+) -> Response:
+    return Response(
+        content=input_stats_json(counters, histogram, LENGTH_BUCKETS, customer_id),
+        media_type="application/json",
+    )
+
+
+def _settled_before() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(
+        seconds=settings.DATA_CHANGES_SETTLE_SECONDS,
+    )
+
+
+def _upserted_dialogue_ids(changes: List[Row]) -> List[int]:
+    return sorted(
+        {
+            change.dialogue_id
+            for change in changes
+            if change.operation == ChangeOperation.upsert
+        }
+    )
+
+
+def _invalidate_responses(
+        cache: Optional[ResponseCache],
+        stored_dialogue_changed: bool,
+        flushed_inputs: List[CompleteCustomerInput],
+) -> None:
+    # New inputs are pending, hence invisible to `GET /data`: only consent
+    # calls change what it serves.
+    if cache is None:
+        return
+    if stored_dialogue_changed:
+        # The customers and languages of a stored dialogue are not known
+        # without an extra query.
+        cache.invalidate_all()
+    for customer_input in flushed_inputs:
+        cache.invalidate(customer_input.customer_id, customer_input.language)
+
+
+@router.post("/data/{customer_id}/{dialogue_id}", status_code=status.HTTP_200_OK)
+def get_customer_input(
+        customer_id: int,
+        dialogue_id: int,
+        customer_input: CustomerInput,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        db: Session = Depends(get_db),
+        staging: Optional[StagingStore] = Depends(get_staging),
+) -> Union[CompleteCustomerInput, Error]:
+    if staging is not None and idempotency_key is not None:
+        return _staged_idempotency_key_error(response)
+
+    full_customer_input = _complete_customer_input(
+        customer_id,
+        dialogue_id,
+        customer_input,
+    )
+    dedup_key = _dedup_key(full_customer_input, idempotency_key)
+
+    # With a staging store, inputs only reach the database once the
+    # dialogue's consent is granted.
+    inserted = True
+    if staging is not None:
+        staging.add(full_customer_input)
+    elif dedup_key is None:
+        create_user_input(db, full_customer_input)
+    else:
+        inserted = create_user_input_once(db, full_customer_input, dedup_key)
+    _count_ingested(staging, int(inserted), duplicates=int(not inserted))
 
     return full_customer_input
 
 
-@app.post("/consents/{dialogue_id}", status_code=status.HTTP_200_OK)
+@router.post("/data/batch", status_code=status.HTTP_200_OK)
+def get_customer_input_batch(
+        batch: CustomerInputBatch,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        db: Session = Depends(get_db),
+        staging: Optional[StagingStore] = Depends(get_staging),
+) -> Union[CustomerInputBatchResponse, Error]:
+    if len(batch.inputs) > settings.INGESTION_BATCH_SIZE_MAX:
+        return _batch_too_large_error(response)
+    if staging is not None and idempotency_key is not None:
+        return _staged_idempotency_key_error(response)
+
+    customer_inputs, errors = _validate_batch(batch)
+
+    if staging is not None:
+        staging.add_many(customer_inputs)
+        inserted = len(customer_inputs)
+    else:
+        inserted = create_user_inputs(
+            db,
+            customer_inputs,
+            dedup_keys=_batch_dedup_keys(customer_inputs, errors, idempotency_key),
+        )
+    duplicates = len(customer_inputs) - inserted
+
+    _count_ingested(staging, inserted, len(errors), duplicates)
+
+    return CustomerInputBatchResponse(
+        inserted=inserted,
+        duplicates=duplicates,
+        errors=errors,
+    )
+
+
+@router.post("/consents/{dialogue_id}", status_code=status.HTTP_200_OK)
 def get_customer_consent(
         dialogue_id: int,
         response: Response,
         consent: CustomerConsent,
         db: Session = Depends(get_db),
+        staging: Optional[StagingStore] = Depends(get_staging),
+        cache: Optional[ResponseCache] = Depends(get_response_cache),
 ) -> Union[CustomerConsentResponse, Error]:
-    # TODO: Maybe add a boolean column `consent` to no longer retrieve
-    # already consented inputs.
-    dialogue_inputs = db.query(CustomerInputs) \
-                        .filter(CustomerInputs.dialogue_id == dialogue_id) \
-                        .all()
-    if len(dialogue_inputs) == 0:
-        response.status_code = status.HTTP_404_NOT_FOUND
-        return Error(
-            error=(
-                f"Dialogue id {dialogue_id} does not "
-                f"exist int the current session!"
-            )
+    # Staged inputs are stored in the transaction of the grant, and only
+    # unstaged once it committed: a failed call can be retried.
+    staged_inputs = []
+    if consent.consent and staging is not None:
+        staged_inputs = staging.peek(dialogue_id)
+
+    # A fixed number of statements per call, whatever the length of the dialogue.
+    if consent.consent:
+        changed = grant_consent_by_dialogue_id(
+            db,
+            dialogue_id,
+            staged_inputs,
+            _staged_dedup_keys(staged_inputs),
         )
+    else:
+        changed = delete_user_input_by_dialogue_id(db, dialogue_id)
+    discarded = 0
+    if staging is not None and consent.consent:
+        staging.remove(dialogue_id, len(staged_inputs))
+    elif staging is not None:
+        discarded = staging.discard(dialogue_id)
+    if changed == 0 and len(staged_inputs) == 0 and discarded == 0:
+        return _dialogue_not_found_error(response, dialogue_id)
 
     if consent.consent:
         response.status_code = status.HTTP_201_CREATED
-    else:
-        delete_user_input_by_dialogue_id(db, dialogue_id)
+
+    CONSENTS.labels("granted" if consent.consent else "revoked").inc()
+    _invalidate_responses(
+        cache,
+        changed > 0,
+        staged_inputs if consent.consent else [],
+    )
 
     return CustomerConsentResponse(
         consent=consent.consent,
@@ -98,35 +529,567 @@ def get_customer_consent(
     )
 
 
-@app.get("/data", status_code=status.HTTP_200_OK)
+@router.get(
+    "/data",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"model": CustomerInputResponse}},
+)
 def serve_customer_inputs(
         language: Optional[SupportedLanguages] = None,
         customer_id: Optional[int] = None,
+        limit: Optional[int] = Query(
+            None,
+            ge=1,
+            le=settings.DATA_PAGE_SIZE_MAX,
+        ),
+        after_id: Optional[int] = Query(None, ge=1),
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        stream: bool = False,
+        db: Session = Depends(get_read_db),
+        cache: Optional[ResponseCache] = Depends(get_response_cache),
+        x_read_your_writes: bool = Header(False),
+) -> Response:
+    if stream:
+        rows = stream_customer_inputs(
+            db,
+            customer_id=customer_id,
+            language=language,
+            limit=limit,
+            after_id=after_id,
+            since=since,
+            until=until,
+            batch_size=settings.DATA_STREAM_BATCH_SIZE,
+        )
+        return StreamingResponse(
+            ndjson_lines(rows),
+            media_type="application/x-ndjson",
+        )
+
+    def read() -> Tuple[bytes, Optional[int]]:
+        rows = read_customer_input_rows(
+            db,
+            customer_id=customer_id,
+            language=language,
+            limit=limit,
+            after_id=after_id,
+            since=since,
+            until=until,
+        )
+        return _serialize_customer_inputs(rows, limit)
+
+    # Cached bodies may come from the lagging replica.
+    if cache is None or x_read_your_writes:
+        body, next_after_id = read()
+    else:
+        body, next_after_id = cache.get_or_compute(
+            (customer_id, language, limit, after_id, since, until),
+            (customer_id, language),
+            read,
+        )
+
+    return _customer_input_response(body, next_after_id)
+
+
+@router.get(
+    "/data/search",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"model": CustomerInputResponse}},
+)
+def search_customer_inputs(
+        q: str = Query(..., min_length=1),
+        language: Optional[SupportedLanguages] = None,
+        limit: int = Query(
+            settings.DATA_SEARCH_PAGE_SIZE,
+            ge=1,
+            le=settings.DATA_PAGE_SIZE_MAX,
+        ),
+        offset: int = Query(0, ge=0),
+        db: Session = Depends(get_read_db),
+) -> Response:
+    rows = search_customer_input_rows(
+        db,
+        q,
+        language=language,
+        limit=limit,
+        offset=offset,
+    )
+    return _search_response(rows, limit, offset)
+
+
+@router.get(
+    "/data/stats",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"model": InputStatsResponse}},
+)
+def serve_customer_input_stats(
+        customer_id: Optional[int] = None,
+        db: Session = Depends(get_read_db),
+) -> Response:
+    counters, histogram = read_input_stats(db, customer_id=customer_id)
+    return _stats_response(counters, histogram, customer_id)
+
+
+@router.get(
+    "/data/changes",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"model": ChangeFeedResponse}},
+)
+def serve_customer_input_changes(
+        since_id: int = Query(0, ge=0),
+        limit: int = Query(
+            settings.DATA_CHANGES_PAGE_SIZE,
+            ge=1,
+            le=settings.DATA_PAGE_SIZE_MAX,
+        ),
         db: Session = Depends(get_db),
-) -> CustomerInputResponse:
-    if language is not None and customer_id is not None:
-        results = read_customer_inputs_by_customer_id_and_language(
+) -> Response:
+    # On the primary: a replica lagging by more than the settling delay
+    # would make the feed skip changes.
+    changes = read_dialogue_changes(
+        db,
+        since_id=since_id,
+        limit=limit,
+        created_before=_settled_before(),
+    )
+    input_rows = read_customer_input_rows_by_dialogue_ids(
+        db,
+        _upserted_dialogue_ids(changes),
+    )
+    return Response(
+        content=change_feed_json(changes, input_rows, since_id),
+        media_type="application/json",
+    )
+
+
+@router.get(
+    "/data/export",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_501_NOT_IMPLEMENTED: {"model": Error}},
+)
+def export_customer_inputs(
+        response: Response,
+        export_format: ExportFormat = Query(ExportFormat.csv, alias="format"),
+        language: Optional[SupportedLanguages] = None,
+        customer_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        db: Session = Depends(get_read_db),
+) -> Union[StreamingResponse, Error]:
+    encoder = _export_encoder(export_format, response)
+    if isinstance(encoder, Error):
+        return encoder
+
+    rows = stream_customer_inputs(
+        db,
+        customer_id=customer_id,
+        language=language,
+        since=since,
+        until=until,
+        batch_size=settings.DATA_STREAM_BATCH_SIZE,
+    )
+    chunks = export_chunks(rows, encoder, settings.DATA_EXPORT_BATCH_SIZE)
+    return _export_response(chunks, export_format)
+
+
+@async_router.post(
+    "/data/{customer_id}/{dialogue_id}",
+    status_code=status.HTTP_200_OK,
+)
+async def async_get_customer_input(
+        customer_id: int,
+        dialogue_id: int,
+        customer_input: CustomerInput,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        db: AsyncSession = Depends(get_async_db),
+        staging: Optional[StagingStore] = Depends(get_staging),
+) -> Union[CompleteCustomerInput, Error]:
+    if staging is not None and idempotency_key is not None:
+        return _staged_idempotency_key_error(response)
+
+    full_customer_input = _complete_customer_input(
+        customer_id,
+        dialogue_id,
+        customer_input,
+    )
+    dedup_key = _dedup_key(full_customer_input, idempotency_key)
+
+    # Staging backends are blocking clients: keep them off the event loop.
+    inserted = True
+    if staging is not None:
+        await run_in_threadpool(staging.add, full_customer_input)
+    elif dedup_key is None:
+        await async_crud.create_user_input(db, full_customer_input)
+    else:
+        inserted = await async_crud.create_user_input_once(
+            db,
+            full_customer_input,
+            dedup_key,
+        )
+    _count_ingested(staging, int(inserted), duplicates=int(not inserted))
+
+    return full_customer_input
+
+
+@async_router.post("/data/batch", status_code=status.HTTP_200_OK)
+async def async_get_customer_input_batch(
+        batch: CustomerInputBatch,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        db: AsyncSession = Depends(get_async_db),
+        staging: Optional[StagingStore] = Depends(get_staging),
+) -> Union[CustomerInputBatchResponse, Error]:
+    if len(batch.inputs) > settings.INGESTION_BATCH_SIZE_MAX:
+        return _batch_too_large_error(response)
+    if staging is not None and idempotency_key is not None:
+        return _staged_idempotency_key_error(response)
+
+    customer_inputs, errors = _validate_batch(batch)
+
+    if staging is not None:
+        await run_in_threadpool(staging.add_many, customer_inputs)
+        inserted = len(customer_inputs)
+    else:
+        inserted = await async_crud.create_user_inputs(
+            db,
+            customer_inputs,
+            dedup_keys=_batch_dedup_keys(customer_inputs, errors, idempotency_key),
+        )
+    duplicates = len(customer_inputs) - inserted
+
+    _count_ingested(staging, inserted, len(errors), duplicates)
+
+    return CustomerInputBatchResponse(
+        inserted=inserted,
+        duplicates=duplicates,
+        errors=errors,
+    )
+
+
+@async_router.post("/consents/{dialogue_id}", status_code=status.HTTP_200_OK)
+async def async_get_customer_consent(
+        dialogue_id: int,
+        response: Response,
+        consent: CustomerConsent,
+        db: AsyncSession = Depends(get_async_db),
+        staging: Optional[StagingStore] = Depends(get_staging),
+        cache: Optional[ResponseCache] = Depends(get_response_cache),
+) -> Union[CustomerConsentResponse, Error]:
+    staged_inputs = []
+    if consent.consent and staging is not None:
+        staged_inputs = await run_in_threadpool(staging.peek, dialogue_id)
+
+    if consent.consent:
+        changed = await async_crud.grant_consent_by_dialogue_id(
             db,
-            customer_id,
-            language,
+            dialogue_id,
+            staged_inputs,
+            _staged_dedup_keys(staged_inputs),
         )
-    elif language is not None:
-        results = read_customer_inputs_by_language(
+    else:
+        changed = await async_crud.delete_user_input_by_dialogue_id(
             db,
-            language,
+            dialogue_id,
         )
-    elif customer_id is not None:
-        results = read_customer_inputs_by_customer_id(
+    discarded = 0
+    if staging is not None and consent.consent:
+        await run_in_threadpool(staging.remove, dialogue_id, len(staged_inputs))
+    elif staging is not None:
+        discarded = await run_in_threadpool(staging.discard, dialogue_id)
+    if changed == 0 and len(staged_inputs) == 0 and discarded == 0:
+        return _dialogue_not_found_error(response, dialogue_id)
+
+    if consent.consent:
+        response.status_code = status.HTTP_201_CREATED
+
+    CONSENTS.labels("granted" if consent.consent else "revoked").inc()
+    _invalidate_responses(
+        cache,
+        changed > 0,
+        staged_inputs if consent.consent else [],
+    )
+
+    return CustomerConsentResponse(
+        consent=consent.consent,
+        dialogue_id=dialogue_id,
+    )
+
+
+@async_router.get(
+    "/data",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"model": CustomerInputResponse}},
+)
+async def async_serve_customer_inputs(
+        language: Optional[SupportedLanguages] = None,
+        customer_id: Optional[int] = None,
+        limit: Optional[int] = Query(
+            None,
+            ge=1,
+            le=settings.DATA_PAGE_SIZE_MAX,
+        ),
+        after_id: Optional[int] = Query(None, ge=1),
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        stream: bool = False,
+        db: AsyncSession = Depends(get_async_read_db),
+        cache: Optional[ResponseCache] = Depends(get_response_cache),
+        x_read_your_writes: bool = Header(False),
+) -> Response:
+    if stream:
+        rows = async_crud.stream_customer_inputs(
+            db,
+            customer_id=customer_id,
+            language=language,
+            limit=limit,
+            after_id=after_id,
+            since=since,
+            until=until,
+            batch_size=settings.DATA_STREAM_BATCH_SIZE,
+        )
+        return StreamingResponse(
+            async_ndjson_lines(rows),
+            media_type="application/x-ndjson",
+        )
+
+    async def read() -> Tuple[bytes, Optional[int]]:
+        rows = await async_crud.read_customer_input_rows(
             db,
-            customer_id,
+            customer_id=customer_id,
+            language=language,
+            limit=limit,
+            after_id=after_id,
+            since=since,
+            until=until,
+        )
+        return _serialize_customer_inputs(rows, limit)
+
+    # Cached bodies may come from the lagging replica.
+    if cache is None or x_read_your_writes:
+        body, next_after_id = await read()
+    else:
+        body, next_after_id = await cache.get_or_compute_async(
+            (customer_id, language, limit, after_id, since, until),
+            (customer_id, language),
+            read,
         )
+
+    return _customer_input_response(body, next_after_id)
+
+
+@async_router.get(
+    "/data/search",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"model": CustomerInputResponse}},
+)
+async def async_search_customer_inputs(
+        q: str = Query(..., min_length=1),
+        language: Optional[SupportedLanguages] = None,
+        limit: int = Query(
+            settings.DATA_SEARCH_PAGE_SIZE,
+            ge=1,
+            le=settings.DATA_PAGE_SIZE_MAX,
+        ),
+        offset: int = Query(0, ge=0),
+        db: AsyncSession = Depends(get_async_read_db),
+) -> Response:
+    rows = await async_crud.search_customer_input_rows(
+        db,
+        q,
+        language=language,
+        limit=limit,
+        offset=offset,
+    )
+    return _search_response(rows, limit, offset)
+
+
+@async_router.get(
+    "/data/stats",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"model": InputStatsResponse}},
+)
+async def async_serve_customer_input_stats(
+        customer_id: Optional[int] = None,
+        db: AsyncSession = Depends(get_async_read_db),
+) -> Response:
+    counters, histogram = await async_crud.read_input_stats(
+        db,
+        customer_id=customer_id,
+    )
+    return _stats_response(counters, histogram, customer_id)
+
+
+@async_router.get(
+    "/data/changes",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"model": ChangeFeedResponse}},
+)
+async def async_serve_customer_input_changes(
+        since_id: int = Query(0, ge=0),
+        limit: int = Query(
+            settings.DATA_CHANGES_PAGE_SIZE,
+            ge=1,
+            le=settings.DATA_PAGE_SIZE_MAX,
+        ),
+        db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    changes = await async_crud.read_dialogue_changes(
+        db,
+        since_id=since_id,
+        limit=limit,
+        created_before=_settled_before(),
+    )
+    input_rows = await async_crud.read_customer_input_rows_by_dialogue_ids(
+        db,
+        _upserted_dialogue_ids(changes),
+    )
+    return Response(
+        content=change_feed_json(changes, input_rows, since_id),
+        media_type="application/json",
+    )
+
+
+@async_router.get(
+    "/data/export",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_501_NOT_IMPLEMENTED: {"model": Error}},
+)
+async def async_export_customer_inputs(
+        response: Response,
+        export_format: ExportFormat = Query(ExportFormat.csv, alias="format"),
+        language: Optional[SupportedLanguages] = None,
+        customer_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        db: AsyncSession = Depends(get_async_read_db),
+) -> Union[StreamingResponse, Error]:
+    encoder = _export_encoder(export_format, response)
+    if isinstance(encoder, Error):
+        return encoder
+
+    rows = async_crud.stream_customer_inputs(
+        db,
+        customer_id=customer_id,
+        language=language,
+        since=since,
+        until=until,
+        batch_size=settings.DATA_STREAM_BATCH_SIZE,
+    )
+    chunks = async_export_chunks(rows, encoder, settings.DATA_EXPORT_BATCH_SIZE)
+    return _export_response(chunks, export_format)
+
+
+@sharded_router.post("/data/{customer_id}/{dialogue_id}", status_code=status.HTTP_200_OK)
+def sharded_get_customer_input(
+        customer_id: int,
+        dialogue_id: int,
+        customer_input: CustomerInput,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        shards: ShardedDatabase = Depends(get_shards),
+) -> CompleteCustomerInput:
+    full_customer_input = _complete_customer_input(
+        customer_id,
+        dialogue_id,
+        customer_input,
+    )
+    dedup_key = _dedup_key(full_customer_input, idempotency_key)
+
+    inserted = sharding.create_user_inputs(
+        shards,
+        [full_customer_input],
+        dedup_keys=None if dedup_key is None else [dedup_key],
+    )
+    _count_ingested(None, inserted, duplicates=1 - inserted)
+
+    return full_customer_input
+
+
+@sharded_router.post("/data/batch", status_code=status.HTTP_200_OK)
+def sharded_get_customer_input_batch(
+        batch: CustomerInputBatch,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None, max_length=255),
+        shards: ShardedDatabase = Depends(get_shards),
+) -> Union[CustomerInputBatchResponse, Error]:
+    if len(batch.inputs) > settings.INGESTION_BATCH_SIZE_MAX:
+        return _batch_too_large_error(response)
+
+    customer_inputs, errors = _validate_batch(batch)
+
+    inserted = sharding.create_user_inputs(
+        shards,
+        customer_inputs,
+        dedup_keys=_batch_dedup_keys(customer_inputs, errors, idempotency_key),
+    )
+    duplicates = len(customer_inputs) - inserted
+
+    _count_ingested(None, inserted, len(errors), duplicates)
+
+    return CustomerInputBatchResponse(
+        inserted=inserted,
+        duplicates=duplicates,
+        errors=errors,
+    )
+
+
+@sharded_router.post("/consents/{dialogue_id}", status_code=status.HTTP_200_OK)
+def sharded_get_customer_consent(
+        dialogue_id: int,
+        response: Response,
+        consent: CustomerConsent,
+        shards: ShardedDatabase = Depends(get_shards),
+) -> Union[CustomerConsentResponse, Error]:
+    # The dialogue's inputs may live on any shard: each one is asked.
+    if consent.consent:
+        changed = sharding.grant_consent_by_dialogue_id(shards, dialogue_id)
     else:
-        results = read_customer_inputs(db)
+        changed = sharding.delete_user_input_by_dialogue_id(shards, dialogue_id)
+    if changed == 0:
+        return _dialogue_not_found_error(response, dialogue_id)
+
+    if consent.consent:
+        response.status_code = status.HTTP_201_CREATED
+
+    CONSENTS.labels("granted" if consent.consent else "revoked").inc()
+
+    return CustomerConsentResponse(
+        consent=consent.consent,
+        dialogue_id=dialogue_id,
+    )
 
-    # TODO: find a better way to convert results to dict.
-    results = [res.as_dict() for res in results]
 
-    return CustomerInputResponse(
-        results_number=len(results),
-        results=results,
+@sharded_router.get(
+    "/data",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"model": CustomerInputResponse}},
+)
+def sharded_serve_customer_inputs(
+        language: Optional[SupportedLanguages] = None,
+        customer_id: Optional[int] = None,
+        limit: Optional[int] = Query(
+            None,
+            ge=1,
+            le=settings.DATA_PAGE_SIZE_MAX,
+        ),
+        after_id: Optional[int] = Query(None, ge=1),
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        shards: ShardedDatabase = Depends(get_shards),
+) -> Response:
+    rows = sharding.read_customer_input_rows(
+        shards,
+        customer_id=customer_id,
+        language=language,
+        limit=limit,
+        after_id=after_id,
+        since=since,
+        until=until,
     )
+    return _customer_input_response(*_serialize_customer_inputs(rows, limit))
+
+
+if settings.DATABASE_SHARD_URLS:
+    app.include_router(sharded_router)
+else:
+    app.include_router(async_router if settings.DATABASE_ASYNC else router)
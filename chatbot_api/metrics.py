@@ -0,0 +1,185 @@
+"""Prometheus metrics of the app, served by `GET /metrics`.
+
+Metric children are resolved once per route or query function, so that a
+request only pays for a couple of dict lookups and histogram observations.
+"""
+import inspect
+import os
+import time
+from functools import wraps
+from typing import Callable, Dict, TypeVar, cast
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+FunctionT = TypeVar("FunctionT", bound=Callable)
+
+REQUESTS = Counter(
+    "chatbot_api_requests_total",
+    "HTTP requests by route and status code.",
+    ["method", "route", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "chatbot_api_request_duration_seconds",
+    "HTTP request latency by route, response body included.",
+    ["method", "route"],
+    buckets=(
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    ),
+)
+QUERY_DURATION = Histogram(
+    "chatbot_api_db_query_duration_seconds",
+    "Database query latency by `crud.py` function.",
+    ["function"],
+    buckets=(
+        0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+        0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+    ),
+)
+INGESTED_INPUTS = Counter(
+    "chatbot_api_ingested_inputs_total",
+    "Customer inputs accepted by the ingestion routes.",
+    ["destination"],
+)
+REJECTED_INPUTS = Counter(
+    "chatbot_api_rejected_inputs_total",
+    "Customer inputs of a batch rejected by validation.",
+)
+DUPLICATE_INPUTS = Counter(
+    "chatbot_api_duplicate_inputs_total",
+    "Customer inputs ignored as retries of stored ones.",
+)
+CONSENTS = Counter(
+    "chatbot_api_consents_total",
+    "Consent calls by outcome.",
+    ["outcome"],
+)
+READ_SESSIONS = Counter(
+    "chatbot_api_read_sessions_total",
+    "Sessions of the read-only routes, by database serving them.",
+    ["source"],
+)
+UNCOMPRESSED_BYTES = Counter(
+    "chatbot_api_compression_uncompressed_bytes_total",
+    "Bytes of the bodies before compression or after decompression.",
+    ["direction", "encoding"],
+)
+COMPRESSED_BYTES = Counter(
+    "chatbot_api_compression_compressed_bytes_total",
+    "Bytes of the compressed bodies, sent or received.",
+    ["direction", "encoding"],
+)
+COMPRESSION_CPU_SECONDS = Counter(
+    "chatbot_api_compression_cpu_seconds_total",
+    "CPU time spent compressing responses and decompressing requests.",
+    ["direction", "encoding"],
+)
+PURGED_INPUTS = Counter(
+    "chatbot_api_purged_inputs_total",
+    "Pending inputs deleted by the retention purge.",
+)
+PURGE_CHUNK_DURATION = Histogram(
+    "chatbot_api_purge_chunk_duration_seconds",
+    "Duration of the retention purge chunks.",
+)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def timed_query(function: FunctionT) -> FunctionT:
+    histogram = QUERY_DURATION.labels(function.__name__)
+
+    # Streamed rows are fetched while the generator is consumed.
+    if inspect.isasyncgenfunction(function):
+        @wraps(function)
+        async def async_generator_wrapper(*args, **kwargs):
+            with histogram.time():
+                async for item in function(*args, **kwargs):
+                    yield item
+
+        return cast(FunctionT, async_generator_wrapper)
+
+    if inspect.isgeneratorfunction(function):
+        @wraps(function)
+        def generator_wrapper(*args, **kwargs):
+            with histogram.time():
+                yield from function(*args, **kwargs)
+
+        return cast(FunctionT, generator_wrapper)
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with histogram.time():
+            return function(*args, **kwargs)
+
+    return cast(FunctionT, wrapper)
+
+
+class PrometheusMiddleware:
+    """Count and time HTTP requests by route template.
+
+    A plain ASGI middleware: unlike `BaseHTTPMiddleware`, it neither buffers
+    nor re-wraps streamed responses. Routes are labelled by their path
+    template rather than the requested path, to keep label cardinality
+    bounded.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._route_paths: Dict[Callable, str] = {}
+
+    def _route_path(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        route_path = self._route_paths.get(endpoint)
+        if route_path is None:
+            route_path = next(
+                (
+                    route.path
+                    for route in scope["router"].routes
+                    if getattr(route, "endpoint", None) is endpoint
+                ),
+                UNMATCHED_ROUTE,
+            )
+            self._route_paths[endpoint] = route_path
+        return route_path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            method = scope["method"]
+            route_path = self._route_path(scope)
+            REQUESTS.labels(method, route_path, str(status_code)).inc()
+            REQUEST_DURATION.labels(method, route_path).observe(duration)
+
+
+def render_metrics() -> bytes:
+    # Worker processes share their samples through files in multiprocess mode.
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
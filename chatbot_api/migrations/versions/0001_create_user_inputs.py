@@ -0,0 +1,45 @@
+"""Create the user_inputs table.
+
+Databases created before migrations existed already have the table
+(through `Base.metadata.create_all`), so it is only created when missing.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# `Enum(SupportedLanguages)` stores the member names, not their values.
+LANGUAGES = ("english", "french", "german", "italian")
+
+
+def upgrade() -> None:
+    if (
+        not context.is_offline_mode()
+        and sa.inspect(op.get_bind()).has_table("user_inputs")
+    ):
+        return
+
+    op.create_table(
+        "user_inputs",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("customer_id", sa.Integer(), nullable=False),
+        sa.Column("dialogue_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "language",
+            sa.Enum(*LANGUAGES, name="supportedlanguages"),
+            nullable=False,
+        ),
+        sa.Column("text", sa.String(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_inputs")
+    sa.Enum(name="supportedlanguages").drop(op.get_bind(), checkfirst=True)
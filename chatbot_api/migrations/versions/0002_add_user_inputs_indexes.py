@@ -0,0 +1,51 @@
+"""Add indexes matching the user_inputs query patterns.
+
+On PostgreSQL the indexes are built with `CREATE INDEX CONCURRENTLY`,
+outside of the migration transaction, so ingestion is not blocked while
+they are being built.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_user_inputs_customer_id_language_id": [
+        "customer_id",
+        "language",
+        sa.text("id DESC"),
+    ],
+    "ix_user_inputs_customer_id_id": ["customer_id", sa.text("id DESC")],
+    "ix_user_inputs_language_id": ["language", sa.text("id DESC")],
+    "ix_user_inputs_dialogue_id": ["dialogue_id"],
+}
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(
+                name,
+                "user_inputs",
+                columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(
+                name,
+                table_name="user_inputs",
+                if_exists=True,
+                postgresql_concurrently=True,
+            )
@@ -0,0 +1,100 @@
+"""Add the consent column and partial indexes over consented inputs.
+
+Inputs stored before this migration were all served by `GET /data`, so
+they are marked as consented: the column is added with a `true` default
+(a metadata-only change on PostgreSQL 11+), which is then switched to
+`false` for new inputs. The read indexes are replaced by partial indexes
+over consented inputs only, built concurrently on PostgreSQL.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+CONSENTED = sa.column("consent", sa.Boolean()).is_(True)
+
+PARTIAL_INDEXES = {
+    "ix_user_inputs_consented_customer_id_language_id": [
+        "customer_id",
+        "language",
+        sa.text("id DESC"),
+    ],
+    "ix_user_inputs_consented_customer_id_id": [
+        "customer_id",
+        sa.text("id DESC"),
+    ],
+    "ix_user_inputs_consented_language_id": ["language", sa.text("id DESC")],
+    "ix_user_inputs_consented_id": [sa.text("id DESC")],
+}
+
+FULL_INDEXES = {
+    "ix_user_inputs_customer_id_language_id": [
+        "customer_id",
+        "language",
+        sa.text("id DESC"),
+    ],
+    "ix_user_inputs_customer_id_id": ["customer_id", sa.text("id DESC")],
+    "ix_user_inputs_language_id": ["language", sa.text("id DESC")],
+}
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user_inputs",
+        sa.Column(
+            "consent",
+            sa.Boolean(),
+            nullable=False,
+            server_default=sa.true(),
+        ),
+    )
+    with op.batch_alter_table("user_inputs") as batch_op:
+        batch_op.alter_column("consent", server_default=sa.false())
+
+    with op.get_context().autocommit_block():
+        for name, columns in PARTIAL_INDEXES.items():
+            op.create_index(
+                name,
+                "user_inputs",
+                columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_where=CONSENTED,
+                sqlite_where=CONSENTED,
+            )
+        for name in FULL_INDEXES:
+            op.drop_index(
+                name,
+                table_name="user_inputs",
+                if_exists=True,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in FULL_INDEXES.items():
+            op.create_index(
+                name,
+                "user_inputs",
+                columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+            )
+        for name in PARTIAL_INDEXES:
+            op.drop_index(
+                name,
+                table_name="user_inputs",
+                if_exists=True,
+                postgresql_concurrently=True,
+            )
+
+    with op.batch_alter_table("user_inputs") as batch_op:
+        batch_op.drop_column("consent")
@@ -0,0 +1,69 @@
+"""Add the created_at column and an index over consented inputs.
+
+Inputs stored before this migration are dated by the migration itself. On
+PostgreSQL 11+, adding the column with a `now()` default does not rewrite
+the table. SQLite cannot add a column with a non-constant default, so the
+column is added with a constant one there and then backfilled; new inputs
+are dated by the `CustomerInputs` default.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+CONSENTED = sa.column("consent", sa.Boolean()).is_(True)
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name == "sqlite":
+        op.add_column(
+            "user_inputs",
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                nullable=False,
+                server_default=sa.text("'1970-01-01 00:00:00'"),
+            ),
+        )
+        op.execute("UPDATE user_inputs SET created_at = CURRENT_TIMESTAMP")
+    else:
+        op.add_column(
+            "user_inputs",
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                nullable=False,
+                server_default=sa.func.now(),
+            ),
+        )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_inputs_consented_created_at",
+            "user_inputs",
+            ["created_at"],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+            postgresql_where=CONSENTED,
+            sqlite_where=CONSENTED,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_user_inputs_consented_created_at",
+            table_name="user_inputs",
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
+
+    with op.batch_alter_table("user_inputs") as batch_op:
+        batch_op.drop_column("created_at")
@@ -0,0 +1,55 @@
+"""Add a partial index over pending inputs for the retention purge.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from chatbot_api.partitioning import create_index_concurrently, drop_index_concurrently
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+PENDING = sa.column("consent", sa.Boolean()).is_(False)
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name == "postgresql":
+        # Also on a partitioned table, index by index (see `partitioning.py`).
+        with op.get_context().autocommit_block():
+            create_index_concurrently(
+                op.get_bind(),
+                "ix_user_inputs_pending_created_at",
+                "(created_at) WHERE consent IS false",
+            )
+        return
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_inputs_pending_created_at",
+            "user_inputs",
+            ["created_at"],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+            postgresql_where=PENDING,
+            sqlite_where=PENDING,
+        )
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            drop_index_concurrently(op.get_bind(), "ix_user_inputs_pending_created_at")
+        return
+
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_user_inputs_pending_created_at",
+            table_name="user_inputs",
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,39 @@
+"""Create the user_input_changes table of the change feed.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+OPERATIONS = ("upsert", "delete")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_input_changes",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("dialogue_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "operation",
+            sa.Enum(*OPERATIONS, name="changeoperation"),
+            nullable=False,
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_input_changes")
+    sa.Enum(name="changeoperation").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,86 @@
+"""Add the full-text search index of user_inputs.text.
+
+On PostgreSQL, a generated tsvector column, using the text search
+configuration of each input's language, indexed with GIN over consented
+inputs. Adding a stored generated column rewrites the table under an
+exclusive lock, so run this migration during a maintenance window on
+large tables. On SQLite, an FTS5 external content table kept up to date by
+triggers, filled from the existing rows.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+from chatbot_api.partitioning import create_index_concurrently, drop_index_concurrently
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+CONFIG_BY_LANGUAGE = (
+    "WHEN 'english' THEN 'english'::regconfig "
+    "WHEN 'french' THEN 'french'::regconfig "
+    "WHEN 'german' THEN 'german'::regconfig "
+    "WHEN 'italian' THEN 'italian'::regconfig"
+)
+
+SQLITE_TRIGGERS = {
+    "user_inputs_fts_insert": (
+        "AFTER INSERT ON user_inputs "
+        "BEGIN INSERT INTO user_inputs_fts (rowid, text) "
+        "VALUES (new.id, new.text); END"
+    ),
+    "user_inputs_fts_delete": (
+        "AFTER DELETE ON user_inputs "
+        "BEGIN INSERT INTO user_inputs_fts (user_inputs_fts, rowid, text) "
+        "VALUES ('delete', old.id, old.text); END"
+    ),
+    "user_inputs_fts_update": (
+        "AFTER UPDATE OF text ON user_inputs "
+        "BEGIN INSERT INTO user_inputs_fts (user_inputs_fts, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        "INSERT INTO user_inputs_fts (rowid, text) "
+        "VALUES (new.id, new.text); END"
+    ),
+}
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS user_inputs_fts USING fts5("
+            "text, content='user_inputs', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        for name, definition in SQLITE_TRIGGERS.items():
+            op.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {definition}")
+        op.execute("INSERT INTO user_inputs_fts (user_inputs_fts) VALUES ('rebuild')")
+        return
+
+    op.execute(
+        f"ALTER TABLE user_inputs ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector(CASE language {CONFIG_BY_LANGUAGE} "
+        f"END, text)) STORED"
+    )
+    # Also on a partitioned table, index by index (see `partitioning.py`).
+    with op.get_context().autocommit_block():
+        create_index_concurrently(
+            op.get_bind(),
+            "ix_user_inputs_consented_search_vector",
+            "USING gin (search_vector) WHERE consent IS true",
+        )
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name == "sqlite":
+        for name in SQLITE_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS {name}")
+        op.execute("DROP TABLE IF EXISTS user_inputs_fts")
+        return
+
+    with op.get_context().autocommit_block():
+        drop_index_concurrently(op.get_bind(), "ix_user_inputs_consented_search_vector")
+    op.execute("ALTER TABLE user_inputs DROP COLUMN IF EXISTS search_vector")
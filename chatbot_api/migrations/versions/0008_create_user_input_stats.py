@@ -0,0 +1,89 @@
+"""Create the counter and histogram tables of the input stats.
+
+They are filled from the consented inputs stored so far, with the same
+`GROUP BY` scans as `python -m chatbot_api.stats rebuild`.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+LANGUAGE_KEYS = (
+    "CASE language "
+    "WHEN 'english' THEN 'EN' "
+    "WHEN 'french' THEN 'FR' "
+    "WHEN 'german' THEN 'GE' "
+    "WHEN 'italian' THEN 'IT' "
+    "END"
+)
+
+LENGTH_BUCKETS = (0, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+LENGTH_BUCKET = "CASE {} ELSE 0 END".format(
+    " ".join(
+        f"WHEN length(text) >= {bucket} THEN {bucket}"
+        for bucket in reversed(LENGTH_BUCKETS[1:])
+    )
+)
+
+
+def _day_key() -> str:
+    if op.get_context().dialect.name == "sqlite":
+        return "date(created_at)"
+    return "to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD')"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_input_stats",
+        sa.Column("dimension", sa.String(), primary_key=True, nullable=False),
+        sa.Column("key", sa.String(), primary_key=True, nullable=False),
+        sa.Column("inputs", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("characters", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+    op.create_table(
+        "user_input_length_histogram",
+        sa.Column(
+            "bucket",
+            sa.Integer(),
+            primary_key=True,
+            nullable=False,
+            autoincrement=False,
+        ),
+        sa.Column("inputs", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+
+    op.execute(
+        "INSERT INTO user_input_stats (dimension, key, inputs, characters) "
+        "SELECT 'total', '', count(*), coalesce(sum(length(text)), 0) "
+        "FROM user_inputs WHERE consent IS true"
+    )
+    for dimension, key in [
+        ("language", LANGUAGE_KEYS),
+        ("customer", "CAST(customer_id AS VARCHAR)"),
+        ("day", _day_key()),
+    ]:
+        op.execute(
+            f"INSERT INTO user_input_stats (dimension, key, inputs, characters) "
+            f"SELECT '{dimension}', {key}, count(*), coalesce(sum(length(text)), 0) "
+            f"FROM user_inputs WHERE consent IS true "
+            f"GROUP BY {key}"
+        )
+    op.execute(
+        f"INSERT INTO user_input_length_histogram (bucket, inputs) "
+        f"SELECT {LENGTH_BUCKET}, count(*) "
+        f"FROM user_inputs WHERE consent IS true "
+        f"GROUP BY {LENGTH_BUCKET}"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_input_length_histogram")
+    op.drop_table("user_input_stats")
@@ -0,0 +1,78 @@
+"""Add the dedup_key column of idempotent ingestion, and its unique index.
+
+The column is nullable and NULL for the inputs stored so far, so adding it
+does not rewrite the table; the partial unique index only covers the
+inputs stored with a key. A partitioned table (see `partitioning.py`)
+cannot have a unique index without the partition key, so each of its
+partitions gets its own index instead.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from chatbot_api.partitioning import (
+    dedup_index_ddl,
+    dedup_index_name,
+    is_partitioned,
+    list_partitions,
+)
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+HAS_DEDUP_KEY = sa.column("dedup_key", sa.String()).isnot(None)
+
+
+def _partitioned() -> bool:
+    bind = op.get_bind()
+    return bind.dialect.name == "postgresql" and is_partitioned(bind)
+
+
+def upgrade() -> None:
+    op.add_column("user_inputs", sa.Column("dedup_key", sa.String(), nullable=True))
+
+    if _partitioned():
+        partitions = list_partitions(op.get_bind())
+        with op.get_context().autocommit_block():
+            for partition in partitions:
+                op.execute(dedup_index_ddl(partition, concurrently=True))
+        return
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_inputs_dedup_key",
+            "user_inputs",
+            ["dedup_key"],
+            unique=True,
+            if_not_exists=True,
+            postgresql_concurrently=True,
+            postgresql_where=HAS_DEDUP_KEY,
+            sqlite_where=HAS_DEDUP_KEY,
+        )
+
+
+def downgrade() -> None:
+    if _partitioned():
+        index_names = [
+            dedup_index_name(partition)
+            for partition in list_partitions(op.get_bind())
+        ]
+    else:
+        index_names = ["ix_user_inputs_dedup_key"]
+    with op.get_context().autocommit_block():
+        for index_name in index_names:
+            op.drop_index(
+                index_name,
+                table_name="user_inputs",
+                if_exists=True,
+                postgresql_concurrently=True,
+            )
+
+    # A plain `ALTER TABLE`, also on SQLite (3.35+): a batch copy of the
+    # table would lose the full-text search triggers.
+    op.drop_column("user_inputs", "dedup_key")
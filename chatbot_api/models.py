@@ -1,14 +1,23 @@
-from sqlalchemy import Column, DateTime, Enum, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    Enum,
+    Index,
+    Integer,
+    String,
+    false,
+    func,
+)
 
 from .database import Base
-from .schemas import SupportedLanguages
+from .schemas import ChangeOperation, SupportedLanguages
 
 
 class CustomerInputs(Base):
     __tablename__ = "user_inputs"
 
-    # TODO: Add `created_at` timestamp column.
-
     # TODO: Use UUIDs instead of incremental Integer ids.
     id = Column(Integer, primary_key=True, nullable=False)
 
@@ -21,5 +30,123 @@ class CustomerInputs(Base):
     language = Column(Enum(SupportedLanguages), nullable=False)
     text = Column(String, nullable=False)
 
+    # Pending until the dialogue's consent is granted.
+    consent = Column(Boolean, nullable=False, default=False, server_default=false())
+
+    # Idempotency key of the ingestion request, or hash of the input's
+    # content, unique so that retried requests do not add duplicates.
+    dedup_key = Column(String, nullable=True)
+
+    # Set by the database clock. On PostgreSQL, the table may be range
+    # partitioned by month on this column (see `partitioning.py`).
+    created_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=func.now(),
+        server_default=func.now(),
+    )
+
+    # Match the access paths of `crud.py`: reads only ever serve consented
+    # inputs, filter on customer/language/creation time and order by
+    # `id DESC`, so their indexes are partial; consent calls look dialogues
+    # up as a whole.
+    __table_args__ = (
+        Index(
+            "ix_user_inputs_consented_customer_id_language_id",
+            customer_id,
+            language,
+            id.desc(),
+            postgresql_where=consent.is_(True),
+            sqlite_where=consent.is_(True),
+        ),
+        Index(
+            "ix_user_inputs_consented_customer_id_id",
+            customer_id,
+            id.desc(),
+            postgresql_where=consent.is_(True),
+            sqlite_where=consent.is_(True),
+        ),
+        Index(
+            "ix_user_inputs_consented_language_id",
+            language,
+            id.desc(),
+            postgresql_where=consent.is_(True),
+            sqlite_where=consent.is_(True),
+        ),
+        Index(
+            "ix_user_inputs_consented_id",
+            id.desc(),
+            postgresql_where=consent.is_(True),
+            sqlite_where=consent.is_(True),
+        ),
+        Index(
+            "ix_user_inputs_consented_created_at",
+            created_at,
+            postgresql_where=consent.is_(True),
+            sqlite_where=consent.is_(True),
+        ),
+        # Retention purge of the dialogues left without a consent answer.
+        Index(
+            "ix_user_inputs_pending_created_at",
+            created_at,
+            postgresql_where=consent.is_(False),
+            sqlite_where=consent.is_(False),
+        ),
+        Index("ix_user_inputs_dialogue_id", dialogue_id),
+        # Probed by every retried ingestion request. On a partitioned table,
+        # it is created on each partition instead (see `partitioning.py`).
+        Index(
+            "ix_user_inputs_dedup_key",
+            dedup_key,
+            unique=True,
+            postgresql_where=dedup_key.isnot(None),
+            sqlite_where=dedup_key.isnot(None),
+        ),
+    )
+
     def as_dict(self) -> dict:
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class DialogueChanges(Base):
+    """Change log of the consented inputs, read by `GET /data/changes`.
+
+    Written in the transactions that make the inputs of a dialogue visible
+    (consent granted) or that delete them (tombstones), one row per
+    dialogue rather than per input.
+    """
+    __tablename__ = "user_input_changes"
+
+    id = Column(Integer, primary_key=True, nullable=False)
+    dialogue_id = Column(Integer, nullable=False)
+    operation = Column(Enum(ChangeOperation), nullable=False)
+    created_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=func.now(),
+        server_default=func.now(),
+    )
+
+
+class InputStats(Base):
+    """Counters of the consented inputs, read by `GET /data/stats`.
+
+    One row per `(dimension, key)`: the `total` row, then one per language,
+    customer and UTC creation day. Updated in the transactions that make
+    inputs visible or delete them, and rebuilt by `stats.py`.
+    """
+    __tablename__ = "user_input_stats"
+
+    dimension = Column(String, primary_key=True, nullable=False)
+    key = Column(String, primary_key=True, nullable=False)
+    inputs = Column(BigInteger, nullable=False, default=0, server_default="0")
+    characters = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+
+class InputLengthHistogram(Base):
+    """Histogram of the text length of the consented inputs, one row per
+    bucket, keyed by the bucket's lower bound."""
+    __tablename__ = "user_input_length_histogram"
+
+    bucket = Column(Integer, primary_key=True, nullable=False, autoincrement=False)
+    inputs = Column(BigInteger, nullable=False, default=0, server_default="0")
@@ -0,0 +1,292 @@
+"""Monthly range partitioning of `user_inputs` on `created_at` (PostgreSQL).
+
+Time-bounded reads then only scan the partitions of their range, and old
+months are detached, or dropped, as a catalog operation instead of a
+`DELETE` of millions of rows:
+
+    python -m chatbot_api.partitioning convert --months-ahead 3
+    python -m chatbot_api.partitioning create --months-ahead 3
+    python -m chatbot_api.partitioning detach --before 2026-01 [--drop]
+
+`convert` copies the table under an exclusive lock, so it should be run
+during a maintenance window. `create` should run at least monthly (e.g.
+from cron), so that partitions exist ahead of the inputs; inputs outside
+of every month partition land in the default partition.
+
+Unique indexes of a partitioned table have to hold the partition key, so
+the dedup key index is created on each partition instead: retried inputs
+are only deduplicated within a month.
+"""
+import argparse
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection
+
+from .database import get_engine
+from .models import CustomerInputs
+from .search import POSTGRESQL_DDL
+
+TABLE = CustomerInputs.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_NAME = re.compile(rf"^{TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def create_partition_ddl(month: date, parent: str = TABLE) -> str:
+    # Bounds are UTC midnights: a partition holds exactly one UTC month.
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} "
+        f"PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+        f"TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+    )
+
+
+def dedup_index_name(partition: str) -> str:
+    return f"{partition}_dedup_key"
+
+
+def dedup_index_ddl(partition: str, concurrently: bool = False) -> str:
+    return (
+        f"CREATE UNIQUE INDEX {'CONCURRENTLY ' if concurrently else ''}"
+        f"IF NOT EXISTS {dedup_index_name(partition)} "
+        f"ON {partition} (dedup_key) WHERE dedup_key IS NOT NULL"
+    )
+
+
+def is_partitioned(connection: Connection) -> bool:
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": TABLE},
+    ).scalar()
+    return relkind == "p"
+
+
+def list_partitions(connection: Connection) -> List[str]:
+    return connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table "
+            "ORDER BY child.relname"
+        ),
+        {"table": TABLE},
+    ).scalars().all()
+
+
+def create_index_concurrently(
+        connection: Connection,
+        name: str,
+        definition: str,
+) -> None:
+    """Create a non-unique index of `user_inputs`, e.g. from a migration's
+    autocommit block, without blocking its writes.
+
+    `CREATE INDEX CONCURRENTLY` is an error on a partitioned table: there,
+    the index is created on the parent only, invalid, then concurrently on
+    each partition, whose indexes are attached to it. It becomes valid once
+    the last one is attached, and later partitions get it on creation.
+    """
+    if not is_partitioned(connection):
+        connection.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                f"ON {TABLE} {definition}"
+            )
+        )
+        return
+    connection.execute(
+        text(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {TABLE} {definition}")
+    )
+    for partition in list_partitions(connection):
+        partition_index = f"{partition}_{name}"
+        connection.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} "
+                f"ON {partition} {definition}"
+            )
+        )
+        connection.execute(
+            text(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
+        )
+
+
+def drop_index_concurrently(connection: Connection, name: str) -> None:
+    # The index of a partitioned table cannot be dropped concurrently: it
+    # is dropped along with the ones of its partitions.
+    concurrently = "" if is_partitioned(connection) else "CONCURRENTLY "
+    connection.execute(text(f"DROP INDEX {concurrently}IF EXISTS {name}"))
+
+
+def create_partitions(
+        connection: Connection,
+        first_month: date,
+        last_month: date,
+        parent: str = TABLE,
+) -> List[str]:
+    created = []
+    month = first_month.replace(day=1)
+    while month <= last_month:
+        connection.execute(text(create_partition_ddl(month, parent)))
+        connection.execute(text(dedup_index_ddl(partition_name(month))))
+        created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def convert_to_partitioned(connection: Connection, months_ahead: int) -> List[str]:
+    """Swap `user_inputs` for a copy partitioned by month, keeping its ids,
+    sequence and indexes."""
+    if is_partitioned(connection):
+        return []
+
+    staging_table = f"{TABLE}_partitioned"
+    connection.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+
+    first_created_at = connection.execute(
+        select(func.min(CustomerInputs.created_at))
+    ).scalar()
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    first_month = this_month
+    if first_created_at is not None:
+        first_month = first_created_at.astimezone(timezone.utc).date()
+
+    # The partition key has to be part of the primary key.
+    connection.execute(
+        text(
+            f"CREATE TABLE {staging_table} "
+            f"(LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS "
+            f"INCLUDING GENERATED) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+    )
+    connection.execute(
+        text(
+            f"ALTER TABLE {staging_table} "
+            f"ADD CONSTRAINT {TABLE}_pkey_new PRIMARY KEY (id, created_at)"
+        )
+    )
+    created = create_partitions(
+        connection,
+        first_month,
+        add_months(this_month, months_ahead),
+        parent=staging_table,
+    )
+    connection.execute(
+        text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {staging_table} DEFAULT")
+    )
+    connection.execute(text(dedup_index_ddl(DEFAULT_PARTITION)))
+    # Generated columns, such as the search vector, are computed again.
+    columns = ", ".join(column.name for column in CustomerInputs.__table__.columns)
+    connection.execute(
+        text(
+            f"INSERT INTO {staging_table} ({columns}) "
+            f"SELECT {columns} FROM {TABLE}"
+        )
+    )
+
+    # The id sequence is owned by the old table: keep it alive.
+    sequence = connection.execute(
+        text("SELECT pg_get_serial_sequence(:table, 'id')"),
+        {"table": TABLE},
+    ).scalar()
+    if sequence is not None:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    connection.execute(text(f"DROP TABLE {TABLE}"))
+    connection.execute(text(f"ALTER TABLE {staging_table} RENAME TO {TABLE}"))
+    connection.execute(
+        text(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {TABLE}_pkey_new TO {TABLE}_pkey")
+    )
+    if sequence is not None:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+
+    # Indexes of a partitioned table are created on every partition.
+    for index in CustomerInputs.__table__.indexes:
+        if not index.unique:
+            index.create(connection)
+    for statement in POSTGRESQL_DDL:
+        connection.execute(text(statement))
+
+    return created
+
+
+def detach_partitions(
+        connection: Connection,
+        before: date,
+        drop: bool = False,
+) -> List[str]:
+    detached = []
+    for name in list_partitions(connection):
+        month = partition_month(name)
+        if month is None or month >= before:
+            continue
+        connection.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        if drop:
+            connection.execute(text(f"DROP TABLE {name}"))
+        detached.append(name)
+    return detached
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ["convert", "create"]:
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument("--months-ahead", type=int, default=3)
+    detach = subparsers.add_parser("detach")
+    detach.add_argument(
+        "--before",
+        required=True,
+        type=lambda value: datetime.strptime(value, "%Y-%m").date(),
+        help="first month to keep, as YYYY-MM",
+    )
+    detach.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        parser.error("partitioning is only supported on PostgreSQL")
+
+    with engine.begin() as connection:
+        if args.command == "convert":
+            tables = convert_to_partitioned(connection, args.months_ahead)
+        elif not is_partitioned(connection):
+            parser.error(f"{TABLE} is not partitioned, run `convert` first")
+        elif args.command == "create":
+            this_month = datetime.now(timezone.utc).date().replace(day=1)
+            tables = create_partitions(
+                connection,
+                this_month,
+                add_months(this_month, args.months_ahead),
+            )
+        else:
+            tables = detach_partitions(connection, args.before, args.drop)
+
+    for table in tables:
+        print(table)
+
+
+if __name__ == "__main__":
+    main()
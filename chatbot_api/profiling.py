@@ -0,0 +1,133 @@
+"""Per-request database query accounting and slow-query logging.
+
+`QueryProfiler` listens to the cursor execute events of every engine, the
+async ones included, since these run their sync engine underneath. The
+statements of a request are accounted to the `QueryStats` that
+`QueryProfilerMiddleware` puts in a context variable, which is propagated
+to the threadpool and to the greenlets of `AsyncSession.run_sync`.
+"""
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Optional, Type, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "query_stats",
+    default=None,
+)
+
+
+def parameters_shape(parameters: Any) -> Any:
+    """Describe statement parameters by their types only, since their
+    values are customer data."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: one set of parameters per row.
+            return {
+                "rows": len(parameters),
+                "row": parameters_shape(parameters[0]),
+            }
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class QueryProfiler:
+    def __init__(self, slow_query_ms: Optional[float] = None):
+        self.slow_query_ms = slow_query_ms
+
+    def _listeners(self):
+        return [
+            ("before_cursor_execute", self._before_cursor_execute),
+            ("after_cursor_execute", self._after_cursor_execute),
+        ]
+
+    def install(self, target: Union[Engine, Type[Engine]] = Engine) -> None:
+        for identifier, listener in self._listeners():
+            if not event.contains(target, identifier, listener):
+                event.listen(target, identifier, listener)
+
+    def remove(self, target: Union[Engine, Type[Engine]] = Engine) -> None:
+        for identifier, listener in self._listeners():
+            if event.contains(target, identifier, listener):
+                event.remove(target, identifier, listener)
+
+    def _before_cursor_execute(
+            self, conn, cursor, statement, parameters, context, executemany,
+    ) -> None:
+        # Kept on the execution context rather than on the connection, so
+        # that failed statements leave nothing behind.
+        context._query_start = time.perf_counter()
+
+    def _after_cursor_execute(
+            self, conn, cursor, statement, parameters, context, executemany,
+    ) -> None:
+        duration = time.perf_counter() - context._query_start
+
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.duration += duration
+
+        duration_ms = duration * 1000
+        if self.slow_query_ms is not None and duration_ms >= self.slow_query_ms:
+            logger.warning(
+                json.dumps(
+                    {
+                        "event": "slow_query",
+                        "duration_ms": round(duration_ms, 3),
+                        "statement": statement,
+                        "parameters": parameters_shape(parameters),
+                        "executemany": executemany,
+                    }
+                )
+            )
+
+
+class QueryProfilerMiddleware:
+    """Return the number of statements of a request and the time they took
+    in the `X-DB-Queries` and `X-DB-Time-ms` response headers.
+
+    Headers are sent before the body: the statements of a streamed body
+    are not accounted.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Queries"] = str(stats.count)
+                headers["X-DB-Time-ms"] = f"{stats.duration * 1000:.3f}"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _query_stats.reset(token)
+
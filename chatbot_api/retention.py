@@ -0,0 +1,114 @@
+"""Retention purge of the dialogues that never receive a consent answer.
+
+Their inputs are deleted once the dialogue has been idle for
+`RETENTION_PENDING_TTL_SECONDS`, in chunks of `RETENTION_PURGE_CHUNK_SIZE`
+rows, each in its own short transaction. The purge runs periodically
+inside the app, or as a one-off from cron:
+
+    python -m chatbot_api.retention --ttl-seconds 604800
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .crud import delete_stale_pending_user_inputs
+from .database import SessionLocal, get_engine
+from .metrics import PURGE_CHUNK_DURATION, PURGED_INPUTS
+from .sharding import get_shards
+
+logger = logging.getLogger(__name__)
+
+
+def purge_pending_inputs(
+        session_factory: Callable[[], Session],
+        ttl_seconds: int,
+        chunk_size: int,
+        pause_seconds: float = 0.0,
+) -> List[Dict]:
+    """Delete the stale pending inputs chunk by chunk, and report the rows
+    purged and the time taken by each chunk."""
+    created_before = datetime.now(timezone.utc) - timedelta(seconds=ttl_seconds)
+    chunks = []
+    with session_factory() as db:
+        while True:
+            start = time.perf_counter()
+            purged = delete_stale_pending_user_inputs(db, created_before, chunk_size)
+            duration = time.perf_counter() - start
+
+            PURGED_INPUTS.inc(purged)
+            PURGE_CHUNK_DURATION.observe(duration)
+            chunks.append({"rows": purged, "duration_ms": duration * 1000})
+            logger.info(
+                "Purged %d pending inputs in %.1f ms",
+                purged,
+                duration * 1000,
+            )
+
+            if purged < chunk_size:
+                return chunks
+            # Let replication and vacuum keep up between chunks.
+            time.sleep(pause_seconds)
+
+
+async def run_purge_periodically() -> None:
+    while True:
+        shards = get_shards()
+        session_factories = [SessionLocal] if shards is None else shards.session_factories
+        for session_factory in session_factories:
+            try:
+                await run_in_threadpool(
+                    purge_pending_inputs,
+                    session_factory,
+                    settings.RETENTION_PENDING_TTL_SECONDS,
+                    settings.RETENTION_PURGE_CHUNK_SIZE,
+                    settings.RETENTION_PURGE_PAUSE_SECONDS,
+                )
+            except Exception:
+                logger.exception("Retention purge failed")
+        await asyncio.sleep(settings.RETENTION_PURGE_INTERVAL_SECONDS)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--ttl-seconds",
+        type=int,
+        default=settings.RETENTION_PENDING_TTL_SECONDS,
+        required=settings.RETENTION_PENDING_TTL_SECONDS is None,
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=settings.RETENTION_PURGE_CHUNK_SIZE,
+    )
+    parser.add_argument(
+        "--pause-seconds",
+        type=float,
+        default=settings.RETENTION_PURGE_PAUSE_SECONDS,
+    )
+    args = parser.parse_args()
+
+    get_engine()
+    chunks = purge_pending_inputs(
+        SessionLocal,
+        args.ttl_seconds,
+        args.chunk_size,
+        args.pause_seconds,
+    )
+    for index, chunk in enumerate(chunks):
+        print(f"chunk {index}: {chunk['rows']} rows in {chunk['duration_ms']:.1f} ms")
+    print(f"total: {sum(chunk['rows'] for chunk in chunks)} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
+from datetime import date
 from enum import Enum
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel
 
@@ -21,6 +22,24 @@ class CompleteCustomerInput(CustomerInput):
     dialogue_id: int
 
 
+class CustomerInputBatch(BaseModel):
+    # Items are validated one by one so that a single bad record does not
+    # reject the whole batch.
+    inputs: List[Dict[str, Any]]
+
+
+class BatchItemError(BaseModel):
+    index: int
+    errors: List[Dict[str, Any]]
+
+
+class CustomerInputBatchResponse(BaseModel):
+    inserted: int
+    # Inputs already stored under the same dedup key, hence not inserted.
+    duplicates: int = 0
+    errors: List[BatchItemError]
+
+
 class CustomerConsent(BaseModel):
     consent: bool
 
@@ -38,5 +57,70 @@ class CustomerInputResponse(BaseModel):
     results: List[DatabaseCustomerInputRecord]
 
 
+class ChangeOperation(str, Enum):
+    upsert = "upsert"
+    delete = "delete"
+
+
+class DialogueChange(BaseModel):
+    change_id: int
+    operation: ChangeOperation
+    dialogue_id: int
+    # The current consented inputs of the dialogue for upserts, none for
+    # deletes.
+    inputs: List[DatabaseCustomerInputRecord]
+
+
+class ChangeFeedResponse(BaseModel):
+    changes: List[DialogueChange]
+    # Cursor of the next call.
+    last_change_id: int
+
+
+class StatsDimension(str, Enum):
+    total = "total"
+    language = "language"
+    customer = "customer"
+    day = "day"
+
+
+class InputCounters(BaseModel):
+    inputs: int
+    characters: int
+    mean_length: float
+
+
+class LengthBucket(BaseModel):
+    min_length: int
+    # Exclusive, unbounded for the last bucket.
+    max_length: Optional[int]
+    inputs: int
+
+
+class InputStatsResponse(InputCounters):
+    by_language: Dict[SupportedLanguages, InputCounters]
+    by_day: Dict[date, InputCounters]
+    # Only the customer of the `customer_id` filter, if any.
+    by_customer: Dict[int, InputCounters]
+    length_histogram: List[LengthBucket]
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    arrow = "arrow"
+    parquet = "parquet"
+
+
+class PoolStatus(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    wait_count: int
+    wait_time_total_ms: float
+    wait_time_max_ms: float
+    timeouts: int
+
+
 class Error(BaseModel):
     error: str
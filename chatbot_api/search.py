@@ -0,0 +1,141 @@
+"""Full-text search over `CustomerInputs.text`.
+
+On PostgreSQL, `user_inputs.search_vector` is a generated `tsvector`
+column, built with the text search configuration of each input's
+language, and indexed with GIN over consented inputs. On SQLite, an FTS5
+external content table, kept up to date by triggers, stands in for it.
+
+Neither is mapped on `CustomerInputs`: both are created along with the
+table, and queried through `apply_search`.
+"""
+from typing import List, Optional
+
+from sqlalchemy import DDL, event, func, literal_column, or_, table, text
+from sqlalchemy.sql import Select
+
+from .models import CustomerInputs
+from .schemas import SupportedLanguages
+
+TEXT_SEARCH_CONFIGS = {
+    SupportedLanguages.english: "english",
+    SupportedLanguages.french: "french",
+    SupportedLanguages.german: "german",
+    SupportedLanguages.italian: "italian",
+}
+
+_CONFIG_BY_LANGUAGE = " ".join(
+    f"WHEN '{language.name}' THEN '{config}'::regconfig"
+    for language, config in TEXT_SEARCH_CONFIGS.items()
+)
+
+POSTGRESQL_DDL = [
+    f"ALTER TABLE user_inputs ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    f"GENERATED ALWAYS AS (to_tsvector(CASE language {_CONFIG_BY_LANGUAGE} "
+    f"END, text)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_user_inputs_consented_search_vector "
+    "ON user_inputs USING gin (search_vector) WHERE consent IS true",
+]
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_inputs_fts USING fts5("
+    "text, content='user_inputs', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS user_inputs_fts_insert "
+    "AFTER INSERT ON user_inputs "
+    "BEGIN INSERT INTO user_inputs_fts (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS user_inputs_fts_delete "
+    "AFTER DELETE ON user_inputs "
+    "BEGIN INSERT INTO user_inputs_fts (user_inputs_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS user_inputs_fts_update "
+    "AFTER UPDATE OF text ON user_inputs "
+    "BEGIN INSERT INTO user_inputs_fts (user_inputs_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO user_inputs_fts (rowid, text) VALUES (new.id, new.text); END",
+]
+
+for statement in POSTGRESQL_DDL:
+    event.listen(
+        CustomerInputs.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
+for statement in SQLITE_DDL:
+    event.listen(
+        CustomerInputs.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="sqlite"),
+    )
+event.listen(
+    CustomerInputs.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS user_inputs_fts").execute_if(dialect="sqlite"),
+)
+
+
+def _postgresql_search(
+        statement: Select,
+        query: str,
+        languages: List[SupportedLanguages],
+) -> Select:
+    search_vector = literal_column("user_inputs.search_vector")
+    # One condition per language, each with a constant `tsquery`, so that
+    # every branch can use the GIN index.
+    matches = []
+    ranks = []
+    for language in languages:
+        ts_query = func.websearch_to_tsquery(
+            literal_column(f"'{TEXT_SEARCH_CONFIGS[language]}'::regconfig"),
+            query,
+        )
+        matches.append(
+            (CustomerInputs.language == language)
+            & search_vector.op("@@")(ts_query)
+        )
+        ranks.append(func.ts_rank_cd(search_vector, ts_query))
+    rank = ranks[0] if len(ranks) == 1 else func.greatest(*ranks)
+    return statement \
+        .filter(or_(*matches)) \
+        .order_by(rank.desc(), CustomerInputs.id.desc())
+
+
+def _fts5_query(query: str) -> str:
+    # Every word as a quoted string: user input never hits the FTS5 query
+    # syntax, and all the words have to match.
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def _sqlite_search(
+        statement: Select,
+        query: str,
+        languages: List[SupportedLanguages],
+) -> Select:
+    fts_rowid = literal_column("user_inputs_fts.rowid")
+    statement = statement \
+        .join(table("user_inputs_fts"), fts_rowid == CustomerInputs.id) \
+        .filter(
+            text("user_inputs_fts MATCH :fts_query")
+            .bindparams(fts_query=_fts5_query(query))
+        )
+    if len(languages) == 1:
+        statement = statement.filter(CustomerInputs.language == languages[0])
+    return statement.order_by(
+        literal_column("bm25(user_inputs_fts)"),
+        CustomerInputs.id.desc(),
+    )
+
+
+def apply_search(
+        statement: Select,
+        dialect_name: str,
+        query: str,
+        language: Optional[SupportedLanguages] = None,
+) -> Select:
+    """Restrict a select over `user_inputs` to the inputs matching `query`,
+    best matches first."""
+    languages = list(TEXT_SEARCH_CONFIGS) if language is None else [language]
+    if dialect_name == "postgresql":
+        return _postgresql_search(statement, query, languages)
+    if dialect_name == "sqlite":
+        return _sqlite_search(statement, query, languages)
+    raise NotImplementedError(f"Full-text search is not supported on {dialect_name}")
@@ -0,0 +1,128 @@
+"""Straight-to-bytes JSON encoding of `user_inputs` rows.
+
+The read paths select plain column tuples and encode them with `orjson`,
+skipping ORM objects, `as_dict` and pydantic revalidation.
+"""
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+)
+
+import orjson
+from sqlalchemy.engine import Row
+
+from .schemas import ChangeOperation, StatsDimension, SupportedLanguages
+
+
+def customer_input_response_json(rows: List[Row]) -> bytes:
+    # Same document as `CustomerInputResponse`.
+    return orjson.dumps(
+        {
+            "results_number": len(rows),
+            "results": [row._asdict() for row in rows],
+        }
+    )
+
+
+def change_feed_json(
+        changes: List[Row],
+        input_rows: List[Row],
+        since_id: int,
+) -> bytes:
+    # Same document as `ChangeFeedResponse`.
+    inputs_by_dialogue_id: Dict[int, List[Dict]] = {}
+    for row in input_rows:
+        inputs_by_dialogue_id.setdefault(row.dialogue_id, []).append(row._asdict())
+    return orjson.dumps(
+        {
+            "changes": [
+                {
+                    "change_id": change.id,
+                    "operation": change.operation,
+                    "dialogue_id": change.dialogue_id,
+                    "inputs": (
+                        inputs_by_dialogue_id.get(change.dialogue_id, [])
+                        if change.operation == ChangeOperation.upsert
+                        else []
+                    ),
+                }
+                for change in changes
+            ],
+            "last_change_id": changes[-1].id if changes else since_id,
+        }
+    )
+
+
+def _input_counters(inputs: int, characters: int) -> Dict:
+    return {
+        "inputs": inputs,
+        "characters": characters,
+        "mean_length": characters / inputs if inputs else 0.0,
+    }
+
+
+def input_stats_json(
+        counters: List[Row],
+        histogram: List[Row],
+        length_buckets: Sequence[int],
+        customer_id: Optional[int] = None,
+) -> bytes:
+    # Same document as `InputStatsResponse`.
+    totals = {"inputs": 0, "characters": 0}
+    by_dimension: Dict[str, Dict[str, Dict]] = {
+        StatsDimension.language.value: {},
+        StatsDimension.day.value: {},
+        StatsDimension.customer.value: {},
+    }
+    for row in counters:
+        if row.dimension == StatsDimension.total:
+            totals = {"inputs": row.inputs, "characters": row.characters}
+        elif row.inputs:
+            by_dimension[row.dimension][row.key] = _input_counters(
+                row.inputs,
+                row.characters,
+            )
+    by_customer = {}
+    if customer_id is not None:
+        by_customer[str(customer_id)] = by_dimension[StatsDimension.customer.value].get(
+            str(customer_id),
+            _input_counters(0, 0),
+        )
+    inputs_by_bucket = {row.bucket: row.inputs for row in histogram}
+    upper_bounds = list(length_buckets[1:]) + [None]
+    return orjson.dumps(
+        {
+            **_input_counters(totals["inputs"], totals["characters"]),
+            "by_language": {
+                language.value: by_dimension[StatsDimension.language.value][language.value]
+                for language in SupportedLanguages
+                if language.value in by_dimension[StatsDimension.language.value]
+            },
+            "by_day": dict(sorted(by_dimension[StatsDimension.day.value].items())),
+            "by_customer": by_customer,
+            "length_histogram": [
+                {
+                    "min_length": lower_bound,
+                    "max_length": upper_bound,
+                    "inputs": inputs_by_bucket.get(lower_bound, 0),
+                }
+                for lower_bound, upper_bound in zip(length_buckets, upper_bounds)
+            ],
+        }
+    )
+
+
+def ndjson_lines(rows: Iterable[Row]) -> Iterator[bytes]:
+    for row in rows:
+        yield orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE)
+
+
+async def async_ndjson_lines(rows: AsyncIterable[Row]) -> AsyncIterator[bytes]:
+    async for row in rows:
+        yield orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE)
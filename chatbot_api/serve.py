@@ -0,0 +1,177 @@
+"""Production server: gunicorn managing uvicorn worker processes.
+
+    python -m chatbot_api.serve [--workers 4] [--max-connections 80]
+
+Workers default to one per available core. Each of them has its own
+connection pool, so `DATABASE_MAX_CONNECTIONS`, when set, is divided
+between them to stay below the PostgreSQL `max_connections`; in async mode,
+one connection per worker is kept for its sync engine, which runs the
+migrations and the retention purge. On SIGTERM,
+workers stop accepting connections and drain their in-flight requests for
+up to `SERVER_GRACEFUL_TIMEOUT` seconds; they are also recycled after
+`SERVER_MAX_REQUESTS` requests. The in-memory staging store lives in a
+single process, so it refuses to be served by several workers.
+"""
+import argparse
+import glob
+import os
+import tempfile
+from typing import Dict, Optional, Tuple
+
+from .config import settings
+
+APP = f"{__package__}.main:app"
+
+
+def available_cpus() -> int:
+    """Cores this process may run on, within the cgroup CPU quota of a
+    container if any."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+    except (OSError, ValueError):
+        return cpus
+    if quota == "max":
+        return cpus
+    return max(1, min(cpus, int(quota) // int(period)))
+
+
+def worker_pool_options(
+        max_connections: int,
+        workers: int,
+        pool_size: int,
+        reserved: int = 0,
+) -> Tuple[int, int]:
+    """Split the connection budget of a worker, less the `reserved`
+    connections it opens outside of its pool, between its pool and its
+    overflow, keeping at most `pool_size` connections open when idle."""
+    per_worker = max_connections // workers - reserved
+    if per_worker < 1:
+        raise ValueError(
+            f"{max_connections} connections cannot be shared by {workers} workers"
+        )
+    worker_pool_size = min(pool_size, per_worker)
+    return worker_pool_size, per_worker - worker_pool_size
+
+
+def check_staging_backend(staging_backend: Optional[str], workers: int) -> None:
+    # A consent call reaching another worker than the inputs of its
+    # dialogue would find nothing staged.
+    if staging_backend == "memory" and workers > 1:
+        raise ValueError(
+            f"STAGING_BACKEND=memory is per process: use the redis backend "
+            f"with {workers} workers, or --workers 1"
+        )
+
+
+def _prepare_multiprocess_metrics() -> None:
+    # Every worker writes its metrics there, and `GET /metrics` aggregates
+    # them. Files of a previous run would be counted again.
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="chatbot-api-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+
+
+def _child_exit(server, worker) -> None:
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def gunicorn_options(
+        workers: int,
+        host: str,
+        port: int,
+        max_requests: int,
+        max_requests_jitter: int,
+        graceful_timeout: int,
+) -> Dict:
+    return {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "max_requests": max_requests,
+        # Workers started together are not all recycled at once.
+        "max_requests_jitter": max_requests_jitter,
+        "graceful_timeout": graceful_timeout,
+        # The app is imported by each worker after the fork, so that no
+        # database connection is shared between processes.
+        "preload_app": False,
+        "child_exit": _child_exit,
+        "accesslog": "-",
+    }
+
+
+def run(options: Dict) -> None:
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+
+    class Server(BaseApplication):
+        def load_config(self) -> None:
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return import_app(APP)
+
+    Server().run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=settings.DATABASE_MAX_CONNECTIONS,
+        help="database connections of all the workers together",
+    )
+    args = parser.parse_args()
+
+    workers = args.workers or available_cpus()
+    try:
+        check_staging_backend(settings.STAGING_BACKEND, workers)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.max_connections is not None:
+        try:
+            pool_size, max_overflow = worker_pool_options(
+                args.max_connections,
+                workers,
+                settings.DATABASE_POOL_SIZE,
+                reserved=1 if settings.DATABASE_ASYNC else 0,
+            )
+        except ValueError as exc:
+            parser.error(str(exc))
+        # Inherited by the workers, which build their engine after the fork.
+        settings.DATABASE_POOL_SIZE = pool_size
+        settings.DATABASE_MAX_OVERFLOW = max_overflow
+    _prepare_multiprocess_metrics()
+
+    run(
+        gunicorn_options(
+            workers=workers,
+            host=args.host,
+            port=args.port,
+            max_requests=settings.SERVER_MAX_REQUESTS,
+            max_requests_jitter=settings.SERVER_MAX_REQUESTS_JITTER,
+            graceful_timeout=settings.SERVER_GRACEFUL_TIMEOUT,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Hash sharding of `user_inputs` by `customer_id` over several databases.
+
+New inputs of a customer go to the shard picked by a hash of its id, so
+that ingestion only hits one database. Appending a shard moves some
+customers to it while their older rows stay where they were written: reads
+therefore query every shard at once, a customer's too, and merge their
+results. Consent calls only know the dialogue, whose inputs may live on
+several shards: they run on every shard at once as well, each an index
+lookup by dialogue, rather than keeping a directory of the dialogues that
+every ingestion would write to.
+
+Ids are only unique within a shard. Rows are served with global ids,
+`local_id * SHARD_ID_STRIDE + shard`, which interleave the shards in the
+order of their local ids, and from which `after_id` cursors are decoded.
+
+Every shard holds the whole schema, and keeps its own change feed and
+stats for its customers. Setting `DATABASE_SHARD_URLS` serves the
+ingestion, consent and `GET /data` routes from the shards, migrates them
+at startup and runs the retention purge on each of them.
+"""
+import hashlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import crud
+from .config import settings
+from .database import create_pooled_engine
+from .schemas import CompleteCustomerInput, SupportedLanguages
+
+ResultT = TypeVar("ResultT")
+
+# Upper bound of the number of shards, fixed so that global ids do not
+# change when shards are added.
+SHARD_ID_STRIDE = 1024
+
+
+class CustomerInputRow(NamedTuple):
+    id: int
+    customer_id: int
+    dialogue_id: int
+    language: SupportedLanguages
+    text: str
+
+
+def shard_index(customer_id: int, shard_count: int) -> int:
+    """Jump consistent hash of the customer id: going from n to n + 1
+    shards only moves the customers landing on the new shard."""
+    key = int.from_bytes(
+        hashlib.blake2b(str(customer_id).encode(), digest_size=8).digest(),
+        "big",
+    )
+    shard, candidate = -1, 0
+    while candidate < shard_count:
+        shard = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((shard + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return shard
+
+
+def global_id(local_id: int, shard: int) -> int:
+    return local_id * SHARD_ID_STRIDE + shard
+
+
+def local_after_id(after_id: int, shard: int) -> int:
+    # The local ids of `shard` whose global id is lower than `after_id`.
+    return (after_id - shard - 1) // SHARD_ID_STRIDE + 1
+
+
+class ShardedDatabase:
+    def __init__(self, session_factories: Sequence[sessionmaker]):
+        if not 0 < len(session_factories) <= SHARD_ID_STRIDE:
+            raise ValueError(f"Between 1 and {SHARD_ID_STRIDE} shards are supported")
+        self.session_factories = list(session_factories)
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(self.session_factories),
+            thread_name_prefix="shard",
+        )
+
+    @classmethod
+    def from_urls(cls, urls: Sequence[str]) -> "ShardedDatabase":
+        return cls(
+            [
+                sessionmaker(
+                    autocommit=False,
+                    autoflush=False,
+                    bind=create_pooled_engine(url),
+                )
+                for url in urls
+            ]
+        )
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.session_factories)
+
+    @property
+    def engines(self) -> List[Engine]:
+        return [factory.kw["bind"] for factory in self.session_factories]
+
+    def shard_of(self, customer_id: int) -> int:
+        return shard_index(customer_id, self.shard_count)
+
+    def run(self, shard: int, function: Callable[[Session], ResultT]) -> ResultT:
+        with self.session_factories[shard]() as db:
+            return function(db)
+
+    def scatter(
+            self,
+            function: Callable[[Session, int], ResultT],
+            shards: Optional[Iterable[int]] = None,
+    ) -> List[ResultT]:
+        """Run `function(db, shard)` on the shards concurrently, each in its
+        own session, and return the results in shard order."""
+        if shards is None:
+            shards = range(self.shard_count)
+        futures = [
+            self._executor.submit(
+                self.run,
+                shard,
+                lambda db, shard=shard: function(db, shard),
+            )
+            for shard in shards
+        ]
+        return [future.result() for future in futures]
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+
+def create_user_inputs(
+        shards: ShardedDatabase,
+        customer_inputs: List[CompleteCustomerInput],
+        consent: bool = False,
+        dedup_keys: Optional[List[str]] = None,
+) -> int:
+    inputs_by_shard: Dict[int, List[CompleteCustomerInput]] = {}
+    keys_by_shard: Dict[int, List[str]] = {}
+    for index, customer_input in enumerate(customer_inputs):
+        shard = shards.shard_of(customer_input.customer_id)
+        inputs_by_shard.setdefault(shard, []).append(customer_input)
+        if dedup_keys is not None:
+            keys_by_shard.setdefault(shard, []).append(dedup_keys[index])
+
+    return sum(
+        shards.scatter(
+            lambda db, shard: crud.create_user_inputs(
+                db,
+                inputs_by_shard[shard],
+                consent=consent,
+                dedup_keys=keys_by_shard.get(shard),
+            ),
+            sorted(inputs_by_shard),
+        )
+    )
+
+
+def create_user_input(
+        shards: ShardedDatabase,
+        customer_input: CompleteCustomerInput,
+) -> None:
+    shards.run(
+        shards.shard_of(customer_input.customer_id),
+        lambda db: crud.create_user_input(db, customer_input),
+    )
+
+
+def read_customer_input_rows(
+        shards: ShardedDatabase,
+        customer_id: Optional[int] = None,
+        language: Optional[SupportedLanguages] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+) -> List[CustomerInputRow]:
+    """Same as `crud.read_customer_input_rows`, with global ids, merged
+    from all the shards."""
+
+    def read(db: Session, shard: int) -> List[CustomerInputRow]:
+        rows = crud.read_customer_input_rows(
+            db,
+            customer_id=customer_id,
+            language=language,
+            limit=limit,
+            after_id=None if after_id is None else local_after_id(after_id, shard),
+            since=since,
+            until=until,
+        )
+        return [
+            CustomerInputRow(global_id(row.id, shard), *row[1:])
+            for row in rows
+        ]
+
+    # Each shard returns its own first page, already ordered by id: the
+    # first page overall is among them.
+    merged = heapq.merge(
+        *shards.scatter(read),
+        key=lambda row: row.id,
+        reverse=True,
+    )
+    return list(islice(merged, limit))
+
+
+def grant_consent_by_dialogue_id(shards: ShardedDatabase, dialogue_id: int) -> int:
+    return sum(
+        shards.scatter(
+            lambda db, shard: crud.grant_consent_by_dialogue_id(db, dialogue_id),
+        )
+    )
+
+
+def delete_user_input_by_dialogue_id(shards: ShardedDatabase, dialogue_id: int) -> int:
+    return sum(
+        shards.scatter(
+            lambda db, shard: crud.delete_user_input_by_dialogue_id(db, dialogue_id),
+        )
+    )
+
+
+@lru_cache()
+def get_shards() -> Optional[ShardedDatabase]:
+    if not settings.DATABASE_SHARD_URLS:
+        return None
+    # Staged inputs are stored by the consent call of a single database.
+    if settings.STAGING_BACKEND is not None:
+        raise ValueError("DATABASE_SHARD_URLS does not support STAGING_BACKEND.")
+    return ShardedDatabase.from_urls(settings.DATABASE_SHARD_URLS)
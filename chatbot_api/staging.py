@@ -0,0 +1,236 @@
+import logging
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, List, Optional
+
+from .config import settings
+from .schemas import CompleteCustomerInput
+
+logger = logging.getLogger(__name__)
+
+# Rough size of the pydantic model and list slot around each input's text.
+_INPUT_OVERHEAD_BYTES = 200
+
+
+class StagingStore(ABC):
+    """Holds the inputs of a dialogue until its consent is known, so that
+    declined dialogues never reach the database."""
+
+    @abstractmethod
+    def add(self, customer_input: CompleteCustomerInput) -> None:
+        ...
+
+    def add_many(self, customer_inputs: List[CompleteCustomerInput]) -> None:
+        for customer_input in customer_inputs:
+            self.add(customer_input)
+
+    @abstractmethod
+    def pop(self, dialogue_id: int) -> List[CompleteCustomerInput]:
+        """Remove and return the staged inputs of a dialogue."""
+
+    @abstractmethod
+    def peek(self, dialogue_id: int) -> List[CompleteCustomerInput]:
+        """Return the staged inputs of a dialogue, leaving them staged."""
+
+    @abstractmethod
+    def remove(self, dialogue_id: int, count: int) -> None:
+        """Remove the first `count` staged inputs of a dialogue, once they
+        were stored: the ones staged since `peek` stay."""
+
+    @abstractmethod
+    def discard(self, dialogue_id: int) -> int:
+        """Drop the staged inputs of a dialogue and return their number."""
+
+
+@dataclass
+class _StagedDialogue:
+    expires_at: float
+    size: int = 0
+    inputs: List[CompleteCustomerInput] = field(default_factory=list)
+
+
+class InMemoryStagingStore(StagingStore):
+    """Process-local store. Dialogues expire `ttl_seconds` after their last
+    input, and the least recently updated ones are evicted once the staged
+    inputs take more than `max_bytes`."""
+
+    def __init__(
+            self,
+            ttl_seconds: float,
+            max_bytes: int,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._dialogues: "OrderedDict[int, _StagedDialogue]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._dialogues)
+
+    def add(self, customer_input: CompleteCustomerInput) -> None:
+        now = self._clock()
+        size = _input_size(customer_input)
+        with self._lock:
+            self._expire(now)
+            dialogue = self._dialogues.get(customer_input.dialogue_id)
+            if dialogue is None:
+                dialogue = _StagedDialogue(expires_at=0)
+                self._dialogues[customer_input.dialogue_id] = dialogue
+            dialogue.expires_at = now + self.ttl_seconds
+            dialogue.size += size
+            dialogue.inputs.append(customer_input)
+            self._dialogues.move_to_end(customer_input.dialogue_id)
+            self._size += size
+            self._evict()
+
+    def pop(self, dialogue_id: int) -> List[CompleteCustomerInput]:
+        with self._lock:
+            self._expire(self._clock())
+            dialogue = self._dialogues.pop(dialogue_id, None)
+            if dialogue is None:
+                return []
+            self._size -= dialogue.size
+            return dialogue.inputs
+
+    def peek(self, dialogue_id: int) -> List[CompleteCustomerInput]:
+        with self._lock:
+            self._expire(self._clock())
+            dialogue = self._dialogues.get(dialogue_id)
+            return [] if dialogue is None else list(dialogue.inputs)
+
+    def remove(self, dialogue_id: int, count: int) -> None:
+        with self._lock:
+            dialogue = self._dialogues.get(dialogue_id)
+            if dialogue is None:
+                return
+            removed = dialogue.inputs[:count]
+            del dialogue.inputs[:count]
+            size = sum(_input_size(customer_input) for customer_input in removed)
+            dialogue.size -= size
+            self._size -= size
+            if not dialogue.inputs:
+                del self._dialogues[dialogue_id]
+
+    def discard(self, dialogue_id: int) -> int:
+        return len(self.pop(dialogue_id))
+
+    def _expire(self, now: float) -> None:
+        # Dialogues are kept in order of their last update, so the expired
+        # ones are always at the front.
+        while self._dialogues:
+            dialogue_id, dialogue = next(iter(self._dialogues.items()))
+            if dialogue.expires_at > now:
+                break
+            self._drop(dialogue_id)
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._dialogues) > 1:
+            dialogue_id = next(iter(self._dialogues))
+            logger.warning(
+                "Staging store is full, evicting dialogue %s.",
+                dialogue_id,
+            )
+            self._drop(dialogue_id)
+
+    def _drop(self, dialogue_id: int) -> None:
+        self._size -= self._dialogues.pop(dialogue_id).size
+
+
+class RedisStagingStore(StagingStore):
+    """Store shared between processes, backed by one Redis list per dialogue.
+
+    Works with any client exposing the `redis-py` API. The memory cap and
+    eviction are those of the Redis server (`maxmemory` together with the
+    `volatile-ttl` or `volatile-lru` policy), since every key has a TTL.
+    """
+
+    def __init__(
+            self,
+            client: Any,
+            ttl_seconds: int,
+            key_prefix: str = "chatbot_api:staging:",
+    ):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl_seconds: int) -> "RedisStagingStore":
+        import redis
+
+        return cls(redis.Redis.from_url(url), ttl_seconds)
+
+    def _key(self, dialogue_id: int) -> str:
+        return f"{self.key_prefix}{dialogue_id}"
+
+    def add(self, customer_input: CompleteCustomerInput) -> None:
+        key = self._key(customer_input.dialogue_id)
+        pipeline = self.client.pipeline()
+        pipeline.rpush(key, customer_input.json())
+        pipeline.expire(key, self.ttl_seconds)
+        pipeline.execute()
+
+    def add_many(self, customer_inputs: List[CompleteCustomerInput]) -> None:
+        pipeline = self.client.pipeline()
+        for customer_input in customer_inputs:
+            key = self._key(customer_input.dialogue_id)
+            pipeline.rpush(key, customer_input.json())
+            pipeline.expire(key, self.ttl_seconds)
+        pipeline.execute()
+
+    def pop(self, dialogue_id: int) -> List[CompleteCustomerInput]:
+        key = self._key(dialogue_id)
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.lrange(key, 0, -1)
+        pipeline.delete(key)
+        staged, _ = pipeline.execute()
+        return [CompleteCustomerInput.parse_raw(raw) for raw in staged]
+
+    def peek(self, dialogue_id: int) -> List[CompleteCustomerInput]:
+        staged = self.client.lrange(self._key(dialogue_id), 0, -1)
+        return [CompleteCustomerInput.parse_raw(raw) for raw in staged]
+
+    def remove(self, dialogue_id: int, count: int) -> None:
+        # Inputs are appended to the list: the first `count` ones were peeked.
+        self.client.ltrim(self._key(dialogue_id), count, -1)
+
+    def discard(self, dialogue_id: int) -> int:
+        key = self._key(dialogue_id)
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.llen(key)
+        pipeline.delete(key)
+        staged_number, _ = pipeline.execute()
+        return staged_number
+
+
+def _input_size(customer_input: CompleteCustomerInput) -> int:
+    return sys.getsizeof(customer_input.text) + _INPUT_OVERHEAD_BYTES
+
+
+@lru_cache()
+def get_staging() -> Optional[StagingStore]:
+    if settings.STAGING_BACKEND is None:
+        return None
+    if settings.STAGING_BACKEND == "memory":
+        return InMemoryStagingStore(
+            ttl_seconds=settings.STAGING_TTL_SECONDS,
+            max_bytes=settings.STAGING_MAX_BYTES,
+        )
+    if settings.STAGING_BACKEND == "redis":
+        return RedisStagingStore.from_url(
+            settings.STAGING_REDIS_URL,
+            ttl_seconds=settings.STAGING_TTL_SECONDS,
+        )
+    raise ValueError(f"Unknown staging backend {settings.STAGING_BACKEND!r}.")
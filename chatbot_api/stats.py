@@ -0,0 +1,35 @@
+"""Rebuild of the input stats served by `GET /data/stats`.
+
+The counters are kept up to date by the consent calls, in the transactions
+that make inputs visible or delete them. Should they drift, e.g. after
+inputs were changed by hand, recount them from the consented inputs:
+
+    python -m chatbot_api.stats rebuild
+"""
+import argparse
+import time
+
+from sqlalchemy.orm import Session
+
+from .crud import rebuild_input_stats
+from .database import get_engine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild")
+    parser.parse_args()
+
+    start = time.perf_counter()
+    with Session(get_engine()) as db:
+        counted = rebuild_input_stats(db)
+    duration = time.perf_counter() - start
+    print(f"counted {counted} inputs in {duration:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
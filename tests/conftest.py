@@ -3,18 +3,28 @@ import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
+from chatbot_api.config import settings
 from chatbot_api.database import Base
 from chatbot_api.main import app, get_db
 
 
+@pytest.fixture(scope="session", autouse=True)
+def skip_startup_migrations():
+    # The tests create their own databases: the app's one is not reachable.
+    settings.DATABASE_MIGRATE_ON_STARTUP = False
+
+
 @pytest.fixture(scope="session")
 def db():
     SQLALCHEMY_DATABASE_URL = "sqlite://"
 
     engine = create_engine(
         SQLALCHEMY_DATABASE_URL,
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False},
+        # A single connection, so that every thread sees the same database.
+        poolclass=StaticPool,
     )
 
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
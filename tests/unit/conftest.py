@@ -1,6 +1,6 @@
 import pytest
 
-from chatbot_api.models import CustomerInputs
+from chatbot_api.models import CustomerInputs, InputLengthHistogram, InputStats
 
 
 @pytest.fixture(scope="function")
@@ -12,3 +12,6 @@ def test_records(db, records):
         db.refresh(input_)
     yield
     db.query(CustomerInputs).delete()
+    db.query(InputStats).delete()
+    db.query(InputLengthHistogram).delete()
+    db.commit()
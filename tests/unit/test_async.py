@@ -0,0 +1,99 @@
+import pytest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from chatbot_api.config import settings
+from chatbot_api.database import Base, get_async_db, get_db
+from chatbot_api.main import async_router, router
+
+pytest.importorskip("aiosqlite")
+
+REQUESTS = [
+    ("post", "/data/123/321", {"text": "foo", "language": "EN"}),
+    ("post", "/data/124/334", {"text": "bar", "language": "FR"}),
+    ("post", "/data/124/334", {"text": "baz", "language": "IT"}),
+    (
+        "post",
+        "/data/batch",
+        {
+            "inputs": [
+                {"customer_id": 125, "dialogue_id": 336, "text": "qux", "language": "FR"},
+                {"customer_id": 125, "dialogue_id": 336, "text": "quux", "language": "XX"},
+            ],
+        },
+    ),
+    ("get", "/data", None),
+    ("get", "/data?customer_id=124", None),
+    ("get", "/data?language=FR&limit=1", None),
+    ("get", "/data?limit=2&after_id=3", None),
+    ("get", "/data?stream=true", None),
+    ("get", "/data/export?format=csv&customer_id=124", None),
+    ("get", "/data/export?format=arrow", None),
+    ("post", "/consents/334", {"consent": False}),
+    ("post", "/consents/321", {"consent": True}),
+    ("post", "/consents/999", {"consent": True}),
+    ("get", "/data", None),
+    ("get", "/data/changes", None),
+    ("get", "/data/stats?customer_id=123", None),
+    ("get", "/data/changes?since_id=1&limit=1", None),
+]
+
+
+def sync_client(tmp_path) -> TestClient:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'sync.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_test_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = get_test_db
+    return TestClient(app)
+
+
+def async_client(tmp_path) -> TestClient:
+    path = tmp_path / "async.db"
+    Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+    TestingAsyncSessionLocal = sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False,
+        class_=AsyncSession,
+        bind=create_async_engine(f"sqlite+aiosqlite:///{path}"),
+    )
+
+    async def get_test_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(async_router)
+    app.dependency_overrides[get_async_db] = get_test_async_db
+    return TestClient(app)
+
+
+def test_async_mode_matches_sync_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_CHANGES_SETTLE_SECONDS", 0)
+
+    with sync_client(tmp_path) as sync, async_client(tmp_path) as async_:
+        for method, url, body in REQUESTS:
+            sync_response = getattr(sync, method)(url, json=body)
+            async_response = getattr(async_, method)(url, json=body)
+
+            assert sync_response.status_code == async_response.status_code, url
+            assert sync_response.headers.get("X-Next-After-Id") == \
+                async_response.headers.get("X-Next-After-Id")
+            assert sync_response.content == async_response.content, url
@@ -0,0 +1,134 @@
+import threading
+import time
+from typing import Any, Dict
+
+import pytest
+
+from chatbot_api.cache import ResponseCache
+from chatbot_api.schemas import SupportedLanguages
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_cache(**kwargs) -> ResponseCache:
+    options: Dict[str, Any] = {"max_entries": 10, "max_bytes": 10 ** 6, "ttl_seconds": 60}
+    options.update(kwargs)
+    return ResponseCache(**options)
+
+
+def counting(value: bytes):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return value, None
+
+    return compute, calls
+
+
+def test_response_cache_hit():
+    cache = make_cache()
+    compute, calls = counting(b"foo")
+
+    assert cache.get_or_compute("key", (None, None), compute) == (b"foo", None)
+    assert cache.get_or_compute("key", (None, None), compute) == (b"foo", None)
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_response_cache_invalidation_by_scope():
+    cache = make_cache()
+    english = SupportedLanguages.english
+    french = SupportedLanguages.french
+    scopes = [(None, None), (123, None), (None, english), (123, english), (124, french)]
+    compute, calls = counting(b"foo")
+    for scope in scopes:
+        cache.get_or_compute(scope, scope, compute)
+
+    cache.invalidate(123, english)
+    for scope in scopes:
+        cache.get_or_compute(scope, scope, compute)
+
+    # Only the (124, FR) entry survived.
+    assert len(calls) == 2 * len(scopes) - 1
+
+    cache.invalidate_all()
+    cache.get_or_compute((124, french), (124, french), compute)
+    assert len(calls) == 2 * len(scopes)
+
+
+def test_response_cache_lru_eviction_and_ttl():
+    clock = FakeClock()
+    cache = make_cache(max_entries=2, clock=clock)
+    compute, calls = counting(b"foo")
+    cache.get_or_compute("a", (None, None), compute)
+    cache.get_or_compute("b", (None, None), compute)
+    cache.get_or_compute("a", (None, None), compute)
+    cache.get_or_compute("c", (None, None), compute)
+
+    assert len(cache) == 2
+    cache.get_or_compute("a", (None, None), compute)
+    assert len(calls) == 3
+
+    clock.now = 61
+    cache.get_or_compute("a", (None, None), compute)
+    assert len(calls) == 4
+
+
+def test_response_cache_skips_stale_values():
+    cache = make_cache()
+
+    def compute():
+        cache.invalidate_all()
+        return b"foo", None
+
+    cache.get_or_compute("key", (None, None), compute)
+    assert len(cache) == 0
+
+
+def test_response_cache_coalesces_misses():
+    cache = make_cache()
+    started = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return b"foo", 1
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                cache.get_or_compute("key", (None, None), compute)
+            )
+        )
+        for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [(b"foo", 1)] * 5
+
+
+def test_response_cache_propagates_errors():
+    cache = make_cache()
+
+    def compute():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("key", (None, None), compute)
+    assert len(cache) == 0
@@ -0,0 +1,187 @@
+import gzip
+import json
+
+import pytest
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from chatbot_api import compression
+from chatbot_api.compression import CompressionMiddleware, accepted_encoding
+
+ROWS = [
+    {"customer_id": index, "dialogue_id": index, "language": "EN", "text": "foo"}
+    for index in range(100)
+]
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.fixture(scope="module")
+def client():
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware,
+        paths=["/data"],
+        min_size=1024,
+        max_request_size=4096,
+    )
+
+    @app.get("/data")
+    def data(limit: int = 100) -> Response:
+        return Response(
+            content=json.dumps({"results": ROWS[:limit]}),
+            media_type="application/json",
+        )
+
+    @app.get("/data/stream")
+    def stream() -> StreamingResponse:
+        return StreamingResponse(
+            (json.dumps(row).encode() + b"\n" for row in ROWS),
+            media_type="application/x-ndjson",
+        )
+
+    @app.get("/data/parquet")
+    def parquet() -> Response:
+        return Response(content=b"PAR1" * 1000, media_type="application/vnd.apache.parquet")
+
+    @app.get("/other")
+    def other() -> Response:
+        return Response(content=json.dumps(ROWS), media_type="application/json")
+
+    @app.post("/data/echo")
+    async def echo(request: Request) -> Response:
+        return Response(content=await request.body(), media_type="text/plain")
+
+    return TestClient(app)
+
+
+def raw_get(client, url, accept_encoding):
+    response = client.get(url, headers={"Accept-Encoding": accept_encoding}, stream=True)
+    return response, response.raw.read(decode_content=False)
+
+
+def test_accepted_encoding():
+    assert accepted_encoding("") is None
+    assert accepted_encoding("identity") is None
+    assert accepted_encoding("gzip, deflate") == "gzip"
+    assert accepted_encoding("GZIP;q=0.5") == "gzip"
+    assert accepted_encoding("gzip;q=0") is None
+    assert accepted_encoding("gzip, br") == "br"
+    assert accepted_encoding("gzip, br;q=0") == "gzip"
+
+
+def test_compressed_response(client):
+    uncompressed_before = sample(
+        "chatbot_api_compression_uncompressed_bytes_total",
+        direction="response",
+        encoding="gzip",
+    )
+
+    response, body = raw_get(client, "/data", "gzip")
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) == len(body)
+    assert json.loads(gzip.decompress(body)) == {"results": ROWS}
+    assert len(body) < len(json.dumps({"results": ROWS})) / 5
+    assert sample(
+        "chatbot_api_compression_uncompressed_bytes_total",
+        direction="response",
+        encoding="gzip",
+    ) == uncompressed_before + len(json.dumps({"results": ROWS}))
+
+
+def test_brotli_response(client, monkeypatch):
+    brotli = pytest.importorskip("brotli")
+
+    response, body = raw_get(client, "/data", "gzip, br")
+
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(body)) == {"results": ROWS}
+
+    monkeypatch.setattr(compression, "brotli", None)
+    response, body = raw_get(client, "/data", "gzip, br")
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_offloaded_compression(client, monkeypatch):
+    offloaded = []
+
+    async def run_in_threadpool(function, *args):
+        offloaded.append(len(args[0]))
+        return function(*args)
+
+    monkeypatch.setattr(compression, "run_in_threadpool", run_in_threadpool)
+    middleware = client.app.middleware_stack.app
+    monkeypatch.setattr(middleware, "offload_size", 2048)
+
+    response, body = raw_get(client, "/data", "gzip")
+    assert json.loads(gzip.decompress(body)) == {"results": ROWS}
+    raw_get(client, "/data?limit=20", "gzip")
+    assert offloaded == [len(json.dumps({"results": ROWS}))]
+
+    client.post(
+        "/data/echo",
+        data=gzip.compress(b" " * 3000),
+        headers={"Content-Encoding": "gzip"},
+    )
+    assert len(offloaded) == 1
+
+
+def test_compressed_stream(client):
+    response, body = raw_get(client, "/data/stream", "gzip")
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    lines = gzip.decompress(body).splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+
+
+@pytest.mark.parametrize(
+    "url, accept_encoding",
+    [
+        ("/data?limit=2", "gzip"),
+        ("/data", "identity"),
+        ("/data/parquet", "gzip"),
+        ("/other", "gzip"),
+    ],
+)
+def test_uncompressed_response(client, url, accept_encoding):
+    response, body = raw_get(client, url, accept_encoding)
+
+    assert "Content-Encoding" not in response.headers
+    assert int(response.headers["Content-Length"]) == len(body)
+
+
+def test_compressed_request(client):
+    body = json.dumps(ROWS[:10]).encode()
+
+    response = client.post(
+        "/data/echo",
+        data=gzip.compress(body),
+        headers={"Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert response.content == body
+
+    response = client.post(
+        "/data/echo",
+        data=gzip.compress(b" " * 5000),
+        headers={"Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 413
+
+    response = client.post(
+        "/data/echo",
+        data=gzip.compress(body)[:-10],
+        headers={"Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 400
+
+    response = client.post("/data/echo", data=body, headers={"Content-Encoding": "zstd"})
+    assert response.status_code == 415
@@ -1,18 +1,36 @@
+from datetime import datetime
+
 import pytest
 
 from chatbot_api.crud import (
     create_user_input,
+    create_user_input_once,
+    create_user_inputs,
     delete_user_input_by_dialogue_id,
+    grant_consent_by_dialogue_id,
+    read_customer_input_rows,
     read_customer_inputs,
     read_customer_inputs_by_customer_id,
     read_customer_inputs_by_dialogue_id,
     read_customer_inputs_by_language,
     read_customer_inputs_by_customer_id_and_language,
+    read_input_stats,
+    rebuild_input_stats,
+    stream_customer_inputs,
 )
-from chatbot_api.models import CustomerInputs
+from chatbot_api.models import CustomerInputs, InputLengthHistogram, InputStats
 from chatbot_api.schemas import CompleteCustomerInput, SupportedLanguages
 
 
+def as_dict(record: CustomerInputs) -> dict:
+    # `created_at` is set by the database clock, `dedup_key` is only set
+    # by idempotent ingestion.
+    values = record.as_dict()
+    del values["created_at"]
+    del values["dedup_key"]
+    return values
+
+
 @pytest.mark.parametrize(
     "records",
     [
@@ -53,14 +71,90 @@ def test_create_user_input(db, test_records):
         "customer_id": 111,
         "dialogue_id": 222,
         "text": "foo bar baz",
+        "consent": False,
         "language": "EN"
     }
     expected_db_customer_input = CustomerInputs(**expected_db_customer_input)
-    assert db_customer_input.as_dict() == expected_db_customer_input.as_dict()
+    assert as_dict(db_customer_input) == as_dict(expected_db_customer_input)
 
     records = db.query(CustomerInputs).all()
     assert len(records) == 4
-    assert records[-1].as_dict() == expected_db_customer_input.as_dict()
+    assert as_dict(records[-1]) == as_dict(expected_db_customer_input)
+
+
+def test_create_user_inputs(db):
+    customer_inputs = [
+        CompleteCustomerInput(
+            customer_id=111,
+            dialogue_id=222,
+            text=f"foo {index}",
+            language="EN",
+        )
+        for index in range(3)
+    ]
+
+    assert create_user_inputs(db, customer_inputs) == 3
+    assert create_user_inputs(db, []) == 0
+
+    records = db.query(CustomerInputs).order_by(CustomerInputs.id).all()
+    assert [record.text for record in records] == ["foo 0", "foo 1", "foo 2"]
+    assert {record.language for record in records} == {SupportedLanguages.english}
+    assert all(record.created_at is not None for record in records)
+
+    db.query(CustomerInputs).delete()
+
+
+def test_create_consented_user_inputs_stats_day(db):
+    customer_inputs = [
+        CompleteCustomerInput(customer_id=111, dialogue_id=222, text="foo", language="EN")
+        for _ in range(2)
+    ]
+
+    assert create_user_inputs(db, customer_inputs, consent=True) == 2
+
+    # The day counted is the day of the rows, both set by the database clock.
+    created_at = {record.created_at for record in db.query(CustomerInputs)}
+    assert len(created_at) == 1
+    days = db.query(InputStats).filter(InputStats.dimension == "day").all()
+    assert [(row.key, row.inputs) for row in days] == [
+        (created_at.pop().date().isoformat(), 2)
+    ]
+
+    db.query(CustomerInputs).delete()
+    db.query(InputStats).delete()
+    db.query(InputLengthHistogram).delete()
+    db.commit()
+
+
+def test_create_user_inputs_deduplicated(db):
+    customer_inputs = [
+        CompleteCustomerInput(
+            customer_id=111,
+            dialogue_id=222,
+            text=f"foo {index}",
+            language="EN",
+        )
+        for index in range(3)
+    ]
+
+    assert create_user_input_once(db, customer_inputs[0], "key:a") is True
+    assert create_user_input_once(db, customer_inputs[0], "key:a") is False
+    # Stored keys and keys repeated within the batch are skipped.
+    assert create_user_inputs(
+        db,
+        customer_inputs,
+        dedup_keys=["key:a", "key:b", "key:b"],
+    ) == 1
+    assert create_user_inputs(db, customer_inputs[1:], dedup_keys=["key:b", "key:c"]) == 1
+
+    records = db.query(CustomerInputs).order_by(CustomerInputs.id).all()
+    assert [(record.text, record.dedup_key) for record in records] == [
+        ("foo 0", "key:a"),
+        ("foo 1", "key:b"),
+        ("foo 2", "key:c"),
+    ]
+
+    db.query(CustomerInputs).delete()
 
 
 @pytest.mark.parametrize(
@@ -90,7 +184,8 @@ def test_create_user_input(db, test_records):
 )
 def test_delete_user_inputs_by_dialogue_id(db, test_records):
     dialogue_id = 334
-    delete_user_input_by_dialogue_id(db, dialogue_id)
+    assert delete_user_input_by_dialogue_id(db, dialogue_id) == 2
+    assert delete_user_input_by_dialogue_id(db, dialogue_id) == 0
 
     expected_db_customer_input = {
             "id": 1,
@@ -98,11 +193,12 @@ def test_delete_user_inputs_by_dialogue_id(db, test_records):
             "dialogue_id": 321,
             "language": "EN",
             "text": "foo",
+            "consent": False,
         }
 
     records = db.query(CustomerInputs).all()
     assert len(records) == 1
-    assert records[0].as_dict() == expected_db_customer_input
+    assert as_dict(records[0]) == expected_db_customer_input
 
 
 @pytest.mark.parametrize(
@@ -115,17 +211,116 @@ def test_delete_user_inputs_by_dialogue_id(db, test_records):
                 "language": "EN",
                 "text": "foo",
             },
+            {
+                "customer_id": 124,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "baz",
+            },
+        ],
+    ],
+)
+def test_grant_consent_by_dialogue_id(db, test_records):
+    assert read_customer_inputs(db) == []
+
+    assert grant_consent_by_dialogue_id(db, 334) == 1
+    assert grant_consent_by_dialogue_id(db, 335) == 0
+
+    records = db.query(CustomerInputs).order_by(CustomerInputs.id).all()
+    assert [record.consent for record in records] == [False, True]
+    assert [input_.id for input_ in read_customer_inputs(db)] == [2]
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "a longer text",
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "and another one to grant",
+            },
+        ],
+    ],
+)
+def test_input_stats(db, test_records):
+    def stats():
+        counters, histogram = read_input_stats(db, customer_id=124)
+        return (
+            {(row.dimension, row.key): (row.inputs, row.characters) for row in counters},
+            {row.bucket: row.inputs for row in histogram},
+        )
+
+    assert rebuild_input_stats(db) == 1
+    counters, histogram = stats()
+    assert counters[("total", "")] == (1, 3)
+    assert counters[("language", "EN")] == (1, 3)
+    assert ("customer", "124") not in counters
+    assert histogram == {0: 1}
+
+    grant_consent_by_dialogue_id(db, 334)
+    counters, histogram = stats()
+    assert counters[("total", "")] == (3, 40)
+    assert counters[("language", "IT")] == (2, 37)
+    assert counters[("customer", "124")] == (2, 37)
+    assert sum(inputs for key, (inputs, _) in counters.items() if key[0] == "day") == 3
+    assert histogram == {0: 2, 16: 1}
+
+    # Granting again does not count the inputs twice.
+    grant_consent_by_dialogue_id(db, 334)
+    assert stats()[0][("total", "")] == (3, 40)
+
+    delete_user_input_by_dialogue_id(db, 321)
+    counters, histogram = stats()
+    assert counters[("total", "")] == (2, 37)
+    assert counters[("language", "EN")] == (0, 0)
+    assert histogram == {0: 1, 16: 1}
+
+    expected = stats()
+    assert rebuild_input_stats(db) == 2
+    rebuilt_counters, rebuilt_histogram = stats()
+    assert rebuilt_histogram == expected[1]
+    assert {key: value for key, value in expected[0].items() if value[0]} == rebuilt_counters
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+            },
             {
                 "customer_id": 124,
                 "dialogue_id": 322,
                 "language": "FR",
                 "text": "bar",
+                "consent": True,
             },
             {
                 "customer_id": 124,
                 "dialogue_id": 334,
                 "language": "IT",
                 "text": "baz",
+                "consent": True,
             },
         ],
     ],
@@ -138,6 +333,7 @@ def test_read_user_inputs(db, test_records):
             "dialogue_id": 334,
             "language": "IT",
             "text": "baz",
+            "consent": True,
         },
         {
             "id": 2,
@@ -145,6 +341,7 @@ def test_read_user_inputs(db, test_records):
             "dialogue_id": 322,
             "language": "FR",
             "text": "bar",
+            "consent": True,
         },
         {
             "id": 1,
@@ -152,10 +349,11 @@ def test_read_user_inputs(db, test_records):
             "dialogue_id": 321,
             "language": "EN",
             "text": "foo",
+            "consent": True,
         },
     ]
     db_customer_inputs = read_customer_inputs(db)
-    db_customer_inputs = [input_.as_dict() for input_ in db_customer_inputs]
+    db_customer_inputs = [as_dict(input_) for input_ in db_customer_inputs]
 
     assert len(db_customer_inputs) == 3
     assert db_customer_inputs == expected_db_customer_inputs
@@ -170,24 +368,28 @@ def test_read_user_inputs(db, test_records):
                 "dialogue_id": 321,
                 "language": "EN",
                 "text": "foo",
+                "consent": True,
             },
             {
                 "customer_id": 122,
                 "dialogue_id": 322,
                 "language": "FR",
                 "text": "bar",
+                "consent": True,
             },
             {
                 "customer_id": 122,
                 "dialogue_id": 334,
                 "language": "IT",
                 "text": "baz",
+                "consent": True,
             },
             {
                 "customer_id": 125,
                 "dialogue_id": 336,
                 "language": "FR",
                 "text": "John Doe",
+                "consent": True,
             },
         ],
     ],
@@ -201,6 +403,7 @@ def test_read_user_inputs_by_customer_id(db, test_records):
             "dialogue_id": 334,
             "language": "IT",
             "text": "baz",
+            "consent": True,
         },
         {
             "id": 2,
@@ -208,10 +411,11 @@ def test_read_user_inputs_by_customer_id(db, test_records):
             "dialogue_id": 322,
             "language": "FR",
             "text": "bar",
+            "consent": True,
         },
     ]
     db_customer_inputs = read_customer_inputs_by_customer_id(db, customer_id)
-    db_customer_inputs = [input_.as_dict() for input_ in db_customer_inputs]
+    db_customer_inputs = [as_dict(input_) for input_ in db_customer_inputs]
 
     assert len(db_customer_inputs) == 2
     assert db_customer_inputs == expected_db_customer_inputs
@@ -257,6 +461,7 @@ def test_read_user_inputs_by_dialogue_id(db, test_records):
             "dialogue_id": 321,
             "language": "IT",
             "text": "baz",
+            "consent": False,
         },
         {
             "id": 1,
@@ -264,10 +469,11 @@ def test_read_user_inputs_by_dialogue_id(db, test_records):
             "dialogue_id": 321,
             "language": "EN",
             "text": "foo",
+            "consent": False,
         },
     ]
     db_customer_inputs = read_customer_inputs_by_dialogue_id(db, dialogue_id)
-    db_customer_inputs = [input_.as_dict() for input_ in db_customer_inputs]
+    db_customer_inputs = [as_dict(input_) for input_ in db_customer_inputs]
 
     assert len(db_customer_inputs) == 2
     assert db_customer_inputs == expected_db_customer_inputs
@@ -282,24 +488,28 @@ def test_read_user_inputs_by_dialogue_id(db, test_records):
                 "dialogue_id": 321,
                 "language": "EN",
                 "text": "foo",
+                "consent": True,
             },
             {
                 "customer_id": 122,
                 "dialogue_id": 322,
                 "language": "FR",
                 "text": "bar",
+                "consent": True,
             },
             {
                 "customer_id": 122,
                 "dialogue_id": 334,
                 "language": "IT",
                 "text": "baz",
+                "consent": True,
             },
             {
                 "customer_id": 125,
                 "dialogue_id": 336,
                 "language": "FR",
                 "text": "John Doe",
+                "consent": True,
             },
         ],
     ],
@@ -313,6 +523,7 @@ def test_read_user_inputs_by_language(db, test_records):
             "dialogue_id": 336,
             "language": "FR",
             "text": "John Doe",
+            "consent": True,
         },
         {
             "id": 2,
@@ -320,10 +531,11 @@ def test_read_user_inputs_by_language(db, test_records):
             "dialogue_id": 322,
             "language": "FR",
             "text": "bar",
+            "consent": True,
         },
     ]
     db_customer_inputs = read_customer_inputs_by_language(db, language)
-    db_customer_inputs = [input_.as_dict() for input_ in db_customer_inputs]
+    db_customer_inputs = [as_dict(input_) for input_ in db_customer_inputs]
 
     assert len(db_customer_inputs) == 2
     assert db_customer_inputs == expected_db_customer_inputs
@@ -338,24 +550,28 @@ def test_read_user_inputs_by_language(db, test_records):
                 "dialogue_id": 321,
                 "language": "EN",
                 "text": "foo",
+                "consent": True,
             },
             {
                 "customer_id": 122,
                 "dialogue_id": 322,
                 "language": "FR",
                 "text": "bar",
+                "consent": True,
             },
             {
                 "customer_id": 122,
                 "dialogue_id": 334,
                 "language": "IT",
                 "text": "baz",
+                "consent": True,
             },
             {
                 "customer_id": 125,
                 "dialogue_id": 336,
                 "language": "FR",
                 "text": "John Doe",
+                "consent": True,
             },
         ],
     ],
@@ -370,6 +586,7 @@ def test_read_user_inputs_by_customer_id_language(db, test_records):
             "dialogue_id": 322,
             "language": "FR",
             "text": "bar",
+            "consent": True,
         },
     ]
     db_customer_inputs = read_customer_inputs_by_customer_id_and_language(
@@ -377,7 +594,159 @@ def test_read_user_inputs_by_customer_id_language(db, test_records):
         customer_id,
         language
     )
-    db_customer_inputs = [input_.as_dict() for input_ in db_customer_inputs]
+    db_customer_inputs = [as_dict(input_) for input_ in db_customer_inputs]
 
     assert len(db_customer_inputs) == 1
     assert db_customer_inputs == expected_db_customer_inputs
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+            },
+            {
+                "customer_id": 122,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar",
+                "consent": True,
+            },
+            {
+                "customer_id": 122,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "baz",
+                "consent": True,
+            },
+            {
+                "customer_id": 125,
+                "dialogue_id": 336,
+                "language": "FR",
+                "text": "John Doe",
+                "consent": True,
+            },
+        ],
+    ],
+)
+def test_read_user_inputs_paginated(db, test_records):
+    first_page = read_customer_inputs(db, limit=2)
+    assert [input_.id for input_ in first_page] == [4, 3]
+
+    second_page = read_customer_inputs(db, limit=2, after_id=first_page[-1].id)
+    assert [input_.id for input_ in second_page] == [2, 1]
+
+    last_page = read_customer_inputs(db, limit=2, after_id=second_page[-1].id)
+    assert last_page == []
+
+    customer_page = read_customer_inputs_by_customer_id(
+        db,
+        122,
+        limit=1,
+        after_id=3,
+    )
+    assert [input_.id for input_ in customer_page] == [2]
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+            },
+            {
+                "customer_id": 122,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar",
+                "consent": True,
+            },
+            {
+                "customer_id": 122,
+                "dialogue_id": 334,
+                "language": "FR",
+                "text": "baz",
+                "consent": True,
+            },
+        ],
+    ],
+)
+def test_stream_customer_inputs(db, test_records):
+    rows = stream_customer_inputs(
+        db,
+        customer_id=122,
+        language=SupportedLanguages.french,
+        batch_size=1,
+    )
+    expected_rows = [
+        {
+            "id": 3,
+            "customer_id": 122,
+            "dialogue_id": 334,
+            "language": "FR",
+            "text": "baz",
+        },
+        {
+            "id": 2,
+            "customer_id": 122,
+            "dialogue_id": 322,
+            "language": "FR",
+            "text": "bar",
+        },
+    ]
+
+    assert [dict(row._mapping) for row in rows] == expected_rows
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 122,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+                "created_at": datetime(2026, 8, 31, 23, 59),
+            },
+            {
+                "customer_id": 122,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar",
+                "consent": True,
+                "created_at": datetime(2026, 9, 1),
+            },
+            {
+                "customer_id": 122,
+                "dialogue_id": 334,
+                "language": "FR",
+                "text": "baz",
+                "consent": True,
+                "created_at": datetime(2026, 10, 1),
+            },
+        ],
+    ],
+)
+def test_read_customer_input_rows_since_until(db, test_records):
+    september = {"since": datetime(2026, 9, 1), "until": datetime(2026, 10, 1)}
+    rows = read_customer_input_rows(db, **september)
+    assert [row.text for row in rows] == ["bar"]
+
+    rows = read_customer_input_rows(db, since=september["since"])
+    assert [row.text for row in rows] == ["baz", "bar"]
+
+    rows = read_customer_input_rows(db, until=september["since"])
+    assert [row.text for row in rows] == ["foo"]
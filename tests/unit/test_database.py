@@ -0,0 +1,197 @@
+import asyncio
+
+import pytest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from chatbot_api import database
+from chatbot_api.cache import ResponseCache, get_response_cache
+from chatbot_api.crud import create_user_inputs
+from chatbot_api.database import (
+    Base,
+    MonitoredAsyncQueuePool,
+    MonitoredQueuePool,
+    get_db,
+    get_replica_engine,
+    pool_status,
+    prewarm_async_pool,
+    prewarm_pool,
+)
+from chatbot_api.main import router
+from chatbot_api.schemas import CompleteCustomerInput
+
+
+@pytest.fixture(scope="function")
+def pooled_engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=MonitoredQueuePool,
+        pool_size=2,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+    yield engine
+    engine.dispose()
+
+
+def test_prewarm_pool(pooled_engine):
+    assert prewarm_pool(pooled_engine, 2) == 2
+
+    status = pool_status(pooled_engine.pool)
+    assert status["checked_in"] == 2
+    assert status["checked_out"] == 0
+    assert status["wait_count"] == 2
+
+
+def test_prewarm_async_pool(tmp_path):
+    pytest.importorskip("aiosqlite")
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=MonitoredAsyncQueuePool,
+        pool_size=2,
+        max_overflow=0,
+    )
+
+    async def prewarm():
+        try:
+            return (
+                await prewarm_async_pool(engine, 2),
+                pool_status(engine.sync_engine.pool),
+            )
+        finally:
+            await engine.dispose()
+
+    opened, status = asyncio.run(prewarm())
+    assert opened == 2
+    assert status["checked_in"] == 2
+    assert status["wait_count"] == 2
+
+
+def test_pool_status_timeouts(pooled_engine):
+    connections = [pooled_engine.connect() for _ in range(2)]
+    with pytest.raises(PoolTimeoutError):
+        pooled_engine.connect()
+
+    status = pool_status(pooled_engine.pool)
+    assert status["checked_out"] == 2
+    assert status["timeouts"] == 1
+    assert status["wait_time_max_ms"] >= 10
+
+    for connection in connections:
+        connection.close()
+
+
+
+def sqlite_engine(path):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def replica_client(primary, replica) -> TestClient:
+    PrimarySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=primary)
+
+    def get_test_db():
+        db = PrimarySessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_replica_engine] = lambda: replica
+    return TestClient(app)
+
+
+@pytest.fixture(scope="function")
+def databases(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "_replica_unavailable_until", 0.0)
+    primary = sqlite_engine(tmp_path / "primary.db")
+    replica = sqlite_engine(tmp_path / "replica.db")
+    # The replica lags behind: it only holds the first input.
+    for engine, texts in [(primary, ["foo", "bar"]), (replica, ["foo"])]:
+        with sessionmaker(bind=engine)() as db:
+            create_user_inputs(
+                db,
+                [
+                    CompleteCustomerInput(
+                        customer_id=123,
+                        dialogue_id=321,
+                        text=text,
+                        language="EN",
+                    )
+                    for text in texts
+                ],
+                consent=True,
+            )
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def texts(response):
+    assert response.status_code == 200
+    return [customer_input["text"] for customer_input in response.json()["results"]]
+
+
+def test_get_read_db_replica(databases):
+    client = replica_client(*databases)
+
+    assert texts(client.get("/data")) == ["foo"]
+    assert texts(client.get("/data", headers={"X-Read-Your-Writes": "true"})) == [
+        "bar",
+        "foo",
+    ]
+
+    response = client.post("/data/124/334", json={"text": "baz", "language": "FR"})
+    assert response.status_code == 200
+    assert texts(client.get("/data?customer_id=124")) == []
+    response = client.post("/consents/334", json={"consent": True})
+    assert response.status_code == 201
+    assert texts(
+        client.get("/data?customer_id=124", headers={"X-Read-Your-Writes": "true"})
+    ) == ["baz"]
+
+
+def test_get_read_db_replica_cached(databases):
+    client = replica_client(*databases)
+    cache = ResponseCache(max_entries=10, max_bytes=10 ** 6, ttl_seconds=60)
+    client.app.dependency_overrides[get_response_cache] = lambda: cache
+
+    # Cached from the replica, then bypassed by the requests reading their writes.
+    assert texts(client.get("/data")) == ["foo"]
+    assert texts(client.get("/data", headers={"X-Read-Your-Writes": "true"})) == [
+        "bar",
+        "foo",
+    ]
+    assert texts(client.get("/data")) == ["foo"]
+
+
+def test_get_read_db_without_replica(databases):
+    primary, _ = databases
+    client = replica_client(primary, None)
+
+    assert texts(client.get("/data")) == ["bar", "foo"]
+
+
+def test_get_read_db_replica_unavailable(databases, tmp_path, monkeypatch):
+    primary, _ = databases
+    unreachable = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    client = replica_client(primary, unreachable)
+
+    assert texts(client.get("/data")) == ["bar", "foo"]
+    assert database._replica_unavailable_until > 0
+
+    # The replica is not tried again until the retry delay has passed.
+    monkeypatch.setattr(database, "_replica_session", None)
+    assert texts(client.get("/data/search?q=foo")) == ["foo"]
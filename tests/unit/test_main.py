@@ -1,7 +1,16 @@
+import json
+from datetime import datetime
+
 import pytest
+from sqlalchemy.exc import OperationalError
 
+from chatbot_api import crud
+from chatbot_api.cache import ResponseCache, get_response_cache
+from chatbot_api.config import settings
+from chatbot_api.main import app
 from chatbot_api.models import CustomerInputs
 from chatbot_api.schemas import SupportedLanguages
+from chatbot_api.staging import InMemoryStagingStore, get_staging
 
 
 def test_get_customer_consent_inexistent_dialogue_id(test_client):
@@ -24,6 +33,22 @@ def test_get_customer_consent_inexistent_dialogue_id(test_client):
     assert response.json() == expected_response_json
 
 
+def test_serve_pool_status(test_client):
+    response = test_client.get("/health/pool")
+
+    assert response.status_code == 200
+    assert set(response.json()) == {
+        "size",
+        "checked_in",
+        "checked_out",
+        "overflow",
+        "wait_count",
+        "wait_time_total_ms",
+        "wait_time_max_ms",
+        "timeouts",
+    }
+
+
 @pytest.mark.parametrize(
     "records",
     [
@@ -136,6 +161,13 @@ def test_get_customer_consent_true(db, test_client, test_records):
                 .all()
 
     assert len(records) == 2
+    assert all(record.consent for record in records)
+
+    records = db.query(CustomerInputs) \
+                .filter(CustomerInputs.dialogue_id != dialogue_id) \
+                .all()
+
+    assert not any(record.consent for record in records)
 
 
 @pytest.mark.parametrize(
@@ -191,13 +223,104 @@ def test_get_customer_input(db, test_client, test_records):
     # Check that it does not save to db without consent.
     records = db.query(CustomerInputs).all()
     records = [record.as_dict() for record in records]
+    for record in records:
+        del record["created_at"]
 
-    expected_response_json.update({"id": 4})
+    expected_response_json.update({"id": 4, "consent": False, "dedup_key": None})
 
     assert len(records) == 4
     assert expected_response_json in records
 
 
+def test_get_customer_input_batch(db, test_client):
+    batch = {
+        "inputs": [
+            {
+                "customer_id": 456,
+                "dialogue_id": 543,
+                "text": "foo",
+                "language": "EN",
+            },
+            {
+                "customer_id": 456,
+                "dialogue_id": 543,
+                "text": "bar",
+                "language": "XX",
+            },
+            {
+                "customer_id": 456,
+                "dialogue_id": 543,
+                "text": "baz",
+                "language": "FR",
+            },
+        ],
+    }
+
+    response = test_client.post("/data/batch", json=batch)
+
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 2
+    assert [error["index"] for error in response.json()["errors"]] == [1]
+    assert response.json()["errors"][0]["errors"][0]["loc"] == ["language"]
+
+    records = db.query(CustomerInputs).all()
+    assert [record.text for record in records] == ["foo", "baz"]
+
+    db.query(CustomerInputs).delete()
+
+
+def test_get_customer_input_idempotent(db, test_client, monkeypatch):
+    customer_input = {"text": "foo", "language": "EN"}
+    headers = {"Idempotency-Key": "4f1c"}
+
+    for _ in range(2):
+        response = test_client.post("/data/456/543", json=customer_input, headers=headers)
+        assert response.status_code == 200
+
+    batch = {
+        "inputs": [
+            {"customer_id": 456, "dialogue_id": 543, "text": "bar", "language": "XX"},
+            {"customer_id": 456, "dialogue_id": 543, "text": "baz", "language": "FR"},
+        ],
+    }
+    responses = [
+        test_client.post("/data/batch", json=batch, headers={"Idempotency-Key": "9e2a"})
+        for _ in range(2)
+    ]
+    assert [response.json()["inserted"] for response in responses] == [1, 0]
+    assert [response.json()["duplicates"] for response in responses] == [0, 1]
+
+    # Content hashes deduplicate the retries sent without a key.
+    monkeypatch.setattr(settings, "INGESTION_DEDUP_CONTENT_HASH", True)
+    for _ in range(2):
+        test_client.post("/data/456/543", json={"text": "qux", "language": "EN"})
+
+    records = db.query(CustomerInputs).order_by(CustomerInputs.id).all()
+    assert [record.text for record in records] == ["foo", "baz", "qux"]
+    assert records[0].dedup_key == "key:4f1c"
+    assert records[1].dedup_key == "key:9e2a:1"
+    assert records[2].dedup_key.startswith("sha256:")
+
+    db.query(CustomerInputs).delete()
+
+
+def test_get_customer_input_batch_too_large(test_client, monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_BATCH_SIZE_MAX", 1)
+    customer_input = {
+        "customer_id": 456,
+        "dialogue_id": 543,
+        "text": "foo",
+        "language": "EN",
+    }
+
+    response = test_client.post(
+        "/data/batch",
+        json={"inputs": [customer_input, customer_input]},
+    )
+
+    assert response.status_code == 413
+
+
 @pytest.mark.parametrize(
     "records",
     [
@@ -207,18 +330,21 @@ def test_get_customer_input(db, test_client, test_records):
                 "dialogue_id": 321,
                 "language": "EN",
                 "text": "foo",
+                "consent": True,
             },
             {
                 "customer_id": 124,
                 "dialogue_id": 322,
                 "language": "FR",
                 "text": "bar",
+                "consent": True,
             },
             {
                 "customer_id": 124,
                 "dialogue_id": 334,
                 "language": "IT",
                 "text": "baz",
+                "consent": True,
             },
         ],
     ],
@@ -266,18 +392,21 @@ def test_serve_customer_inputs(test_client, test_records):
                 "dialogue_id": 321,
                 "language": "EN",
                 "text": "foo",
+                "consent": True,
             },
             {
                 "customer_id": 124,
                 "dialogue_id": 322,
                 "language": "FR",
                 "text": "bar",
+                "consent": True,
             },
             {
                 "customer_id": 124,
                 "dialogue_id": 334,
                 "language": "IT",
                 "text": "baz",
+                "consent": True,
             },
         ],
     ],
@@ -319,24 +448,28 @@ def test_serve_customer_inputs_by_customer_id(test_client, test_records):
                 "dialogue_id": 321,
                 "language": "EN",
                 "text": "foo",
+                "consent": True,
             },
             {
                 "customer_id": 124,
                 "dialogue_id": 322,
                 "language": "FR",
                 "text": "bar",
+                "consent": True,
             },
             {
                 "customer_id": 124,
                 "dialogue_id": 334,
                 "language": "IT",
                 "text": "baz",
+                "consent": True,
             },
             {
                 "customer_id": 128,
                 "dialogue_id": 336,
                 "language": "EN",
                 "text": "Jon Doe",
+                "consent": True,
             },
         ],
     ],
@@ -378,24 +511,28 @@ def test_serve_customer_inputs_by_language(test_client, test_records):
                 "dialogue_id": 321,
                 "language": "EN",
                 "text": "foo",
+                "consent": True,
             },
             {
                 "customer_id": 124,
                 "dialogue_id": 322,
                 "language": "FR",
                 "text": "bar",
+                "consent": True,
             },
             {
                 "customer_id": 124,
                 "dialogue_id": 334,
                 "language": "IT",
                 "text": "baz",
+                "consent": True,
             },
             {
                 "customer_id": 128,
                 "dialogue_id": 336,
                 "language": "EN",
                 "text": "Jon Doe",
+                "consent": True,
             },
         ],
     ],
@@ -420,3 +557,584 @@ def test_serve_customer_inputs_by_customer_id_and_language(test_client, test_rec
 
     assert response.status_code == 200
     assert response.json() == expected_response_json
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "baz",
+                "consent": True,
+            },
+        ],
+    ],
+)
+def test_serve_customer_inputs_paginated(test_client, test_records):
+    response = test_client.get("/data?limit=2")
+
+    assert response.status_code == 200
+    assert response.headers["X-Next-After-Id"] == "2"
+    assert [res["id"] for res in response.json()["results"]] == [3, 2]
+
+    response = test_client.get("/data?limit=2&after_id=2")
+
+    expected_response_json = {
+        "results_number": 1,
+        "results": [
+            {
+                "id": 1,
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+            },
+        ],
+    }
+
+    assert response.status_code == 200
+    assert "X-Next-After-Id" not in response.headers
+    assert response.json() == expected_response_json
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+                "created_at": datetime(2026, 9, 30, 12),
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar",
+                "consent": True,
+                "created_at": datetime(2026, 10, 2, 12),
+            },
+        ],
+    ],
+)
+def test_serve_customer_inputs_since_until(test_client, test_records):
+    response = test_client.get("/data?since=2026-10-01T00:00:00")
+
+    assert response.status_code == 200
+    assert [res["text"] for res in response.json()["results"]] == ["bar"]
+
+    response = test_client.get("/data?until=2026-10-01T00:00:00&stream=true")
+
+    assert response.status_code == 200
+    assert [json.loads(line)["text"] for line in response.text.splitlines()] == ["foo"]
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar, \"baz\"",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "qux",
+            },
+        ],
+    ],
+)
+def test_export_customer_inputs_csv(test_client, test_records):
+    response = test_client.get("/data/export?format=csv&customer_id=124")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == "attachment; filename=user_inputs.csv"
+    assert response.text.splitlines() == [
+        "id,customer_id,dialogue_id,language,text",
+        '2,124,322,FR,"bar, ""baz"""',
+    ]
+
+    # CSV is the default format: it does not require pyarrow.
+    assert test_client.get("/data/export?customer_id=124").content == response.content
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar",
+                "consent": True,
+            },
+        ],
+    ],
+)
+@pytest.mark.parametrize("export_format", ["arrow", "parquet"])
+def test_export_customer_inputs_columnar(
+        test_client,
+        test_records,
+        export_format,
+        monkeypatch,
+):
+    pyarrow = pytest.importorskip("pyarrow")
+    monkeypatch.setattr(settings, "DATA_EXPORT_BATCH_SIZE", 1)
+
+    response = test_client.get(f"/data/export?format={export_format}")
+
+    assert response.status_code == 200
+    if export_format == "arrow":
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+    else:
+        import pyarrow.parquet
+
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(response.content))
+    assert table.to_pylist() == [
+        {
+            "id": 2,
+            "customer_id": 124,
+            "dialogue_id": 322,
+            "language": "FR",
+            "text": "bar",
+        },
+        {
+            "id": 1,
+            "customer_id": 123,
+            "dialogue_id": 321,
+            "language": "EN",
+            "text": "foo",
+        },
+    ]
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+            },
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "bar",
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "baz",
+                "consent": True,
+            },
+        ],
+    ],
+)
+def test_serve_customer_input_changes(test_client, test_records, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_CHANGES_SETTLE_SECONDS", 0)
+    since_id = test_client.get("/data/changes").json()["last_change_id"]
+
+    test_client.post("/consents/321", json={"consent": True})
+    test_client.post("/consents/322", json={"consent": False})
+
+    response = test_client.get(f"/data/changes?since_id={since_id}")
+
+    expected_response_json = {
+        "changes": [
+            {
+                "change_id": since_id + 1,
+                "operation": "upsert",
+                "dialogue_id": 321,
+                "inputs": [
+                    {
+                        "id": 1,
+                        "customer_id": 123,
+                        "dialogue_id": 321,
+                        "language": "EN",
+                        "text": "foo",
+                    },
+                    {
+                        "id": 2,
+                        "customer_id": 123,
+                        "dialogue_id": 321,
+                        "language": "EN",
+                        "text": "bar",
+                    },
+                ],
+            },
+            {
+                "change_id": since_id + 2,
+                "operation": "delete",
+                "dialogue_id": 322,
+                "inputs": [],
+            },
+        ],
+        "last_change_id": since_id + 2,
+    }
+
+    assert response.status_code == 200
+    assert response.json() == expected_response_json
+
+    response = test_client.get(f"/data/changes?since_id={since_id}&limit=1")
+    assert response.json()["last_change_id"] == since_id + 1
+
+    response = test_client.get(f"/data/changes?since_id={since_id + 2}")
+    assert response.json() == {"changes": [], "last_change_id": since_id + 2}
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "I want to cancel my order",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "je veux annuler ma commande, cancel",
+                "consent": True,
+            },
+            {
+                "customer_id": 125,
+                "dialogue_id": 334,
+                "language": "EN",
+                "text": "cancel cancel cancel",
+                "consent": True,
+            },
+            {
+                "customer_id": 126,
+                "dialogue_id": 335,
+                "language": "EN",
+                "text": "please cancel",
+            },
+        ],
+    ],
+)
+def test_search_customer_inputs(test_client, test_records):
+    response = test_client.get("/data/search?q=cancel")
+
+    assert response.status_code == 200
+    assert [res["id"] for res in response.json()["results"]] == [3, 2, 1]
+    assert "X-Next-Offset" not in response.headers
+
+    response = test_client.get("/data/search?q=cancel&language=EN&limit=1")
+
+    assert response.json() == {
+        "results_number": 1,
+        "results": [
+            {
+                "id": 3,
+                "customer_id": 125,
+                "dialogue_id": 334,
+                "language": "EN",
+                "text": "cancel cancel cancel",
+            },
+        ],
+    }
+    assert response.headers["X-Next-Offset"] == "1"
+
+    response = test_client.get("/data/search?q=cancel&language=EN&limit=1&offset=1")
+    assert [res["id"] for res in response.json()["results"]] == [1]
+
+    response = test_client.get('/data/search?q=commande "order')
+    assert response.json()["results_number"] == 0
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+            },
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "a text of 20 letters",
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "baz",
+            },
+        ],
+    ],
+)
+def test_serve_customer_input_stats(test_client, test_records):
+    test_client.post("/consents/321", json={"consent": True})
+    test_client.post("/consents/334", json={"consent": True})
+    test_client.post("/consents/334", json={"consent": False})
+
+    response = test_client.get("/data/stats?customer_id=123")
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["inputs"] == 2
+    assert stats["characters"] == 23
+    assert stats["mean_length"] == 11.5
+    assert stats["by_language"] == {
+        "EN": {"inputs": 2, "characters": 23, "mean_length": 11.5},
+    }
+    assert list(stats["by_day"].values()) == [
+        {"inputs": 2, "characters": 23, "mean_length": 11.5},
+    ]
+    assert stats["by_customer"] == {
+        "123": {"inputs": 2, "characters": 23, "mean_length": 11.5},
+    }
+    assert stats["length_histogram"][:3] == [
+        {"min_length": 0, "max_length": 16, "inputs": 1},
+        {"min_length": 16, "max_length": 32, "inputs": 1},
+        {"min_length": 32, "max_length": 64, "inputs": 0},
+    ]
+    assert stats["length_histogram"][-1] == {
+        "min_length": 4096,
+        "max_length": None,
+        "inputs": 0,
+    }
+
+    response = test_client.get("/data/stats?customer_id=124")
+    assert response.json()["by_customer"] == {
+        "124": {"inputs": 0, "characters": 0, "mean_length": 0.0},
+    }
+
+
+def test_serve_customer_inputs_invalid_limit(test_client):
+    response = test_client.get("/data?limit=0")
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "baz",
+                "consent": True,
+            },
+        ],
+    ],
+)
+def test_serve_customer_inputs_stream(test_client, test_records):
+    response = test_client.get("/data?customer_id=124&stream=true")
+
+    expected_lines = [
+        {
+            "id": 3,
+            "customer_id": 124,
+            "dialogue_id": 334,
+            "language": "IT",
+            "text": "baz",
+        },
+        {
+            "id": 2,
+            "customer_id": 124,
+            "dialogue_id": 322,
+            "language": "FR",
+            "text": "bar",
+        },
+    ]
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == expected_lines
+
+
+@pytest.fixture(scope="function")
+def staging():
+    store = InMemoryStagingStore(ttl_seconds=60, max_bytes=10 ** 6)
+    app.dependency_overrides[get_staging] = lambda: store
+    yield store
+    del app.dependency_overrides[get_staging]
+
+
+@pytest.mark.parametrize("consent", [True, False])
+def test_staged_customer_inputs(db, test_client, staging, consent):
+    dialogue_id = 543
+    for text in ["foo", "bar"]:
+        response = test_client.post(
+            f"/data/456/{dialogue_id}",
+            json={"text": text, "language": "EN"},
+        )
+        assert response.status_code == 200
+
+    assert db.query(CustomerInputs).count() == 0
+
+    response = test_client.post(
+        f"/consents/{dialogue_id}",
+        json={"consent": consent},
+    )
+
+    assert response.status_code == (201 if consent else 200)
+    assert len(staging) == 0
+
+    records = db.query(CustomerInputs).all()
+    assert [record.text for record in records] == (["foo", "bar"] if consent else [])
+    assert all(record.consent for record in records)
+
+    db.query(CustomerInputs).delete()
+
+
+def test_staged_customer_inputs_dedup(db, test_client, staging, monkeypatch):
+    response = test_client.post(
+        "/data/456/543",
+        json={"text": "foo", "language": "EN"},
+        headers={"Idempotency-Key": "9e2a"},
+    )
+    assert response.status_code == 400
+    response = test_client.post(
+        "/data/batch",
+        json={"inputs": []},
+        headers={"Idempotency-Key": "9e2a"},
+    )
+    assert response.status_code == 400
+    assert len(staging) == 0
+
+    # Content hashes are checked when the dialogue is stored.
+    monkeypatch.setattr(settings, "INGESTION_DEDUP_CONTENT_HASH", True)
+    for text in ["foo", "foo", "bar"]:
+        test_client.post("/data/456/543", json={"text": text, "language": "EN"})
+    response = test_client.post("/consents/543", json={"consent": True})
+    assert response.status_code == 201
+    assert [record.text for record in db.query(CustomerInputs)] == ["foo", "bar"]
+
+    db.query(CustomerInputs).delete()
+    db.commit()
+
+
+def test_staged_customer_inputs_failed_grant(db, test_client, staging, monkeypatch):
+    test_client.post("/data/456/543", json={"text": "foo", "language": "EN"})
+
+    def fail(*args, **kwargs):
+        raise OperationalError("INSERT", {}, Exception("connection lost"))
+
+    monkeypatch.setattr(crud, "_record_changes", fail)
+    with pytest.raises(OperationalError):
+        test_client.post("/consents/543", json={"consent": True})
+    # What closing the request's session does.
+    db.rollback()
+
+    # Nothing was stored, and the inputs stay staged for a retry.
+    assert db.query(CustomerInputs).count() == 0
+    assert [input_.text for input_ in staging.peek(543)] == ["foo"]
+
+    monkeypatch.undo()
+    response = test_client.post("/consents/543", json={"consent": True})
+    assert response.status_code == 201
+    assert len(staging) == 0
+    assert [record.text for record in db.query(CustomerInputs)] == ["foo"]
+
+    db.query(CustomerInputs).delete()
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "consent": True,
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar",
+            },
+        ],
+    ],
+)
+def test_serve_customer_inputs_cached(test_client, test_records):
+    cache = ResponseCache(max_entries=10, max_bytes=10 ** 6, ttl_seconds=60)
+    app.dependency_overrides[get_response_cache] = lambda: cache
+
+    try:
+        first_response = test_client.get("/data")
+        second_response = test_client.get("/data")
+        assert first_response.json() == second_response.json()
+        assert first_response.json()["results_number"] == 1
+        assert cache.hits == 1
+
+        test_client.post("/consents/322", json={"consent": True})
+
+        response = test_client.get("/data")
+        assert response.json()["results_number"] == 2
+        assert cache.hits == 1
+    finally:
+        del app.dependency_overrides[get_response_cache]
@@ -0,0 +1,79 @@
+from prometheus_client import REGISTRY
+
+from chatbot_api.metrics import timed_query
+from chatbot_api.models import CustomerInputs
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_serve_metrics(db, test_client):
+    requests_before = sample(
+        "chatbot_api_requests_total",
+        method="POST",
+        route="/consents/{dialogue_id}",
+        status="404",
+    )
+    not_found_before = sample("chatbot_api_consents_total", outcome="not_found")
+    ingested_before = sample(
+        "chatbot_api_ingested_inputs_total",
+        destination="database",
+    )
+    queries_before = sample(
+        "chatbot_api_db_query_duration_seconds_count",
+        function="create_user_inputs",
+    )
+
+    test_client.post("/consents/999", json={"consent": True})
+    test_client.post(
+        "/data/batch",
+        json={
+            "inputs": [
+                {"customer_id": 1, "dialogue_id": 2, "language": "EN", "text": "foo"},
+                {"customer_id": 1, "dialogue_id": 2, "language": "XX", "text": "bar"},
+            ],
+        },
+    )
+
+    response = test_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "chatbot_api_request_duration_seconds_bucket" in response.text
+    assert sample(
+        "chatbot_api_requests_total",
+        method="POST",
+        route="/consents/{dialogue_id}",
+        status="404",
+    ) == requests_before + 1
+    assert sample(
+        "chatbot_api_consents_total",
+        outcome="not_found",
+    ) == not_found_before + 1
+    assert sample(
+        "chatbot_api_ingested_inputs_total",
+        destination="database",
+    ) == ingested_before + 1
+    assert sample(
+        "chatbot_api_db_query_duration_seconds_count",
+        function="create_user_inputs",
+    ) == queries_before + 1
+
+    db.query(CustomerInputs).delete()
+
+
+def test_timed_query_generator():
+    @timed_query
+    def numbers_for_test():
+        yield from range(3)
+
+    assert sample(
+        "chatbot_api_db_query_duration_seconds_count",
+        function="numbers_for_test",
+    ) == 0
+    assert list(numbers_for_test()) == [0, 1, 2]
+    assert sample(
+        "chatbot_api_db_query_duration_seconds_count",
+        function="numbers_for_test",
+    ) == 1
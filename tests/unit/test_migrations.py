@@ -0,0 +1,57 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect
+
+from chatbot_api.database import upgrade_schema
+from chatbot_api.models import CustomerInputs
+
+ROOT = Path(__file__).parents[2]
+ALEMBIC_INI = ROOT / "alembic.ini"
+
+
+def test_migrations_match_models(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'migrations.db'}"
+    alembic_config = Config(str(ALEMBIC_INI))
+    alembic_config.set_main_option("sqlalchemy.url", database_url)
+
+    command.upgrade(alembic_config, "head")
+
+    inspector = inspect(create_engine(database_url))
+    migrated_indexes = {
+        index["name"] for index in inspector.get_indexes("user_inputs")
+    }
+    model_indexes = {index.name for index in CustomerInputs.__table__.indexes}
+
+    assert migrated_indexes == model_indexes
+
+    command.downgrade(alembic_config, "base")
+
+    assert not inspect(create_engine(database_url)).has_table("user_inputs")
+
+
+def test_upgrade_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+
+    assert upgrade_schema(engine) is None
+    assert inspect(engine).has_table("user_inputs")
+    # Already up to date: nothing left to migrate.
+    head = upgrade_schema(engine)
+    assert head is not None
+    assert upgrade_schema(engine) == head
+
+
+def test_import_does_not_touch_the_database():
+    # Run in a fresh interpreter, where nothing has been imported yet.
+    code = (
+        "import sys\n"
+        "import chatbot_api.main\n"
+        "from chatbot_api import database\n"
+        "assert database._engine is None\n"
+        "assert 'alembic' not in sys.modules\n"
+        "assert 'sqlalchemy_utils' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=ROOT)
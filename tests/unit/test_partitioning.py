@@ -0,0 +1,40 @@
+from datetime import date
+
+from chatbot_api.partitioning import (
+    add_months,
+    create_partition_ddl,
+    dedup_index_ddl,
+    partition_month,
+    partition_name,
+)
+
+
+def test_add_months():
+    assert add_months(date(2026, 10, 1), 1) == date(2026, 11, 1)
+    assert add_months(date(2026, 12, 1), 1) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert add_months(date(2026, 10, 1), 15) == date(2028, 1, 1)
+
+
+def test_partition_name():
+    month = date(2026, 3, 1)
+
+    assert partition_name(month) == "user_inputs_p2026_03"
+    assert partition_month(partition_name(month)) == month
+    assert partition_month("user_inputs_default") is None
+
+
+def test_create_partition_ddl():
+    assert create_partition_ddl(date(2026, 12, 1)) == (
+        "CREATE TABLE IF NOT EXISTS user_inputs_p2026_12 "
+        "PARTITION OF user_inputs "
+        "FOR VALUES FROM ('2026-12-01 00:00:00+00') "
+        "TO ('2027-01-01 00:00:00+00')"
+    )
+
+
+def test_dedup_index_ddl():
+    assert dedup_index_ddl("user_inputs_p2026_12") == (
+        "CREATE UNIQUE INDEX IF NOT EXISTS user_inputs_p2026_12_dedup_key "
+        "ON user_inputs_p2026_12 (dedup_key) WHERE dedup_key IS NOT NULL"
+    )
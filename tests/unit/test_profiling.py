@@ -0,0 +1,106 @@
+import json
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+from chatbot_api.main import app
+from chatbot_api.profiling import (
+    QueryProfiler,
+    QueryProfilerMiddleware,
+    parameters_shape,
+)
+
+
+@pytest.fixture(scope="function")
+def profiled_client(test_client):
+    profiler = QueryProfiler(slow_query_ms=0)
+    profiler.install()
+    try:
+        yield TestClient(QueryProfilerMiddleware(app))
+    finally:
+        profiler.remove()
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+            },
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "bar",
+                "consent": True,
+            },
+        ],
+    ],
+)
+@pytest.mark.parametrize(
+    "method, path, body, expected_queries",
+    [
+        ("post", "/data/456/543", {"text": "foo", "language": "EN"}, 1),
+        (
+            "post",
+            "/data/batch",
+            {
+                "inputs": [
+                    {"customer_id": 456, "dialogue_id": 543, "text": "foo", "language": "EN"},
+                    {"customer_id": 456, "dialogue_id": 543, "text": "bar", "language": "FR"},
+                ],
+            },
+            1,
+        ),
+        # The stats upsert, the histogram one when it counted inputs, the
+        # consent statement and, when inputs changed, the change feed entry.
+        ("post", "/consents/321", {"consent": True}, 4),
+        ("post", "/consents/321", {"consent": False}, 3),
+        ("post", "/consents/322", {"consent": False}, 4),
+        ("post", "/consents/999", {"consent": True}, 2),
+        ("get", "/data", None, 1),
+        ("get", "/data?customer_id=124&language=FR&limit=1", None, 1),
+    ],
+)
+def test_query_counts(
+        db,
+        profiled_client,
+        test_records,
+        method,
+        path,
+        body,
+        expected_queries,
+):
+    response = getattr(profiled_client, method)(path, json=body)
+
+    assert response.status_code < 500
+    assert int(response.headers["X-DB-Queries"]) == expected_queries
+    assert float(response.headers["X-DB-Time-ms"]) > 0
+
+
+def test_slow_query_log(db, profiled_client, caplog):
+    with caplog.at_level(logging.WARNING, logger="chatbot_api.profiling"):
+        profiled_client.get("/data")
+
+    slow_queries = [json.loads(record.getMessage()) for record in caplog.records]
+    assert len(slow_queries) == 1
+    assert slow_queries[0]["event"] == "slow_query"
+    assert slow_queries[0]["statement"].startswith("SELECT user_inputs.id")
+    assert slow_queries[0]["executemany"] is False
+
+
+def test_parameters_shape():
+    assert parameters_shape({"text": "foo", "customer_id": 1}) == {
+        "text": "str",
+        "customer_id": "int",
+    }
+    assert parameters_shape(("foo", 1)) == ["str", "int"]
+    assert parameters_shape([("foo", 1), ("bar", 2)]) == {
+        "rows": 2,
+        "row": ["str", "int"],
+    }
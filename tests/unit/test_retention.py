@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from chatbot_api.models import CustomerInputs
+from chatbot_api.retention import purge_pending_inputs
+
+NOW = datetime.utcnow()
+OLD = NOW - timedelta(days=10)
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [
+            # Stale pending dialogue.
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "foo",
+                "created_at": OLD,
+            },
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "bar",
+                "created_at": OLD,
+            },
+            {
+                "customer_id": 123,
+                "dialogue_id": 321,
+                "language": "EN",
+                "text": "baz",
+                "created_at": OLD,
+            },
+            # Consented dialogue.
+            {
+                "customer_id": 124,
+                "dialogue_id": 322,
+                "language": "FR",
+                "text": "qux",
+                "consent": True,
+                "created_at": OLD,
+            },
+            # Pending dialogue still receiving inputs.
+            {
+                "customer_id": 125,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "quux",
+                "created_at": OLD,
+            },
+            {
+                "customer_id": 125,
+                "dialogue_id": 334,
+                "language": "IT",
+                "text": "corge",
+                "created_at": NOW,
+            },
+        ],
+    ],
+)
+def test_purge_pending_inputs(db, test_records):
+    chunks = purge_pending_inputs(
+        lambda: db,
+        ttl_seconds=24 * 60 * 60,
+        chunk_size=2,
+    )
+
+    assert [chunk["rows"] for chunk in chunks] == [2, 1]
+    assert all(chunk["duration_ms"] >= 0 for chunk in chunks)
+
+    records = db.query(CustomerInputs).order_by(CustomerInputs.id).all()
+    assert [record.text for record in records] == ["qux", "quux", "corge"]
@@ -0,0 +1,47 @@
+import pytest
+
+from chatbot_api.serve import (
+    available_cpus,
+    check_staging_backend,
+    gunicorn_options,
+    worker_pool_options,
+)
+
+
+def test_available_cpus():
+    assert available_cpus() >= 1
+
+
+def test_worker_pool_options():
+    assert worker_pool_options(80, 4, pool_size=5) == (5, 15)
+    assert worker_pool_options(10, 4, pool_size=5) == (2, 0)
+    assert worker_pool_options(4, 4, pool_size=5) == (1, 0)
+    assert worker_pool_options(80, 4, pool_size=5, reserved=1) == (5, 14)
+
+    with pytest.raises(ValueError):
+        worker_pool_options(3, 4, pool_size=5)
+
+
+def test_check_staging_backend():
+    check_staging_backend(None, 4)
+    check_staging_backend("redis", 4)
+    check_staging_backend("memory", 1)
+
+    with pytest.raises(ValueError):
+        check_staging_backend("memory", 4)
+
+
+def test_gunicorn_options():
+    options = gunicorn_options(
+        workers=4,
+        host="0.0.0.0",
+        port=80,
+        max_requests=10000,
+        max_requests_jitter=1000,
+        graceful_timeout=30,
+    )
+
+    assert options["bind"] == "0.0.0.0:80"
+    assert options["workers"] == 4
+    assert options["worker_class"] == "uvicorn.workers.UvicornWorker"
+    assert options["preload_app"] is False
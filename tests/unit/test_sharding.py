@@ -0,0 +1,189 @@
+import pytest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from chatbot_api import sharding
+from chatbot_api.database import Base
+from chatbot_api.main import sharded_router
+from chatbot_api.models import CustomerInputs
+from chatbot_api.schemas import CompleteCustomerInput
+from chatbot_api.sharding import (
+    ShardedDatabase,
+    global_id,
+    local_after_id,
+    shard_index,
+)
+
+
+@pytest.fixture(scope="function")
+def shards(tmp_path):
+    session_factories = []
+    for shard in range(3):
+        engine = create_engine(
+            f"sqlite:///{tmp_path / f'shard_{shard}.db'}",
+            connect_args={"check_same_thread": False},
+        )
+        Base.metadata.create_all(bind=engine)
+        session_factories.append(
+            sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        )
+    shards = ShardedDatabase(session_factories)
+    yield shards
+    shards.close()
+
+
+def customer_inputs(customer_ids, dialogue_id=None):
+    return [
+        CompleteCustomerInput(
+            customer_id=customer_id,
+            dialogue_id=customer_id * 10 if dialogue_id is None else dialogue_id,
+            text=f"text {customer_id}",
+            language="EN",
+        )
+        for customer_id in customer_ids
+    ]
+
+
+def shard_counts(shards):
+    return shards.scatter(
+        lambda db, shard: db.execute(select(func.count(CustomerInputs.id))).scalar()
+    )
+
+
+def test_shard_index():
+    assignments = [shard_index(customer_id, 4) for customer_id in range(4000)]
+
+    assert assignments == [shard_index(customer_id, 4) for customer_id in range(4000)]
+    for shard in range(4):
+        assert 800 < assignments.count(shard) < 1200
+    # A fifth shard only takes customers from the other ones.
+    for customer_id, shard in enumerate(assignments):
+        assert shard_index(customer_id, 5) in (shard, 4)
+
+
+def test_local_after_id():
+    for shard in range(3):
+        for local_id in range(1, 5):
+            for after_id in range(1, 5 * sharding.SHARD_ID_STRIDE):
+                assert (
+                    (local_id < local_after_id(after_id, shard))
+                    == (global_id(local_id, shard) < after_id)
+                )
+
+
+def test_create_user_inputs(shards):
+    customer_ids = list(range(1, 31))
+    assert sharding.create_user_inputs(shards, customer_inputs(customer_ids)) == 30
+    sharding.create_user_input(shards, customer_inputs([31])[0])
+
+    counts = shard_counts(shards)
+    assert sum(counts) == 31
+    for shard in range(3):
+        assert counts[shard] == sum(
+            1 for customer_id in range(1, 32) if shards.shard_of(customer_id) == shard
+        )
+
+
+def test_read_customer_input_rows(shards):
+    sharding.create_user_inputs(shards, customer_inputs(range(1, 31)), consent=True)
+
+    rows = sharding.read_customer_input_rows(shards)
+    ids = [row.id for row in rows]
+    assert len(rows) == 30
+    assert ids == sorted(set(ids), reverse=True)
+    assert {row.customer_id for row in rows} == set(range(1, 31))
+
+    # Pages of the merged rows hold each row exactly once.
+    paginated = []
+    after_id = None
+    while True:
+        page = sharding.read_customer_input_rows(shards, limit=7, after_id=after_id)
+        if not page:
+            break
+        paginated += page
+        after_id = page[-1].id
+    assert paginated == rows
+
+    rows = sharding.read_customer_input_rows(shards, customer_id=12)
+    assert [(row.customer_id, row.text) for row in rows] == [(12, "text 12")]
+    assert rows[0].id % sharding.SHARD_ID_STRIDE == shards.shard_of(12)
+
+
+def test_appended_shard(shards):
+    # Customers written over the first two shards, some of which the third
+    # one takes over.
+    two_shards = ShardedDatabase(shards.session_factories[:2])
+    sharding.create_user_inputs(two_shards, customer_inputs(range(1, 31)), consent=True)
+    moved = [
+        customer_id
+        for customer_id in range(1, 31)
+        if shards.shard_of(customer_id) != two_shards.shard_of(customer_id)
+    ]
+    assert moved
+    two_shards.close()
+
+    sharding.create_user_inputs(
+        shards,
+        customer_inputs([moved[0]], dialogue_id=999),
+        consent=True,
+    )
+    rows = sharding.read_customer_input_rows(shards, customer_id=moved[0])
+    assert {row.dialogue_id for row in rows} == {999, moved[0] * 10}
+    assert len(sharding.read_customer_input_rows(shards)) == 31
+
+
+def test_consent_by_dialogue_id(shards):
+    # Customers of a dialogue spread over several shards.
+    customer_ids = [1, 2, 3, 4, 5, 6]
+    assert len({shards.shard_of(customer_id) for customer_id in customer_ids}) > 1
+    sharding.create_user_inputs(shards, customer_inputs(customer_ids, dialogue_id=7))
+    sharding.create_user_inputs(shards, customer_inputs([8], dialogue_id=8))
+
+    assert sharding.grant_consent_by_dialogue_id(shards, 7) == 6
+    assert len(sharding.read_customer_input_rows(shards)) == 6
+
+    assert sharding.delete_user_input_by_dialogue_id(shards, 7) == 6
+    assert sharding.read_customer_input_rows(shards) == []
+    assert sum(shard_counts(shards)) == 1
+
+    assert sharding.grant_consent_by_dialogue_id(shards, 999) == 0
+
+
+def test_sharded_routes(shards):
+    app = FastAPI()
+    app.include_router(sharded_router)
+    app.dependency_overrides[sharding.get_shards] = lambda: shards
+    client = TestClient(app)
+
+    batch = {
+        "inputs": [
+            {"customer_id": customer_id, "dialogue_id": 7, "text": "foo", "language": "EN"}
+            for customer_id in range(1, 7)
+        ]
+    }
+    assert client.post("/data/batch", json=batch).json()["inserted"] == 6
+    for _ in range(2):
+        response = client.post(
+            "/data/8/8",
+            json={"text": "bar", "language": "EN"},
+            headers={"Idempotency-Key": "9e2a"},
+        )
+        assert response.status_code == 200
+    assert sum(shard_counts(shards)) == 7
+
+    assert client.post("/consents/7", json={"consent": True}).status_code == 201
+    response = client.get("/data", params={"limit": 4})
+    assert response.json()["results_number"] == 4
+    response = client.get(
+        "/data",
+        params={"limit": 4, "after_id": response.headers["X-Next-After-Id"]},
+    )
+    assert response.json()["results_number"] == 2
+    assert "X-Next-After-Id" not in response.headers
+
+    assert client.post("/consents/8", json={"consent": False}).status_code == 200
+    assert client.post("/consents/8", json={"consent": False}).status_code == 404
+    assert sum(shard_counts(shards)) == 6
@@ -0,0 +1,78 @@
+from chatbot_api.schemas import CompleteCustomerInput, SupportedLanguages
+from chatbot_api.staging import InMemoryStagingStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_input(dialogue_id: int, text: str = "foo") -> CompleteCustomerInput:
+    return CompleteCustomerInput(
+        customer_id=123,
+        dialogue_id=dialogue_id,
+        text=text,
+        language=SupportedLanguages.english,
+    )
+
+
+def test_in_memory_staging_pop_and_discard():
+    store = InMemoryStagingStore(ttl_seconds=60, max_bytes=10 ** 6)
+    store.add(make_input(321, "foo"))
+    store.add(make_input(321, "bar"))
+    store.add(make_input(334, "baz"))
+
+    assert [input_.text for input_ in store.pop(321)] == ["foo", "bar"]
+    assert store.pop(321) == []
+    assert store.discard(334) == 1
+    assert store.discard(334) == 0
+    assert len(store) == 0
+    assert store.size == 0
+
+
+def test_in_memory_staging_peek_and_remove():
+    store = InMemoryStagingStore(ttl_seconds=60, max_bytes=10 ** 6)
+    store.add(make_input(321, "foo"))
+    store.add(make_input(321, "bar"))
+
+    peeked = store.peek(321)
+    assert [input_.text for input_ in peeked] == ["foo", "bar"]
+    store.add(make_input(321, "baz"))
+
+    # Only the peeked inputs are removed.
+    store.remove(321, len(peeked))
+    assert [input_.text for input_ in store.peek(321)] == ["baz"]
+    store.remove(321, 1)
+    assert len(store) == 0
+    assert store.size == 0
+    store.remove(321, 1)
+
+
+def test_in_memory_staging_ttl():
+    clock = FakeClock()
+    store = InMemoryStagingStore(ttl_seconds=60, max_bytes=10 ** 6, clock=clock)
+    store.add(make_input(321))
+    clock.now = 30
+    store.add(make_input(334))
+    clock.now = 61
+
+    assert store.pop(321) == []
+    assert len(store.pop(334)) == 1
+
+
+def test_in_memory_staging_eviction():
+    store = InMemoryStagingStore(ttl_seconds=60, max_bytes=10 ** 6)
+    store.add(make_input(321))
+    input_size = store.size
+    store.max_bytes = 2 * input_size
+
+    store.add(make_input(334))
+    store.add(make_input(321))
+    store.add(make_input(336))
+
+    # 334 is the least recently updated dialogue.
+    assert store.pop(334) == []
+    assert store.size <= store.max_bytes